@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Benchmark for paginated listing.
+
+Lists the ports of a fake Neutron API holding 100k ports, once the old
+way (everything in one response, as list_ports() does by default) and
+once through utils.paginate_neutron. Each mode runs in its own process
+so peak RSS can be compared.
+
+    python benchmarks/bench_pagination.py [--ports N]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from overcast import utils
+
+
+class FakeNeutron(object):
+    """
+    Serves list_ports the way neutronclient does: with retrieve_all
+    (the default) every page is fetched and merged before returning,
+    otherwise a generator of pages is returned. Each page goes through
+    JSON encoding and decoding, like a real response would.
+    """
+    def __init__(self, count):
+        self.count = count
+
+    def _port(self, idx):
+        return {'id': '%08x-0000-0000-0000-000000000000' % idx,
+                'name': '',
+                'network_id': 'a6d9a8e8-8d8e-4b3c-9d4e-0c4b1b7c7d3f',
+                'tenant_id': '0d4f7a1e6c3b4d8f9a2b5c6d7e8f9a0b',
+                'device_id': '%08x-1111-1111-1111-111111111111' % idx,
+                'device_owner': 'compute:nova',
+                'mac_address': 'fa:16:3e:%02x:%02x:%02x' % ((idx >> 16) & 0xff,
+                                                            (idx >> 8) & 0xff,
+                                                            idx & 0xff),
+                'admin_state_up': True,
+                'status': 'ACTIVE',
+                'fixed_ips': [{'subnet_id': 'c2f4e6a8-1b3d-4f5a-8c7e-9d0b1a2c3e4f',
+                               'ip_address': '10.%d.%d.%d' % ((idx >> 16) & 0xff,
+                                                              (idx >> 8) & 0xff,
+                                                              idx & 0xff)}],
+                'security_groups': ['5e7f9a1b-3c5d-4e6f-8a0b-1c2d3e4f5a6b'],
+                'binding:vnic_type': 'normal'}
+
+    def _page(self, start, limit):
+        ports = [self._port(idx) for idx in xrange(start, min(start + limit, self.count))]
+        return json.loads(json.dumps({'ports': ports}))
+
+    def _pages(self, limit):
+        for start in xrange(0, self.count, limit):
+            yield self._page(start, limit)
+
+    def list_ports(self, retrieve_all=True, limit=None, **filters):
+        limit = limit or self.count
+        if retrieve_all:
+            ports = []
+            for page in self._pages(limit):
+                ports.extend(page['ports'])
+            return {'ports': ports}
+        return self._pages(limit)
+
+
+def run(mode, count):
+    neutron = FakeNeutron(count)
+    start = time.time()
+    if mode == 'full':
+        ports = iter(neutron.list_ports()['ports'])
+    else:
+        ports = utils.paginate_neutron(neutron.list_ports, 'ports')
+
+    first = None
+    seen = 0
+    for port in ports:
+        if first is None:
+            first = time.time() - start
+        seen += 1
+    total = time.time() - start
+    assert seen == count
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print json.dumps({'first': first, 'total': total, 'maxrss_kb': maxrss})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--ports', type=int, default=100000)
+    parser.add_argument('--mode', choices=['full', 'paginated'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.ports)
+        return
+
+    print '%-10s %14s %10s %12s' % ('mode', 'first result', 'total', 'peak RSS')
+    for mode in ('full', 'paginated'):
+        out = subprocess.check_output([sys.executable, __file__,
+                                       '--mode', mode, '--ports', str(args.ports)])
+        result = json.loads(out)
+        print '%-10s %13.3fs %9.2fs %9d KB' % (mode, result['first'], result['total'],
+                                               result['maxrss_kb'])
+
+if __name__ == '__main__':
+    main()
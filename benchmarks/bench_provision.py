@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Benchmark for provisioning large stacks.
+
+Generates stack files with 10, 100 and 1000 nodes (by default), with
+varying numbers of NICs, floating IPs and security group rules, and runs
+provision_step, detect_existing_resources and a cleanup on each against
+the fake cloud from overcast.tests.fakecloud. Every API call takes a
+little while and volumes and servers take a while to become ready.
+
+For each phase it reports wall time, CPU time and API calls per
+resource, plus the peak RSS of the process. Each stack size runs in its
+own process. With --output, the results are also written to a file as
+JSON, so runs of different versions can be compared.
+
+    python benchmarks/bench_provision.py [--sizes 10,100,1000] [--output FILE]
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from overcast.cleanup import Cleaner
+from overcast.runner import DeploymentRunner
+from overcast.tests.fakecloud import FakeCloud
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Nodes per `number:` group
+GROUP_SIZE = 10
+
+# Rules in each of the stack's security groups
+RULE_COUNTS = (5, 20, 50)
+
+PHASES = ('provision', 'detect', 'cleanup')
+
+def write_stack(path, count):
+    """
+    A stack of `count` nodes in groups of GROUP_SIZE. Groups have one to
+    three NICs, and every third group has a floating IP.
+    """
+    with open(path, 'w') as fp:
+        fp.write('networks:\n')
+        for net in ('internal', 'storage'):
+            fp.write('  %s:\n    cidr: 10.%d.0.0/16\n' % (net, len(net)))
+        fp.write('securitygroups:\n')
+        for idx, rules in enumerate(RULE_COUNTS):
+            fp.write('  sg%d:\n' % (idx,))
+            for port in range(rules):
+                fp.write('    - from_port: %d\n      to_port: %d\n'
+                         '      protocol: tcp\n      cidr: 0.0.0.0/0\n' % (1000 + port, 1000 + port))
+        fp.write('nodes:\n')
+        for group in range(0, count, GROUP_SIZE):
+            idx = group // GROUP_SIZE
+            fp.write('  group%d-:\n'
+                     '    number: %d\n'
+                     '    flavor: small\n'
+                     '    image: trusty\n'
+                     '    disk: 10\n'
+                     '    networks:\n'
+                     '      - network: default\n'
+                     '        securitygroups: [sg%d]\n' % (idx, min(GROUP_SIZE, count - group),
+                                                        idx % len(RULE_COUNTS)))
+            if idx % 3 == 0:
+                fp.write('        assign_floating_ip: true\n')
+            for net in ('internal', 'storage')[:idx % 3]:
+                fp.write('      - network: %s\n' % (net,))
+
+def make_runner(cloud, default_network, parallel, record):
+    dr = DeploymentRunner(suffix='bench',
+                          mappings={'networks': {'default': default_network},
+                                    'routers': {'*': cloud.router}},
+                          key='ssh-rsa AAAA bench',
+                          parallel=parallel,
+                          polling={'initial': 0.05, 'maximum': 0.5})
+    cloud.install(dr)
+    dr.record_resource = lambda type_, id, name=None: record.append((type_, id))
+    return dr
+
+def measure(cloud, func):
+    calls = sum(cloud.calls.values())
+    times = os.times()
+    start = time.time()
+    func()
+    wall = time.time() - start
+    cpu = sum(os.times()[:2]) - sum(times[:2])
+    return {'wall': wall, 'cpu': cpu, 'calls': sum(cloud.calls.values()) - calls}
+
+def run(size, args):
+    cloud = FakeCloud(latency={'*': ('lognormal', args.latency, 0.5)},
+                      build_times={'volume': (0.2, 0.5), 'server': (0.5, 1.0)},
+                      delete_time=0.1,
+                      seed=size)
+    default = cloud.neutron.create_network({'network': {'name': 'default'}})['network']
+    cloud.neutron.create_subnet({'subnet': {'network_id': default['id'], 'cidr': '10.0.0.0/8'}})
+    initial_counts = cloud.counts()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        stack = os.path.join(tmpdir, 'stack.yaml')
+        write_stack(stack, size)
+
+        recorded = []
+        dr = make_runner(cloud, default['id'], args.parallel, recorded)
+        results = {'provision': measure(cloud, lambda: dr.provision_step({'stack': stack}))}
+    finally:
+        shutil.rmtree(tmpdir)
+    resources = len(recorded)
+
+    redo = make_runner(cloud, default['id'], args.parallel, [])
+    results['detect'] = measure(cloud, redo.detect_existing_resources)
+    assert len(redo.nodes) == size
+
+    failures = []
+    results['cleanup'] = measure(cloud, lambda: failures.extend(
+        Cleaner(dr, parallel=args.parallel).run(recorded)))
+    assert not failures, failures
+    # Cleanup carries on past errors it can recover from, so check that
+    # it really left nothing behind
+    assert cloud.counts() == initial_counts, (cloud.counts(), initial_counts)
+
+    for phase in PHASES:
+        results[phase]['calls_per_resource'] = results[phase]['calls'] / float(resources)
+    print json.dumps({'nodes': size,
+                      'resources': resources,
+                      'phases': results,
+                      'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+
+def git_revision():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                           stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', default='10,100,1000',
+                        help='Comma separated numbers of nodes')
+    parser.add_argument('--parallel', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='Median latency of an API call, in seconds')
+    parser.add_argument('--output',
+                        help='Also write the results as JSON to this file')
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.size:
+        run(args.size, args)
+        return
+
+    results = []
+    print '%6s %9s %-10s %9s %9s %12s %10s' % ('nodes', 'resources', 'phase', 'wall',
+                                              'cpu', 'calls/res', 'peak RSS')
+    for size in [int(size) for size in args.sizes.split(',')]:
+        out = subprocess.check_output([sys.executable, __file__, '--size', str(size),
+                                       '--parallel', str(args.parallel),
+                                       '--latency', str(args.latency)])
+        result = json.loads(out)
+        results.append(result)
+        for phase in PHASES:
+            stats = result['phases'][phase]
+            print '%6d %9d %-10s %8.2fs %8.2fs %12.2f %7d KB' % (size, result['resources'], phase,
+                                                                  stats['wall'], stats['cpu'],
+                                                                  stats['calls_per_resource'],
+                                                                  result['maxrss_kb'])
+
+    if not args.output:
+        return
+    with open(args.output, 'w') as fp:
+        json.dump({'revision': git_revision(),
+                   'python': sys.version.split()[0],
+                   'parallel': args.parallel,
+                   'latency': args.latency,
+                   'results': results}, fp, indent=2, sort_keys=True)
+    print
+    print 'Results written to %s' % (args.output,)
+
+if __name__ == '__main__':
+    main()
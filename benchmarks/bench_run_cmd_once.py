@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Microbenchmark for run_cmd_once.
+
+Compares the current implementation with the old one, which wrote the
+command to the child's stdin one byte per select() call and busy-waited
+on proc.poll() once stdin was drained.
+
+    python benchmarks/bench_run_cmd_once.py
+"""
+import os
+import select
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from overcast import exceptions
+from overcast.runner import run_cmd_once
+
+
+def legacy_run_cmd_once(shell_cmd, real_cmd, environment, deadline):
+    proc = subprocess.Popen(shell_cmd,
+                            env=environment,
+                            shell=True,
+                            stdin=subprocess.PIPE)
+    stdin = real_cmd + '\n'
+    while True:
+        if stdin:
+            _, rfds, xfds = select.select([], [proc.stdin], [proc.stdin], 1)
+            if rfds:
+                proc.stdin.write(stdin[0])
+                stdin = stdin[1:]
+                if not stdin:
+                    proc.stdin.close()
+
+        if proc.poll() is not None:
+            if proc.returncode == 0:
+                return True
+            else:
+                raise exceptions.CommandFailedException(stdin)
+
+        if deadline and time.time() > deadline:
+            if proc.poll() is None:
+                proc.kill()
+            raise exceptions.CommandTimedOutException(stdin)
+
+
+def measure(func, cmd, runs):
+    """Return (wall seconds, our CPU seconds) per call of func."""
+    cpu_before = sum(os.times()[:2])
+    wall_before = time.time()
+    for _ in range(runs):
+        func('bash', cmd, {}, None)
+    wall = time.time() - wall_before
+    cpu = sum(os.times()[:2]) - cpu_before
+    return wall / runs, cpu / runs
+
+
+SCENARIOS = [('true', 'true', 20),
+             ('1KB command', 'true ' + '#' * 1024, 10),
+             ('sleep 1', 'sleep 1', 3)]
+
+
+def main():
+    print '%-12s %-8s %12s %12s' % ('scenario', 'impl', 'wall/step', 'cpu/step')
+    for name, cmd, runs in SCENARIOS:
+        for impl, func in (('before', legacy_run_cmd_once),
+                           ('after', run_cmd_once)):
+            wall, cpu = measure(func, cmd, runs)
+            print '%-12s %-8s %11.4fs %11.4fs' % (name, impl, wall, cpu)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Per-step latency of remote shell steps with and without ssh connection
+multiplexing.
+
+Starts a throwaway sshd on localhost as the current user, with its own
+host and client keys, and runs a number of trivial remote steps against
+it in both modes.
+
+    python benchmarks/bench_ssh_mux.py [--sshd /usr/sbin/sshd] [--steps 20]
+"""
+import argparse
+import getpass
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from overcast.output import OutputBuffer
+from overcast.runner import DeploymentRunner, run_cmd_once
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return
+        except socket.error:
+            time.sleep(0.1)
+    raise Exception('sshd did not start listening on port %d' % (port,))
+
+
+def keygen(path):
+    subprocess.check_call(['ssh-keygen', '-q', '-t', 'ed25519', '-N', '', '-f', path])
+
+
+def start_sshd(sshd, workdir, port):
+    host_key = os.path.join(workdir, 'host_key')
+    client_key = os.path.join(workdir, 'client_key')
+    keygen(host_key)
+    keygen(client_key)
+    shutil.copy(client_key + '.pub', os.path.join(workdir, 'authorized_keys'))
+
+    proc = subprocess.Popen([sshd, '-D', '-e', '-f', '/dev/null',
+                             '-o', 'ListenAddress=127.0.0.1',
+                             '-o', 'Port=%d' % (port,),
+                             '-o', 'HostKey=%s' % (host_key,),
+                             '-o', 'AuthorizedKeysFile=%s' % (os.path.join(workdir, 'authorized_keys'),),
+                             '-o', 'PidFile=none',
+                             '-o', 'UsePAM=no',
+                             '-o', 'StrictModes=no',
+                             '-o', 'PasswordAuthentication=no'])
+    wait_for_port(port)
+    return proc, client_key
+
+
+def run_steps(multiplexing, port, client_key, steps):
+    runner = DeploymentRunner(ssh_multiplexing=multiplexing)
+    host = '%s@127.0.0.1' % (getpass.getuser(),)
+    ssh_args = ['-p', str(port), '-i', client_key, '-o', 'BatchMode=yes',
+                '-o', 'StrictHostKeyChecking=no', '-o', 'UserKnownHostsFile=/dev/null',
+                '-o', 'LogLevel=ERROR']
+
+    timings = []
+    try:
+        for _ in range(steps):
+            # Like shell_step_cmd(), once per step. The first step pays
+            # for opening the shared connection.
+            start = time.time()
+            cmd = 'ssh %s %s%s bash' % (' '.join(ssh_args), runner.ssh_options(host, ssh_args), host)
+            run_cmd_once(cmd, 'true', os.environ.copy(), None, output=OutputBuffer())
+            timings.append(time.time() - start)
+    finally:
+        if runner.ssh_control_dir:
+            with open(os.devnull, 'w') as devnull:
+                subprocess.call(['ssh', '-p', str(port), '-o',
+                                 'ControlPath=%s' % (runner._ssh_control_path(),),
+                                 '-O', 'exit', host],
+                                stdout=devnull, stderr=devnull)
+        runner.close_ssh_connections()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sshd', default='/usr/sbin/sshd')
+    parser.add_argument('--steps', type=int, default=20)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.sshd):
+        sys.exit('%s not found. Use --sshd to point at an sshd binary.' % (args.sshd,))
+
+    workdir = tempfile.mkdtemp()
+    port = free_port()
+    sshd, client_key = start_sshd(args.sshd, workdir, port)
+    try:
+        print '%-14s %10s %10s %10s' % ('mode', 'first', 'mean rest', 'total')
+        for name, multiplexing in (('fresh ssh', False), ('multiplexed', True)):
+            timings = run_steps(multiplexing, port, client_key, args.steps)
+            rest = timings[1:] or timings
+            print '%-14s %9.4fs %9.4fs %9.4fs' % (name, timings[0],
+                                                  sum(rest) / len(rest),
+                                                  sum(timings))
+    finally:
+        sshd.terminate()
+        sshd.wait()
+        shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
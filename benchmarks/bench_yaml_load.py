@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Benchmark for loading stack files.
+
+Generates a stack file with a few thousand nodes (several MB), then
+times parsing it with the old pure-Python yaml.load, with each of the
+safe loaders, and through load_yaml's parsed-config cache. Finally it
+times `overcast list-refs` on it end to end, in a fresh process, with a
+cold and a warm cache.
+
+    python benchmarks/bench_yaml_load.py [--nodes N]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import yaml
+
+from overcast.runner import load_yaml
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def write_stack(path, count):
+    with open(path, 'w') as fp:
+        fp.write('networks:\n  default:\n    cidr: 10.0.0.0/16\n')
+        fp.write('securitygroups:\n  default:\n')
+        for port in range(20):
+            fp.write('    - from_port: %d\n      to_port: %d\n'
+                     '      protocol: tcp\n      cidr: 0.0.0.0/0\n' % (port, port))
+        fp.write('nodes:\n')
+        for idx in range(count):
+            fp.write('  node%d:\n'
+                     '    flavor: bootstrap\n'
+                     '    image: trusty\n'
+                     '    disk: 10\n'
+                     '    networks:\n'
+                     '      - network: default\n'
+                     '        securitygroups:\n'
+                     '          - default\n'
+                     '        assign_floating_ip: true\n'
+                     '    users:\n'
+                     '      - name: user%d\n'
+                     '        ssh_authorized_keys:\n'
+                     '          - "ssh-rsa %s user@host"\n' % (idx, idx, 'A' * 300))
+
+def best_of(func, runs=3):
+    best = None
+    for _ in range(runs):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def list_refs_time(stack, env):
+    cmd = [sys.executable, '-c',
+           'import sys; from overcast.runner import main; main(sys.argv[1:])',
+           'list-refs', stack]
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        subprocess.check_call(cmd, env=env, cwd=ROOT, stdout=devnull)
+        return time.time() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=5000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        stack = os.path.join(tmpdir, 'stack.yaml')
+        cache_dir = os.path.join(tmpdir, 'cache')
+        write_stack(stack, args.nodes)
+        with open(stack, 'r') as fp:
+            data = fp.read()
+        print 'Stack file: %d nodes, %.1f MB' % (args.nodes, len(data) / 1024.0 / 1024)
+        print
+
+        timings = [('yaml.load (before)', lambda: yaml.load(data, Loader=yaml.Loader)),
+                   ('SafeLoader', lambda: yaml.load(data, Loader=yaml.SafeLoader))]
+        if hasattr(yaml, 'CSafeLoader'):
+            timings.append(('CSafeLoader', lambda: yaml.load(data, Loader=yaml.CSafeLoader)))
+        load_yaml(stack, cache_dir=cache_dir)
+        timings.append(('load_yaml, cached', lambda: load_yaml(stack, cache_dir=cache_dir)))
+
+        for name, func in timings:
+            print '%-20s %8.3fs' % (name, best_of(func))
+        print
+
+        env = dict(os.environ)
+        env.pop('OVERCAST_YAML_CACHE', None)
+        print '%-20s %8.3fs' % ('list-refs', list_refs_time(stack, env))
+        env['OVERCAST_YAML_CACHE'] = os.path.join(tmpdir, 'cli-cache')
+        print '%-20s %8.3fs' % ('list-refs, cold', list_refs_time(stack, env))
+        print '%-20s %8.3fs' % ('list-refs, warm', list_refs_time(stack, env))
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import itertools
+import logging
+import time
+
+from cinderclient.exceptions import BadRequest as CinderBadRequest
+from cinderclient.exceptions import NotFound as CinderNotFound
+from neutronclient.common.exceptions import Conflict as NeutronConflict
+from neutronclient.common.exceptions import NotFound as NeutronNotFound
+from novaclient.exceptions import Conflict as NovaConflict
+from novaclient.exceptions import NotFound as NovaNotFound
+
+from overcast import utils
+
+LOG = logging.getLogger(__name__)
+
+# Resources are deleted one tier at a time. Nothing in a tier is needed
+# by anything in the same tier or a later one, so each tier can be
+# deleted concurrently. Types not listed here go last.
+TIERS = [('server', 'floatingip'),
+         ('port', 'volume'),
+         ('secgroup_rule',),
+         ('secgroup', 'subnet'),
+         ('network', 'keypair', 'router', 'golden_volume')]
+
+# Left alone unless asked for: golden volumes outlive a deployment, so
+# later deploys with the same suffix can clone from them.
+KEPT_TYPES = ('golden_volume',)
+
+# The resource is still in use by something that is on its way out
+# (a port on a subnet, a volume attached to a dying server, ...)
+RETRY_ERRORS = (NeutronConflict, NovaConflict, CinderBadRequest)
+
+# The resource is already gone
+GONE_ERRORS = (NeutronNotFound, NovaNotFound, CinderNotFound)
+
+MAX_BACKOFF = 10
+
+# How long to wait for deleted servers to disappear before moving on
+SERVER_DELETE_TIMEOUT = 300
+
+def tiers(resources):
+    """
+    Split (type, id) pairs, in the order they were recorded, into the
+    lists of resources to delete one after the other. Within a list,
+    the most recently recorded resources come first. Duplicates are
+    dropped.
+    """
+    tier_by_type = {}
+    for idx, types in enumerate(TIERS):
+        for resource_type in types:
+            tier_by_type[resource_type] = idx
+
+    result = [[] for _ in TIERS] + [[]]
+    seen = set()
+    for resource in reversed(resources):
+        if resource in seen:
+            continue
+        seen.add(resource)
+        result[tier_by_type.get(resource[0], len(TIERS))].append(resource)
+    return [tier for tier in result if tier]
+
+class Cleaner(object):
+    """
+    Deletes resources through the delete_<type> methods of a
+    DeploymentRunner, up to `parallel` at a time. Deletions that fail
+    because the resource is still in use are retried with exponential
+    backoff, up to `retries` times. Resources of the types in `keep`
+    are skipped.
+    """
+    def __init__(self, runner, parallel=10, retries=8, keep=KEPT_TYPES):
+        self.runner = runner
+        self.parallel = parallel
+        self.retries = retries
+        self.keep = frozenset(keep)
+        self.record_deletion = lambda *args: None
+
+    def delete(self, resource):
+        """
+        Delete a (type, id) resource. Returns None if it's gone (and
+        passes it to record_deletion), otherwise the exception that
+        kept it from being deleted.
+        """
+        resource_type, uuid = resource
+        delay = 1
+        for attempt in itertools.count():
+            try:
+                getattr(self.runner, 'delete_%s' % (resource_type,))(uuid)
+            except GONE_ERRORS:
+                pass
+            except RETRY_ERRORS, e:
+                if attempt >= self.retries:
+                    return e
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_BACKOFF)
+                continue
+            except Exception, e:
+                return e
+            self.record_deletion(resource_type, uuid)
+            return None
+
+    def server_exists(self, uuid):
+        try:
+            self.runner.get_nova_client().servers.get(uuid)
+        except NovaNotFound:
+            return False
+        return True
+
+    def wait_for_servers(self, server_ids, timeout=SERVER_DELETE_TIMEOUT):
+        """
+        Wait for deleted servers to disappear, so their ports and
+        volumes are released before we try to delete those.
+
+        Each server is looked up by id, so this costs as many requests
+        as there are servers to wait for, however many others the
+        tenant has. If they can't be looked up, we stop waiting and let
+        the retries in delete() deal with whatever is still in use.
+        """
+        deadline = time.time() + timeout
+        delay = 1
+        while server_ids and time.time() < deadline:
+            try:
+                exists = utils.run_in_parallel(self.server_exists, server_ids, self.parallel)
+            except Exception, e:
+                LOG.warning('Could not check whether deleted servers are gone: %s', e)
+                return
+            server_ids = [uuid for uuid, found in zip(server_ids, exists) if found]
+            if server_ids:
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_BACKOFF)
+
+    def run(self, resources):
+        """
+        Delete the given (type, id) resources, in the order they were
+        recorded, except those we keep. Returns a list of
+        (type, id, exception) for those that could not be deleted.
+        """
+        failures = []
+        resources = [resource for resource in resources if resource[0] not in self.keep]
+        for tier in tiers(resources):
+            errors = utils.run_in_parallel(self.delete, tier, self.parallel)
+            deleted_servers = []
+            for resource, error in zip(tier, errors):
+                if error is None:
+                    if resource[0] == 'server':
+                        deleted_servers.append(resource[1])
+                else:
+                    failures.append(resource + (error,))
+            self.wait_for_servers(deleted_servers)
+        return failures
@@ -19,10 +19,25 @@ class OvercastException(Exception):
 class InvalidTimeException(OvercastException):
     pass
 
-class CommandTimedOutException(OvercastException):
+class CommandException(OvercastException):
+    """
+    A shell step command didn't succeed. output holds the tail of
+    what it printed, if it was captured.
+    """
+    def __init__(self, message='', output=None):
+        super(CommandException, self).__init__(message)
+        self.output = output
+
+    def __str__(self):
+        message = super(CommandException, self).__str__()
+        if self.output:
+            message += '\nLast output:\n%s' % (self.output,)
+        return message
+
+class CommandTimedOutException(CommandException):
     pass
 
-class CommandFailedException(OvercastException):
+class CommandFailedException(CommandException):
     pass
 
 class DuplicateResourceException(OvercastException):
@@ -33,3 +48,12 @@ class ProvisionFailedException(OvercastException):
 
 class ProvisionTimedOutException(OvercastException):
     pass
+
+class InvalidStepGraphException(OvercastException):
+    pass
+
+class UnknownResourceException(OvercastException):
+    pass
+
+class InvalidPollingConfigException(OvercastException):
+    pass
@@ -0,0 +1,148 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import collections
+import json
+import os
+import threading
+import time
+
+class Journal(object):
+    """
+    An append-only record of the resources a deployment created and
+    cleanup deleted, one JSON object per line.
+
+    Each entry is handed to the OS as soon as it's recorded, so it
+    survives the process crashing. To survive the machine crashing as
+    well, a background thread fsyncs the file, at most every
+    `sync_interval` seconds, covering all entries written since the
+    last sync. close() syncs whatever is left.
+    """
+    def __init__(self, path, sync_interval=0.1):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.fp = open(path, 'a+')
+        self.cond = threading.Condition()
+        self.unsynced = False
+        self.closed = threading.Event()
+
+        # A crash may have left half a line behind. Don't append to it.
+        self.fp.seek(0, os.SEEK_END)
+        if self.fp.tell() > 0:
+            self.fp.seek(-1, os.SEEK_END)
+            if self.fp.read(1) != '\n':
+                self.fp.seek(0, os.SEEK_END)
+                self.fp.write('\n')
+
+        self.syncer = threading.Thread(target=self._sync_loop)
+        self.syncer.daemon = True
+        self.syncer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def _write(self, entry):
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        with self.cond:
+            self.fp.write(line)
+            self.fp.flush()
+            self.unsynced = True
+            self.cond.notify()
+
+    def _sync_loop(self):
+        while True:
+            with self.cond:
+                while not (self.unsynced or self.closed.is_set()):
+                    self.cond.wait()
+                if not self.unsynced:
+                    return
+                self.unsynced = False
+            os.fsync(self.fp.fileno())
+            # Entries recorded in the meantime get synced together
+            self.closed.wait(self.sync_interval)
+
+    def record(self, resource_type, uuid, name=None, step=None):
+        self._write({'op': 'create',
+                     'type': resource_type,
+                     'id': uuid,
+                     'name': name,
+                     'step': step,
+                     'timestamp': time.time()})
+
+    def record_deletion(self, resource_type, uuid):
+        self._write({'op': 'delete',
+                     'type': resource_type,
+                     'id': uuid,
+                     'timestamp': time.time()})
+
+    def close(self):
+        with self.cond:
+            self.closed.set()
+            self.cond.notify()
+        self.syncer.join()
+        self.fp.close()
+
+def read_journal(path):
+    """
+    Return the entries for the resources in the journal at `path` that
+    haven't been deleted, in the order they were created. The old
+    cleanup log format ("type: id" lines) is read as well.
+    """
+    entries = collections.OrderedDict()
+    with open(path, 'r') as fp:
+        for line in fp:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Cut short by a crash
+                    continue
+            else:
+                resource_type, _, uuid = line.partition(': ')
+                entry = {'op': 'create', 'type': resource_type, 'id': uuid}
+
+            key = (entry['type'], entry['id'])
+            if entry.get('op') == 'delete':
+                entries.pop(key, None)
+            elif key not in entries:
+                entries[key] = entry
+    return entries.values()
+
+def compact_journal(path):
+    """
+    Rewrite the journal at `path` with only the resources that haven't
+    been deleted. The new file replaces the old one atomically. Returns
+    the number of entries kept.
+    """
+    entries = read_journal(path)
+    tmp_path = '%s.tmp' % (path,)
+    with open(tmp_path, 'w') as fp:
+        for entry in entries:
+            fp.write(json.dumps(entry, sort_keys=True) + '\n')
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.rename(tmp_path, path)
+
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return len(entries)
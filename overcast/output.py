@@ -0,0 +1,76 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import collections
+import threading
+
+class OutputBuffer(object):
+    """
+    Collects the output of a command.
+
+    Only the last max_bytes are kept in memory, so a command can print
+    as much as it likes. If spill_path is given, everything is also
+    appended to that file. If echo is given (e.g. sys.stdout), output
+    is passed on to it as it arrives. Output written as stderr is passed
+    on to stderr_echo instead, if given.
+    """
+    def __init__(self, max_bytes=16384, spill_path=None, echo=None, stderr_echo=None):
+        self.max_bytes = max_bytes
+        self.echo = echo
+        self.stderr_echo = stderr_echo
+        self.total_bytes = 0
+        self._chunks = collections.deque()
+        self._size = 0
+        self._lock = threading.Lock()
+        if spill_path:
+            self._spill = open(spill_path, 'a')
+        else:
+            self._spill = None
+
+    def write(self, data, stderr=False):
+        with self._lock:
+            self.total_bytes += len(data)
+            kept = data
+            if len(kept) > self.max_bytes:
+                kept = kept[-self.max_bytes:]
+                self._chunks.clear()
+                self._size = 0
+            self._chunks.append(kept)
+            self._size += len(kept)
+
+            while self._size > self.max_bytes:
+                excess = self._size - self.max_bytes
+                first = self._chunks.popleft()
+                if len(first) > excess:
+                    self._chunks.appendleft(first[excess:])
+                    self._size -= excess
+                else:
+                    self._size -= len(first)
+
+        if self._spill:
+            self._spill.write(data)
+            self._spill.flush()
+        echo = self.stderr_echo if stderr and self.stderr_echo else self.echo
+        if echo:
+            echo.write(data)
+            echo.flush()
+
+    def tail(self):
+        with self._lock:
+            return ''.join(self._chunks)
+
+    def close(self):
+        if self._spill:
+            self._spill.close()
+            self._spill = None
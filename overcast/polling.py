@@ -0,0 +1,163 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import random
+import threading
+
+from overcast import exceptions
+
+class PollingPolicy(object):
+    """
+    Decides how long to wait between polls of resources we're waiting
+    for (volumes becoming available, servers becoming active). It only
+    does the arithmetic; the sleeping is up to the caller.
+
+    Delays start at `initial` seconds and grow by `factor` per poll, up
+    to `maximum`. Each delay is randomly stretched or shrunk by up to
+    `jitter` (a fraction), so concurrent waiters don't poll in lockstep.
+
+    `etas` maps a kind of resource ('volume', 'server') to how long it
+    usually takes to become ready. Waiters hold off until then. ETAs
+    can be given up front and are refined by observe() as resources
+    become ready, except for the kinds in `pinned`, whose ETAs are
+    left as given.
+    """
+    OPTIONS = {'initial': float, 'maximum': float, 'factor': float, 'jitter': float}
+
+    def __init__(self, initial=1.0, maximum=10.0, factor=2.0, jitter=0.1, etas=None,
+                 pinned=()):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.etas = dict(etas or {})
+        self.pinned = frozenset(pinned)
+        self.random = random.Random()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, etas=None, pinned=()):
+        """
+        Build a policy from a dict, like the `polling:` section of a
+        stack file: any of initial, maximum, factor and jitter, plus
+        an optional `eta` dict of kind to seconds.
+        """
+        kwargs = {}
+        for key, value in config.items():
+            if key == 'eta':
+                continue
+            if key not in cls.OPTIONS:
+                raise exceptions.InvalidPollingConfigException('Unknown polling option: %s' % (key,))
+            try:
+                kwargs[key] = cls.OPTIONS[key](value)
+            except (TypeError, ValueError):
+                raise exceptions.InvalidPollingConfigException('Invalid value for polling option %s: %s'
+                                                               % (key, value))
+        try:
+            all_etas = dict((kind, float(eta)) for kind, eta in config.get('eta', {}).items())
+        except (AttributeError, TypeError, ValueError):
+            raise exceptions.InvalidPollingConfigException('Invalid polling ETAs: %s' % (config['eta'],))
+        all_etas.update(etas or {})
+        return cls(etas=all_etas, pinned=pinned, **kwargs)
+
+    @staticmethod
+    def merge(*configs):
+        """
+        Merge dicts for from_config(). Later ones win, option by option
+        and ETA by ETA.
+        """
+        merged = {}
+        etas = {}
+        for config in configs:
+            for key, value in config.items():
+                if key == 'eta' and isinstance(value, dict):
+                    etas.update(value)
+                else:
+                    merged[key] = value
+        if etas and 'eta' not in merged:
+            merged['eta'] = etas
+        return merged
+
+    @staticmethod
+    def parse(spec):
+        """
+        Parse a command line spec like "initial=2,maximum=30,eta.volume=60"
+        into a dict for from_config().
+        """
+        config = {}
+        for item in spec.split(','):
+            if not item.strip():
+                continue
+            key, sep, value = item.partition('=')
+            if not sep:
+                raise exceptions.InvalidPollingConfigException('Expected key=value, got: %s' % (item,))
+            key = key.strip()
+            if key.startswith('eta.'):
+                config.setdefault('eta', {})[key[len('eta.'):]] = value.strip()
+            else:
+                config[key] = value.strip()
+        return config
+
+    def backoff(self, attempt):
+        return min(self.initial * self.factor ** attempt, self.maximum)
+
+    def jittered(self, delay):
+        return delay * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def eta(self, kind):
+        return self.etas.get(kind)
+
+    def observe(self, kind, duration, weight=0.3):
+        """
+        Record that a resource of this kind took `duration` seconds to
+        become ready.
+        """
+        with self.lock:
+            if kind in self.pinned:
+                return
+            if kind in self.etas:
+                self.etas[kind] = (1 - weight) * self.etas[kind] + weight * duration
+            else:
+                self.etas[kind] = duration
+
+    def waiter(self, kind, started):
+        """
+        A Waiter for resources of the given kind, requested at
+        `started`.
+        """
+        return Waiter(self, kind, started)
+
+class Waiter(object):
+    """
+    The state of one wait loop. Call next_delay() before every sleep.
+    """
+    def __init__(self, policy, kind, started):
+        self.policy = policy
+        self.kind = kind
+        self.started = started
+        self.attempt = 0
+        self.waited_for_eta = False
+
+    def next_delay(self, now):
+        eta = self.policy.eta(self.kind)
+        if eta is not None and not self.waited_for_eta:
+            self.waited_for_eta = True
+            remaining = self.started + eta - now
+            if remaining > self.policy.initial:
+                # No point asking before it's likely to be done
+                return self.policy.jittered(remaining)
+
+        delay = self.policy.backoff(self.attempt)
+        self.attempt += 1
+        return self.policy.jittered(delay)
@@ -0,0 +1,244 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import collections
+import contextlib
+import email.utils
+import itertools
+import threading
+import time
+
+from keystoneclient import exceptions as keystone_exceptions
+from keystoneclient import session as keystone_session
+
+# Responses that mean "slow down and try again". A 429 means the
+# request was turned away. A 503 may come from a proxy after the request
+# was carried out, so it's only retried for requests that are safe to
+# repeat: repeating a POST could create a second server, port, ...
+RETRY_STATUSES = (429, 503)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+# Keystone catalog service types and what we call them
+SERVICES = {'compute': 'nova',
+            'network': 'neutron',
+            'volume': 'cinder',
+            'volumev2': 'cinder',
+            'volumev3': 'cinder',
+            'identity': 'keystone'}
+
+class TokenBucket(object):
+    """
+    Allows `rate` requests per second on average, with bursts of up to
+    `burst` requests.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = None
+        self.lock = threading.Lock()
+
+    def reserve(self, now):
+        """
+        Take a token. Returns how long to wait before it may be used.
+        Tokens can be taken ahead of time, so concurrent callers are
+        served in order.
+        """
+        with self.lock:
+            if self.updated is not None:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+def retry_after(response):
+    """
+    The number of seconds a response's Retry-After header asks us to
+    wait, or None if it doesn't say.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    date = email.utils.parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0, email.utils.mktime_tz(date) - time.time())
+
+class Governor(object):
+    """
+    Keeps our API requests within the cloud's limits: at most `rate`
+    requests per second per service (bursts of up to `burst`), and at
+    most `max_in_flight` requests at a time across all services. Either
+    limit can be left out.
+
+    Requests that are turned down with 429, or with 503 if their method
+    is idempotent, are retried, up to `max_retries` times, after the delay given by their Retry-After
+    header or an exponential backoff. Time spent held back, for
+    whatever reason, is added up per service in `throttled`.
+
+    A thread only ever holds one of the `max_in_flight` slots: requests
+    it makes while it has one (e.g. to follow a redirect) don't need
+    another.
+    """
+    def __init__(self, rate=None, burst=None, max_in_flight=None,
+                 max_retries=5, max_retry_wait=60):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self.buckets = {}
+        self.in_flight = max_in_flight and threading.BoundedSemaphore(max_in_flight)
+        self.slots_held = threading.local()
+        self.throttled = collections.defaultdict(float)
+        self.retries = collections.defaultdict(int)
+        self.lock = threading.Lock()
+
+    def _bucket(self, service):
+        if not self.rate:
+            return None
+        with self.lock:
+            if service not in self.buckets:
+                self.buckets[service] = TokenBucket(self.rate, self.burst)
+            return self.buckets[service]
+
+    def _wait(self, service, seconds):
+        time.sleep(seconds)
+        with self.lock:
+            self.throttled[service] += seconds
+
+    def retry_delay(self, response, attempt):
+        delay = retry_after(response)
+        if delay is None:
+            delay = 2 ** attempt
+        return min(delay, self.max_retry_wait)
+
+    @contextlib.contextmanager
+    def slot(self, service):
+        """
+        Hold one of the max_in_flight slots, waiting for one if need be.
+        """
+        depth = getattr(self.slots_held, 'depth', 0)
+        if not self.in_flight or depth:
+            self.slots_held.depth = depth + 1
+            try:
+                yield
+            finally:
+                self.slots_held.depth = depth
+            return
+
+        start = time.time()
+        self.in_flight.acquire()
+        with self.lock:
+            self.throttled[service] += time.time() - start
+        self.slots_held.depth = 1
+        try:
+            yield
+        finally:
+            self.slots_held.depth = 0
+            self.in_flight.release()
+
+    def should_retry(self, response, method):
+        if response.status_code == 503:
+            return (method or '').upper() in IDEMPOTENT_METHODS
+        return response.status_code in RETRY_STATUSES
+
+    def call(self, service, func, hold_slot=True, method=None):
+        """
+        Make a request by calling func(), which returns the response,
+        within our limits. Without hold_slot, func() is left to take a
+        max_in_flight slot (see slot()) around the part of its work
+        that actually talks to the cloud. The request's HTTP method
+        decides whether a 503 is retried; if it isn't given, it isn't.
+        """
+        bucket = self._bucket(service)
+        for attempt in itertools.count():
+            if bucket:
+                delay = bucket.reserve(time.time())
+                if delay:
+                    self._wait(service, delay)
+
+            if hold_slot:
+                with self.slot(service):
+                    response = func()
+            else:
+                response = func()
+
+            if not self.should_retry(response, method) or attempt >= self.max_retries:
+                return response
+
+            with self.lock:
+                self.retries[service] += 1
+            self._wait(service, self.retry_delay(response, attempt))
+
+    def report(self):
+        """
+        A line about the time spent throttled, or '' if there wasn't any.
+        """
+        with self.lock:
+            services = sorted(service for service, secs in self.throttled.items() if secs >= 0.05)
+            if not services:
+                return ''
+            return 'Throttled: %s\n' % (', '.join('%s %.1fs (%d retries)' %
+                                                  (service, self.throttled[service],
+                                                   self.retries[service])
+                                                  for service in services),)
+
+class GovernedSessionMixin(object):
+    """
+    Sends every request of a Keystone session through a Governor. It
+    goes in front of the session class, so all the clients made from
+    the session are covered.
+
+    A max_in_flight slot is only held while a request is actually being
+    sent. Getting a token, which the session does along the way (and
+    again after a 401), is a request of its own and needs a slot too.
+    """
+    def __init__(self, governor=None, **kwargs):
+        super(GovernedSessionMixin, self).__init__(**kwargs)
+        self.governor = governor or Governor()
+        # The service of the request each thread is making
+        self.current = threading.local()
+
+    def request(self, url, method, **kwargs):
+        service_type = (kwargs.get('endpoint_filter') or {}).get('service_type')
+        service = SERVICES.get(service_type, service_type or 'other')
+        raise_exc = kwargs.pop('raise_exc', True)
+
+        parent = super(GovernedSessionMixin, self)
+        outer_service = getattr(self.current, 'service', None)
+        self.current.service = service
+        try:
+            response = self.governor.call(service,
+                                          lambda: parent.request(url, method, raise_exc=False,
+                                                                 **kwargs),
+                                          hold_slot=False, method=method)
+        finally:
+            self.current.service = outer_service
+        if raise_exc and response.status_code >= 400:
+            raise keystone_exceptions.from_response(response, method, url)
+        return response
+
+    def _send_request(self, *args, **kwargs):
+        parent = super(GovernedSessionMixin, self)
+        with self.governor.slot(getattr(self.current, 'service', None) or 'other'):
+            return parent._send_request(*args, **kwargs)
+
+class GovernedSession(GovernedSessionMixin, keystone_session.Session):
+    pass
@@ -16,24 +16,80 @@
 
 import argparse
 import ConfigParser
+import cPickle
+import errno
+import fcntl
+import hashlib
+import itertools
 import logging
 import os
 import pipes
+import re
 import select
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 import yaml
 
 from neutronclient.common.exceptions import Conflict as NeutronConflict
 from novaclient.exceptions import Conflict as NovaConflict
+from novaclient.exceptions import NotFound as NovaNotFound
 
 from overcast import utils
 from overcast import exceptions
-
-def load_yaml(f='.overcast.yaml'):
+from overcast.cleanup import Cleaner, KEPT_TYPES
+from overcast.journal import Journal, compact_journal, read_journal
+from overcast.output import OutputBuffer
+from overcast.polling import PollingPolicy
+from overcast.ratelimit import GovernedSession, Governor
+from overcast.scheduler import StepGraph, step_id
+from overcast.tokencache import CachedPassword, TokenCache
+from overcast.tracing import Tracer
+
+# The libyaml based loader is many times faster, but libyaml may not
+# be available.
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+def load_yaml(f='.overcast.yaml', cache_dir=None):
+    """
+    Parse a YAML file. With a cache_dir (by default $OVERCAST_YAML_CACHE,
+    if set), the parsed contents are kept there, keyed by a hash of the
+    file, so loading an unchanged file again skips parsing altogether.
+    """
     with open(f, 'r') as fp:
-        return yaml.load(fp)
+        data = fp.read()
+
+    cache_dir = cache_dir or os.environ.get('OVERCAST_YAML_CACHE')
+    if not cache_dir:
+        return yaml.load(data, Loader=YamlLoader)
+
+    cache_file = os.path.join(cache_dir, '%s.pickle' % (hashlib.sha1(data).hexdigest(),))
+    try:
+        with open(cache_file, 'rb') as fp:
+            # Unpickling runs code, so only trust our own files
+            if os.fstat(fp.fileno()).st_uid == os.getuid():
+                return cPickle.load(fp)
+    except Exception:
+        pass
+
+    parsed = yaml.load(data, Loader=YamlLoader)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0700)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            cPickle.dump(parsed, fp, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, cache_file)
+    except EnvironmentError:
+        # We've got what we came for, caching is just a bonus
+        pass
+    return parsed
 
 def load_mappings(f='.overcast.mappings.ini'):
     with open(f, 'r') as fp:
@@ -91,34 +147,156 @@ def list_refs(args, stdout=sys.stdout):
 
         stdout.write('\n')
 
-def run_cmd_once(shell_cmd, real_cmd, environment, deadline):
+# Upper bound on how long we sleep between checks for the child having
+# exited. This is also the precision of timeouts.
+MAX_WAIT_INTERVAL = 0.02
+
+# Max number of resources per Neutron bulk create request
+BULK_CHUNK_SIZE = 100
+
+# Max number of ids to filter on in a single list request, to keep the
+# URL a sensible length
+FILTER_CHUNK_SIZE = 50
+
+# How long an idle ssh control connection to a node is kept open
+SSH_CONTROL_PERSIST = '10m'
+
+# How long to try to open an ssh control connection to a node that
+# isn't answering (e.g. because it's still booting)
+SSH_MASTER_CONNECT_TIMEOUT = 10
+
+# While we're only waiting for output, wake up this often to notice a
+# child that has exited but left its stdout open in a background process.
+MAX_READ_WAIT = 1
+
+# Once the child has exited, read at most this much more of its output.
+# Anything beyond that comes from processes it left in the background.
+MAX_DRAIN_BYTES = 256 * 1024
+
+def set_nonblocking(fp):
+    flags = fcntl.fcntl(fp, fcntl.F_GETFL)
+    fcntl.fcntl(fp, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+def run_cmd_once(shell_cmd, real_cmd, environment, deadline, output=None):
+    """
+    Run shell_cmd, feed it real_cmd on stdin and wait for it to finish.
+
+    If output (an OutputBuffer) is given, the child's stdout and stderr
+    are captured into it, each from its own pipe, and the exceptions
+    raised carry its tail. Otherwise, the child inherits our stdout and
+    stderr.
+    """
+    if output is not None:
+        stdout, stderr = subprocess.PIPE, subprocess.PIPE
+    else:
+        stdout, stderr = None, None
+
     proc = subprocess.Popen(shell_cmd,
                             env=environment,
                             shell=True,
-                            stdin=subprocess.PIPE)
+                            stdin=subprocess.PIPE,
+                            stdout=stdout,
+                            stderr=stderr)
     stdin = real_cmd + '\n'
-    while True:
-        if stdin:
-            _, rfds, xfds = select.select([], [proc.stdin], [proc.stdin], 1)
-            if rfds:
-                proc.stdin.write(stdin[0])
-                stdin = stdin[1:]
-                if not stdin:
-                    proc.stdin.close()
-            if xfds:
-                if proc.stdin.feof():
-                    stdin = ''
 
-        if proc.poll() is not None:
-            if proc.returncode == 0:
-                return True
-            else:
-                raise exceptions.CommandFailedException(stdin)
+    # Non-blocking, so we can hand the pipe as much of the command as
+    # it will take in one go without risking getting stuck in write()
+    set_nonblocking(proc.stdin)
+    # The pipes we read the child's output from
+    readers = [fp for fp in (proc.stdout, proc.stderr) if fp]
+    for fp in readers:
+        set_nonblocking(fp)
+
+    def read(fp):
+        """
+        Pass on what's in the pipe. Returns how much that was, or None
+        if there was nothing to read yet.
+        """
+        try:
+            data = os.read(fp.fileno(), 65536)
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+            return None
+        if data:
+            output.write(data, stderr=fp is proc.stderr)
+        else:
+            fp.close()
+        return len(data)
 
+    def time_left():
+        if deadline:
+            return max(deadline - time.time(), 0)
+
+    def output_tail():
+        if output is not None:
+            return output.tail()
+
+    interval = 0.001
+    while True:
         if deadline and time.time() > deadline:
             if proc.poll() is None:
                 proc.kill()
-            raise exceptions.CommandTimedOutException(stdin)
+                proc.wait()
+            raise exceptions.CommandTimedOutException(stdin, output=output_tail())
+
+        rlist = [fp for fp in readers if not fp.closed]
+        if rlist and proc.poll() is not None:
+            # The child is gone, so all it wrote is already in the pipes.
+            # Something it started in the background may be holding on
+            # to them (and still writing to them), but we don't wait
+            # for that.
+            for fp in rlist:
+                drained = 0
+                while drained < MAX_DRAIN_BYTES and not fp.closed:
+                    size = read(fp)
+                    if not size:
+                        break
+                    drained += size
+                if not fp.closed:
+                    fp.close()
+            rlist = []
+
+        wlist = [proc.stdin] if not proc.stdin.closed else []
+
+        if rlist or wlist:
+            timeout = time_left()
+            if not wlist:
+                timeout = min(timeout, MAX_READ_WAIT) if deadline else MAX_READ_WAIT
+            rfds, wfds, _ = select.select(rlist, wlist, [], timeout)
+
+            if wfds:
+                try:
+                    stdin = stdin[os.write(proc.stdin.fileno(), stdin):]
+                except OSError, e:
+                    if e.errno not in (errno.EAGAIN, errno.EPIPE):
+                        raise
+                    if e.errno == errno.EPIPE:
+                        # The child stopped reading. Whatever's left is
+                        # reported in the exception if it fails.
+                        proc.stdin.close()
+                if not stdin and not proc.stdin.closed:
+                    proc.stdin.close()
+
+            for fp in rfds:
+                read(fp)
+            continue
+
+        if proc.poll() is not None:
+            break
+
+        # Back off gradually so short commands return quickly while long
+        # ones don't keep us busy
+        wait = interval
+        if deadline:
+            wait = min(wait, time_left())
+        time.sleep(wait)
+        interval = min(interval * 2, MAX_WAIT_INTERVAL)
+
+    if proc.wait() == 0:
+        return True
+    else:
+        raise exceptions.CommandFailedException(stdin, output=output_tail())
 
 
 def get_creds_from_env():
@@ -142,22 +320,34 @@ class Node(object):
         self.fip_ids = set()
         self.ports = []
         self.server_status = None
+        self.volume_id = None
+        self.volume_status = None
+        self.volume_requested_at = None
+        self.boot_requested_at = None
+        self.prepared_ports = None
         self.image = None
         self.flavor = None
         self.attempts_left = runner.retry_count + 1
 
-        if self.info.get('image') in self.runner.mappings.get('images', {}):
-            self.info['image'] = self.runner.mappings['images'][self.info['image']]
+        if 'image' in self.info:
+            self.info['image'] = self.runner._map_image(self.info['image'])
 
-        if self.info.get('flavor') in self.runner.mappings.get('flavors', {}):
-            self.info['flavor'] = self.runner.mappings['flavors'][self.info['flavor']]
+        if 'flavor' in self.info:
+            self.info['flavor'] = self.runner._map_flavor(self.info['flavor'])
 
-    def poll(self, desired_status = 'ACTIVE'):
+    def poll(self, desired_status = 'ACTIVE', statuses=None):
         """
         This one poll nova and return the server status
+
+        statuses is an optional dict of server id to status, as fetched
+        by DeploymentRunner.get_server_statuses(). It's used instead of
+        asking nova if it knows about this server.
         """
         if self.server_status != desired_status:
-            self.server_status = self.runner.get_nova_client().servers.get(self.server_id).status
+            if statuses is not None and self.server_id in statuses:
+                self.server_status = statuses[self.server_id]
+            else:
+                self.server_status = self.runner.get_nova_client().servers.get(self.server_id).status
         return self.server_status
 
     def clean(self):
@@ -166,9 +356,10 @@ class Node(object):
         We could keep fip and may be ports (ports are getting deleted with current
         neutron client), but that is going to be bit more complex to make sure
         right port is assigned to right fip etc, so atm, just removing them.
+        Floating IPs we didn't allocate ourselves are only released, not removed.
         """
         for fip_id in self.fip_ids:
-            self.runner.delete_floatingip(fip_id)
+            self.runner.release_floating_ip(fip_id)
         self.fip_ids = set()
 
         for port in self.ports:
@@ -178,13 +369,32 @@ class Node(object):
         server = self.runner.delete_server(self.server_id)
         self.server_id = None
 
+    def port_requests(self, networks):
+        """
+        The (name, network, security group ids) of the ports this node
+        needs, as taken by DeploymentRunner.create_port().
+        """
+        return [('%s_eth%d' % (self.name, eth_idx), network['network'],
+                 [self.runner.secgroups[secgroup] for secgroup in network.get('securitygroups', [])])
+                for eth_idx, network in enumerate(networks)]
+
     def create_nics(self, networks):
+        """
+        Set up this node's ports. If the runner has already created them
+        in bulk (see DeploymentRunner.prepare_ports()), those are used.
+        Otherwise, they're created one at a time.
+        """
+        if self.prepared_ports is not None:
+            port_infos, self.prepared_ports = self.prepared_ports, None
+        else:
+            port_infos = []
+            for port_name, network, secgroups in self.port_requests(networks):
+                port_info = self.runner.create_port(port_name, network, secgroups)
+                self.runner.record_resource('port', port_info['id'], name=port_name)
+                port_infos.append(port_info)
+
         nics = []
-        for eth_idx, network in enumerate(networks):
-           port_name = '%s_eth%d' % (self.name, eth_idx)
-           port_info = self.runner.create_port(port_name, network['network'],
-                                               [self.runner.secgroups[secgroup] for secgroup in network.get('securitygroups', [])])
-           self.runner.record_resource('port', port_info['id'])
+        for network, port_info in zip(networks, port_infos):
            self.ports.append(port_info)
 
            if network.get('assign_floating_ip', False):
@@ -196,27 +406,75 @@ class Node(object):
            nics.append(port_info['id'])
         return nics
 
-    def build(self):
-        if self.flavor is None:
-            self.flavor = self.runner.get_nova_client().flavors.get(self.info['flavor'])
+    def create_volume(self):
+        """
+        Ask cinder for this node's root volume. This returns right away;
+        use poll_volume() to find out when it's ready for boot().
 
-        nics = [{'port-id': port_id} for port_id in self.create_nics(self.info['networks'])]
+        With the runner's clone_volumes, the volume is cloned from the
+        golden volume for its image and size, which may first have to
+        be created and waited for.
 
-        volume = self.runner.get_cinder_client().volumes.create(size=self.info['disk'],
-                                                                imageRef=self.info['image'])
-        self.record_resource('volume', volume.id)
+        The volume is named after the node, and tagged with metadata
+        shared by all root volumes of the deployment (see
+        DeploymentRunner.root_volume_metadata()), so they can be listed
+        without listing every volume in the tenant.
+        """
+        cinder = self.runner.get_cinder_client()
+        name = 'root-%s' % (self.name,)
+        metadata = self.runner.root_volume_metadata()
+        if self.runner.clone_volumes:
+            source = self.runner.golden_volume(self.info['image'], self.info['disk'])
+            self.volume_requested_at = time.time()
+            volume = cinder.volumes.create(size=self.info['disk'], source_volid=source,
+                                           display_name=name, metadata=metadata)
+        else:
+            self.volume_requested_at = time.time()
+            volume = cinder.volumes.create(size=self.info['disk'], imageRef=self.info['image'],
+                                           display_name=name, metadata=metadata)
+        self.runner.record_resource('volume', volume.id, name=self.name)
+        self.volume_id = volume.id
+        self.volume_status = volume.status
+
+    def poll_volume(self, statuses=None):
+        """
+        Like poll(), but for the root volume. statuses is an optional
+        dict of volume id to status, as fetched by
+        DeploymentRunner.get_volume_statuses().
+        """
+        if self.volume_status != 'available':
+            if statuses is not None and self.volume_id in statuses:
+                self.volume_status = statuses[self.volume_id]
+            else:
+                self.volume_status = self.runner.get_cinder_client().volumes.get(self.volume_id).status
+        return self.volume_status
 
-        while volume.status != 'available':
-            time.sleep(3)
-            volume = self.runner.get_cinder_client().volumes.get(volume.id)
+    def build(self, polling=None):
+        self.create_volume()
 
-        bdm = {'vda': '%s:::1' % (volume.id,)}
+        polling = polling or self.runner.polling
+        waiter = polling.waiter('volume', self.volume_requested_at)
+        while self.poll_volume() != 'available':
+            if self.volume_status == 'error':
+                raise exceptions.ProvisionFailedException()
+            self.runner._sleep(waiter.next_delay(time.time()))
+
+        self.boot()
+
+    def boot(self):
+        if self.flavor is None:
+            self.flavor = self.runner.get_flavor(self.info['flavor'])
+
+        nics = [{'port-id': port_id} for port_id in self.create_nics(self.info['networks'])]
+
+        bdm = {'vda': '%s:::1' % (self.volume_id,)}
 
+        self.boot_requested_at = time.time()
         server = self.runner.get_nova_client().servers.create(self.name, image=None,
                                                               block_device_mapping=bdm,
                                                               flavor=self.flavor, nics=nics,
                                                               key_name=self.keypair, userdata=self.userdata)
-        self.runner.record_resource('server', server.id)
+        self.runner.record_resource('server', server.id, name=self.name)
         self.server_id = server.id
         self.attempts_left -= 1
 
@@ -228,61 +486,214 @@ class Node(object):
 
 class DeploymentRunner(object):
     def __init__(self, config=None, suffix=None, mappings=None, key=None,
-                 record_resource=None, retry_count=0):
+                 record_resource=None, retry_count=0, parallel=1,
+                 log_dir=None, ssh_multiplexing=True, reuse_floating_ips=False,
+                 token_cache=None, polling=None, governor=None, tracer=None,
+                 clone_volumes=False):
         self.cfg = config
         self.suffix = suffix
         self.mappings = mappings or {}
         self.key = key
         self.retry_count = retry_count
+        self.parallel = parallel
+        self.log_dir = log_dir
+        self.step_counter = itertools.count(1)
+        self.ssh_multiplexing = ssh_multiplexing
+        self.ssh_control_dir = None
+        self.ssh_hosts = set()
+        self.ssh_master_locks = {}
+        self.reuse_floating_ips = reuse_floating_ips
+        self.token_cache = token_cache
+        # Every API request goes through this
+        self.governor = governor or Governor()
+        self.tracer = tracer
+        # Polling options from the command line. They override those in
+        # stack files.
+        self.polling_config = polling or {}
+        self.polling = self.polling_policy()
+        self.flavors = {}
+        self.images = {}
+        self.lookup_lock = threading.Lock()
+        self.clone_volumes = clone_volumes
+        self.golden_volumes = {}
+        self.golden_volume_locks = {}
+        self.floating_network = None
+        self.floating_ip_pool = []
+        self.floating_ip_pool_lock = threading.Lock()
+        # Floating IPs we found in the tenant rather than allocated,
+        # as id -> address
+        self.reused_floating_ips = {}
+        # The ids of all floating IPs that have been in the pool, so
+        # unassociated ones we already have aren't reused twice
+        self.known_floating_ips = set()
         self.record_resource = lambda *args, **kwargs: None
 
         self.conncache = {}
+        self.conncache_lock = threading.RLock()
         self.networks = {}
         self.secgroups = {}
         self.nodes = {}
 
     def get_keystone_session(self):
-        from keystoneclient import session as keystone_session
         from keystoneclient.auth.identity import v2 as keystone_auth_id_v2
-        if 'keystone_session' not in self.conncache:
-            self.conncache['keystone_auth'] = keystone_auth_id_v2.Password(**get_creds_from_env())
-            self.conncache['keystone_session'] = keystone_session.Session(auth=self.conncache['keystone_auth'])
+        with self.conncache_lock:
+            if 'keystone_session' not in self.conncache:
+                if self.token_cache:
+                    self.conncache['keystone_auth'] = CachedPassword(self.token_cache,
+                                                                     **get_creds_from_env())
+                else:
+                    self.conncache['keystone_auth'] = keystone_auth_id_v2.Password(**get_creds_from_env())
+                self.conncache['keystone_session'] = GovernedSession(auth=self.conncache['keystone_auth'],
+                                                                     governor=self.governor)
         return self.conncache['keystone_session']
 
     def get_keystone_client(self):
         from keystoneclient.v2_0 import client as keystone_client
-        if 'keystone' not in self.conncache:
-            ks = self.get_keystone_session()
-            self.conncache['keystone'] = keystone_client.Client(session=ks)
+        with self.conncache_lock:
+            if 'keystone' not in self.conncache:
+                ks = self.get_keystone_session()
+                self.conncache['keystone'] = keystone_client.Client(session=ks)
         return self.conncache['keystone']
 
     def get_nova_client(self):
         import novaclient.client as novaclient
-        if 'nova' not in self.conncache:
-            kwargs = {'session': self.get_keystone_session()}
-            if 'OS_REGION_NAME' in os.environ:
-                kwargs['region_name'] = os.environ['OS_REGION_NAME']
-            self.conncache['nova'] = novaclient.Client("2", **kwargs)
+        with self.conncache_lock:
+            if 'nova' not in self.conncache:
+                kwargs = {'session': self.get_keystone_session()}
+                if 'OS_REGION_NAME' in os.environ:
+                    kwargs['region_name'] = os.environ['OS_REGION_NAME']
+                self.conncache['nova'] = self._traced(novaclient.Client("2", **kwargs), 'nova')
         return self.conncache['nova']
 
     def get_cinder_client(self):
         import cinderclient.client as cinderclient
-        if 'cinder' not in self.conncache:
-            kwargs = {'session': self.get_keystone_session()}
-            if 'OS_REGION_NAME' in os.environ:
-                kwargs['region_name'] = os.environ['OS_REGION_NAME']
-            self.conncache['cinder'] = cinderclient.Client('1', **kwargs)
+        with self.conncache_lock:
+            if 'cinder' not in self.conncache:
+                kwargs = {'session': self.get_keystone_session()}
+                if 'OS_REGION_NAME' in os.environ:
+                    kwargs['region_name'] = os.environ['OS_REGION_NAME']
+                self.conncache['cinder'] = self._traced(cinderclient.Client('1', **kwargs), 'cinder')
         return self.conncache['cinder']
 
     def get_neutron_client(self):
         import neutronclient.neutron.client as neutronclient
-        if 'neutron' not in self.conncache:
-            kwargs = {'session': self.get_keystone_session()}
-            if 'OS_REGION_NAME' in os.environ:
-                kwargs['region_name'] = os.environ['OS_REGION_NAME']
-            self.conncache['neutron'] = neutronclient.Client('2.0', **kwargs)
+        with self.conncache_lock:
+            if 'neutron' not in self.conncache:
+                kwargs = {'session': self.get_keystone_session()}
+                if 'OS_REGION_NAME' in os.environ:
+                    kwargs['region_name'] = os.environ['OS_REGION_NAME']
+                self.conncache['neutron'] = self._traced(neutronclient.Client('2.0', **kwargs), 'neutron')
         return self.conncache['neutron']
 
+    def _traced(self, client, service):
+        if self.tracer:
+            return self.tracer.wrap(client, service)
+        return client
+
+    def _sleep(self, seconds):
+        """
+        Sleep in a poll loop.
+        """
+        if self.tracer:
+            self.tracer.record('sleep', 'poll', seconds)
+        time.sleep(seconds)
+
+    def _map_flavor(self, flavor):
+        return self.mappings.get('flavors', {}).get(flavor, flavor)
+
+    def _map_image(self, image):
+        return self.mappings.get('images', {}).get(image, image)
+
+    def get_flavor(self, flavor_id):
+        with self.lookup_lock:
+            if flavor_id not in self.flavors:
+                self.flavors[flavor_id] = self.get_nova_client().flavors.get(flavor_id)
+            return self.flavors[flavor_id]
+
+    def _get_image(self, image_id):
+        nova = self.get_nova_client()
+        if hasattr(nova, 'glance'):
+            # Newer novaclients only proxy image lookups to Glance
+            return nova.glance.find_image(image_id)
+        return nova.images.get(image_id)
+
+    def resolve_flavors_and_images(self, node_infos):
+        """
+        Look up the flavors and images the given nodes use, each distinct
+        one only once and all of them concurrently. A flavor or image
+        that doesn't exist (e.g. because of a bad mapping) is reported
+        before anything gets created. The results are kept for the
+        nodes to use.
+        """
+        lookups = set()
+        for info in node_infos:
+            if 'flavor' in info:
+                lookups.add(('flavor', self._map_flavor(info['flavor'])))
+            if 'image' in info:
+                lookups.add(('image', self._map_image(info['image'])))
+
+        with self.lookup_lock:
+            lookups = sorted((kind, uuid) for kind, uuid in lookups
+                             if uuid not in (self.flavors if kind == 'flavor' else self.images))
+
+        def lookup(item):
+            kind, uuid = item
+            try:
+                if kind == 'flavor':
+                    return self.get_nova_client().flavors.get(uuid)
+                return self._get_image(uuid)
+            except NovaNotFound, e:
+                return e
+
+        missing = []
+        for (kind, uuid), result in zip(lookups, utils.run_in_parallel(lookup, lookups)):
+            if isinstance(result, NovaNotFound):
+                missing.append('%s %s' % (kind, uuid))
+            else:
+                with self.lookup_lock:
+                    (self.flavors if kind == 'flavor' else self.images)[uuid] = result
+
+        if missing:
+            raise exceptions.UnknownResourceException('Not found: %s' % (', '.join(missing),))
+
+    def golden_volume(self, image, size):
+        """
+        The id of the golden volume for an image and size: a volume
+        made from the image once, for nodes' root volumes to be cloned
+        from. One left by an earlier deploy with the same suffix is
+        reused. Otherwise it's created and recorded. Either way, this
+        waits until it's available.
+        """
+        key = (image, size)
+        with self.lookup_lock:
+            lock = self.golden_volume_locks.setdefault(key, threading.Lock())
+
+        # Nodes that need the same one wait for the first to get it
+        with lock:
+            if key not in self.golden_volumes:
+                self.golden_volumes[key] = self._get_golden_volume(image, size)
+            return self.golden_volumes[key]
+
+    def _get_golden_volume(self, image, size):
+        cinder = self.get_cinder_client()
+        name = self.add_suffix('golden-%s-%s' % (image, size))
+
+        existing = [volume for volume in cinder.volumes.list(search_opts={'display_name': name})
+                    if volume.status not in ('error', 'deleting')]
+        if existing:
+            volume = existing[0]
+        else:
+            volume = cinder.volumes.create(size=size, imageRef=image, display_name=name)
+            self.record_resource('golden_volume', volume.id, name=name)
+
+        waiter = self.polling.waiter('golden_volume', time.time())
+        while volume.status != 'available':
+            if volume.status == 'error':
+                raise exceptions.ProvisionFailedException()
+            self._sleep(waiter.next_delay(time.time()))
+            volume = cinder.volumes.get(volume.id)
+        return volume.id
+
     def _map_network(self, network):
         if network in self.mappings.get('networks', {}):
             return self.mappings['networks'][network]
@@ -291,65 +702,97 @@ class DeploymentRunner(object):
         return network
 
     def detect_existing_resources(self):
+        """
+        Find resources with our suffix that already exist. As much of
+        the filtering as possible is done by the server, and only the
+        fields we need are fetched, so this scales with the size of our
+        stack rather than that of the tenant.
+        """
         neutron = self.get_neutron_client()
+        nova = self.get_nova_client()
 
         suffix = self.add_suffix('')
         if suffix:
             strip_suffix = lambda s:s[:-len(suffix)]
+            server_search_opts = {'name': '%s$' % (re.escape(suffix),)}
         else:
             strip_suffix = lambda s:s
+            server_search_opts = {}
 
+        # Each collection is processed page by page as it comes in
         network_name_by_id = {}
-        for network in neutron.list_networks()['networks']:
-            if network['name'].endswith(suffix):
-                base_name = strip_suffix(network['name'])
-                if base_name in self.networks:
-                    raise exceptions.DuplicateResourceException('Network', network['name'])
-
-                self.networks[base_name] = network['id']
-                network_name_by_id[network['id']] = base_name
-
-        raw_ports = [{'id': port['id'],
-                      'fixed_ip': port['fixed_ips'][0]['ip_address'],
-                      'mac': port['mac_address'],
-                      'network_name': network_name_by_id.get(port['network_id'], port['network_id'])}
-                     for port in neutron.list_ports()['ports']]
-        ports_by_id = {port['id']: port for port in raw_ports}
-        ports_by_mac = {port['mac']: port for port in raw_ports}
-
-        for fip in neutron.list_floatingips()['floatingips']:
-            port_id = fip['port_id']
-            if not port_id:
-                continue
-            port = ports_by_id[port_id]
-            port['floating_ip'] = fip['floating_ip_address']
-
-        for secgroup in neutron.list_security_groups()['security_groups']:
-            if secgroup['name'].endswith(suffix):
-                base_name = strip_suffix(secgroup['name'])
-                if base_name in self.secgroups:
-                    raise exceptions.DuplicateResourceException('Security Group', secgroup['name'])
-
-                self.secgroups[base_name] = secgroup['id']
-
-        nova = self.get_nova_client()
-
-        for node in nova.servers.list():
-            if node.name.endswith(suffix):
-                base_name = strip_suffix(node.name)
-                if base_name in self.nodes:
-                    raise exceptions.DuplicateResourceException('Node', node.name)
-
-                self.nodes[base_name] = Node(node.name, {}, self)
-                for address in node.addresses.values():
-                    mac = address[0]['OS-EXT-IPS-MAC:mac_addr']
-                    port = ports_by_mac[mac]
-                    self.nodes[base_name].ports.append(port)
+        def find_networks():
+            for network in utils.paginate_neutron(neutron.list_networks, 'networks',
+                                                  fields=['id', 'name']):
+                if network['name'].endswith(suffix):
+                    base_name = strip_suffix(network['name'])
+                    if base_name in self.networks:
+                        raise exceptions.DuplicateResourceException('Network', network['name'])
+
+                    self.networks[base_name] = network['id']
+                    network_name_by_id[network['id']] = base_name
+
+        def find_secgroups():
+            for secgroup in utils.paginate_neutron(neutron.list_security_groups, 'security_groups',
+                                                   fields=['id', 'name']):
+                if secgroup['name'].endswith(suffix):
+                    base_name = strip_suffix(secgroup['name'])
+                    if base_name in self.secgroups:
+                        raise exceptions.DuplicateResourceException('Security Group', secgroup['name'])
+
+                    self.secgroups[base_name] = secgroup['id']
+
+        servers = []
+        def find_servers():
+            servers.extend(server for server in utils.paginate_nova(nova.servers.list,
+                                                                    search_opts=server_search_opts)
+                           if server.name.endswith(suffix))
+
+        utils.run_in_parallel(lambda find: find(),
+                              [find_networks, find_secgroups, find_servers])
+
+        # Only the ports of our servers, and their floating IPs, are of
+        # interest
+        ports_by_mac = {}
+        def find_ports(server_ids):
+            ports_by_id = {}
+            for port in utils.paginate_neutron(neutron.list_ports, 'ports', device_id=server_ids,
+                                               fields=['id', 'fixed_ips', 'mac_address', 'network_id']):
+                port_info = {'id': port['id'],
+                             'fixed_ip': port['fixed_ips'][0]['ip_address'],
+                             'mac': port['mac_address'],
+                             'network_name': network_name_by_id.get(port['network_id'], port['network_id'])}
+                ports_by_id[port_info['id']] = port_info
+                ports_by_mac[port_info['mac']] = port_info
+
+            for port_ids in utils.chunks(ports_by_id, FILTER_CHUNK_SIZE):
+                for fip in utils.paginate_neutron(neutron.list_floatingips, 'floatingips',
+                                                  port_id=port_ids,
+                                                  fields=['floating_ip_address', 'port_id']):
+                    ports_by_id[fip['port_id']]['floating_ip'] = fip['floating_ip_address']
+
+        utils.run_in_parallel(find_ports, utils.chunks([server.id for server in servers],
+                                                       FILTER_CHUNK_SIZE),
+                              self.parallel)
+
+        for node in servers:
+            base_name = strip_suffix(node.name)
+            if base_name in self.nodes:
+                raise exceptions.DuplicateResourceException('Node', node.name)
+
+            self.nodes[base_name] = Node(node.name, {}, self)
+            for address in node.addresses.values():
+                mac = address[0]['OS-EXT-IPS-MAC:mac_addr']
+                port = ports_by_mac[mac]
+                self.nodes[base_name].ports.append(port)
 
     def delete_volume(self, uuid):
         cc = self.get_cinder_client()
         cc.volumes.delete(uuid)
 
+    def delete_golden_volume(self, uuid):
+        self.delete_volume(uuid)
+
     def delete_port(self, uuid):
         nc = self.get_neutron_client()
         nc.delete_port(uuid)
@@ -369,7 +812,8 @@ class DeploymentRunner(object):
         except NeutronConflict, e:
             # This is probably due to the router port. Let's find it.
             router_found = False
-            for port in nc.list_ports(device_owner='network:router_interface')['ports']:
+            for port in utils.paginate_neutron(nc.list_ports, 'ports',
+                                               device_owner='network:router_interface'):
                 for fixed_ip in port['fixed_ips']:
                     if fixed_ip['subnet_id'] == uuid:
                         router_found = True
@@ -404,20 +848,59 @@ class DeploymentRunner(object):
         nc = self.get_nova_client()
         nc.servers.delete(uuid)
 
-    def create_port(self, name, network, secgroups):
-        nc = self.get_neutron_client()
-        network_id = self._map_network(network)
-        port = {'name': name,
+    def _port_body(self, name, network, secgroups):
+        return {'name': name,
                 'admin_state_up': True,
-                'network_id': network_id,
+                'network_id': self._map_network(network),
                 'security_groups': secgroups}
-        port = nc.create_port({'port': port})['port']
 
+    def _port_info(self, port, network):
         return {'id': port['id'],
                 'fixed_ip': port['fixed_ips'][0]['ip_address'],
                 'mac': port['mac_address'],
                 'network_name': network}
 
+    def create_port(self, name, network, secgroups):
+        nc = self.get_neutron_client()
+        port = nc.create_port({'port': self._port_body(name, network, secgroups)})['port']
+        return self._port_info(port, network)
+
+    def create_ports(self, requests):
+        """
+        Create ports with Neutron bulk requests. requests is a list of
+        (name, network, secgroups) tuples, like create_port() takes.
+        Returns the port infos in the same order.
+        """
+        if not requests:
+            return []
+
+        nc = self.get_neutron_client()
+
+        def create_chunk(chunk):
+            ports = nc.create_port({'ports': [self._port_body(*request)
+                                              for request in chunk]})['ports']
+            port_infos = []
+            for (name, network, _), port in zip(chunk, ports):
+                self.record_resource('port', port['id'], name=name)
+                port_infos.append(self._port_info(port, network))
+            return port_infos
+
+        chunks = list(utils.chunks(requests, BULK_CHUNK_SIZE))
+        return sum(utils.run_in_parallel(create_chunk, chunks, self.parallel), [])
+
+    def prepare_ports(self, node_names):
+        """
+        Create the ports of all the given nodes in bulk and hand them
+        to the nodes, so they don't have to create them one at a time
+        when they boot.
+        """
+        nodes = [self.nodes[name] for name in node_names]
+        requests = [node.port_requests(node.info['networks']) for node in nodes]
+        port_infos = self.create_ports(sum(requests, []))
+        for node, node_requests in zip(nodes, requests):
+            node.prepared_ports = port_infos[:len(node_requests)]
+            port_infos = port_infos[len(node_requests):]
+
     def create_keypair(self, name, keydata):
         nc = self.get_nova_client()
         try:
@@ -426,19 +909,89 @@ class DeploymentRunner(object):
             pass
 
     def find_floating_network(self, ):
-        nc = self.get_neutron_client()
-        networks = nc.list_networks(**{'router:external': True})
-        return networks['networks'][0]['id']
+        with self.conncache_lock:
+            if self.floating_network is None:
+                nc = self.get_neutron_client()
+                networks = nc.list_networks(**{'router:external': True})
+                self.floating_network = networks['networks'][0]['id']
+        return self.floating_network
 
     def create_floating_ip(self):
+        """
+        Returns the (id, address) of a floating IP that isn't associated
+        with anything, from the pool filled by preallocate_floating_ips()
+        if possible. Otherwise, a new one is allocated.
+        """
+        with self.floating_ip_pool_lock:
+            if self.floating_ip_pool:
+                return self.floating_ip_pool.pop(0)
+        return self._allocate_floating_ip()
+
+    def _allocate_floating_ip(self):
         nc = self.get_neutron_client()
         floating_network = self.find_floating_network()
         floatingip = {'floating_network_id': floating_network}
         floatingip = nc.create_floatingip({'floatingip': floatingip})
         self.record_resource('floatingip', floatingip['floatingip']['id'])
+        with self.floating_ip_pool_lock:
+            self.known_floating_ips.add(floatingip['floatingip']['id'])
         return (floatingip['floatingip']['id'],
                 floatingip['floatingip']['floating_ip_address'])
 
+    def preallocate_floating_ips(self, count):
+        """
+        Make sure there are at least count floating IPs in the pool used
+        by create_floating_ip(). With reuse_floating_ips, unassociated
+        floating IPs that already exist in the tenant are used first.
+        The rest are allocated concurrently.
+        """
+        with self.floating_ip_pool_lock:
+            needed = count - len(self.floating_ip_pool)
+        if needed <= 0:
+            return
+
+        if self.reuse_floating_ips:
+            nc = self.get_neutron_client()
+            fips = utils.paginate_neutron(nc.list_floatingips, 'floatingips',
+                                          floating_network_id=self.find_floating_network())
+            free = [(fip['id'], fip['floating_ip_address'])
+                    for fip in fips if not fip['port_id']]
+            with self.floating_ip_pool_lock:
+                free = [fip for fip in free if fip[0] not in self.known_floating_ips][:needed]
+                self.floating_ip_pool.extend(free)
+                self.reused_floating_ips.update(free)
+                self.known_floating_ips.update(fip_id for fip_id, address in free)
+            needed -= len(free)
+
+        allocated = utils.run_in_parallel(lambda _: self._allocate_floating_ip(),
+                                          range(needed), self.parallel)
+        with self.floating_ip_pool_lock:
+            self.floating_ip_pool.extend(allocated)
+
+    def prepare_floating_ips(self, node_names):
+        """
+        Fill the floating IP pool with as many as the given nodes need.
+        """
+        self.preallocate_floating_ips(sum(1 for name in node_names
+                                          for network in self.nodes[name].info['networks']
+                                          if network.get('assign_floating_ip', False)))
+
+    def release_floating_ip(self, fip_id):
+        """
+        Give up a floating IP handed out by create_floating_ip(). Ones
+        we allocated are deleted. Ones that were already in the tenant
+        (see reuse_floating_ips) aren't ours to delete, so they're
+        disassociated and put back in the pool instead.
+        """
+        if fip_id not in self.reused_floating_ips:
+            self.delete_floatingip(fip_id)
+            return
+
+        nc = self.get_neutron_client()
+        nc.update_floatingip(fip_id, {'floatingip': {'port_id': None}})
+        with self.floating_ip_pool_lock:
+            self.floating_ip_pool.append((fip_id, self.reused_floating_ips[fip_id]))
+
     def associate_floating_ip(self, port_id, fip_id):
         nc = self.get_neutron_client()
         nc.update_floatingip(fip_id, {'floatingip': {'port_id': port_id}})
@@ -447,14 +1000,14 @@ class DeploymentRunner(object):
         nc = self.get_neutron_client()
         network = {'name': name, 'admin_state_up': True}
         network = nc.create_network({'network': network})
-        self.record_resource('network', network['network']['id'])
+        self.record_resource('network', network['network']['id'], name=name)
 
         subnet = {"network_id": network['network']['id'],
                   "ip_version": 4,
                   "cidr": info['cidr'],
                   "name": name}
         subnet = nc.create_subnet({'subnet': subnet})['subnet']
-        self.record_resource('subnet', subnet['id'])
+        self.record_resource('subnet', subnet['id'], name=name)
 
         if '*' in self.mappings.get('routers', {}):
             nc.add_interface_router(self.mappings['routers']['*'], {'subnet_id': subnet['id']})
@@ -462,30 +1015,47 @@ class DeploymentRunner(object):
         return network['network']['id']
 
     def create_security_group(self, base_name, info):
+        self.create_security_groups({base_name: info})
+
+    def create_security_groups(self, secgroups):
+        """
+        Create security groups from a dict of base name to list of rules.
+
+        All the groups are created first and then all of their rules, in
+        as few bulk requests as possible. That way, rules can also refer
+        to groups that come later in the stack.
+        """
         nc = self.get_neutron_client()
-        name = self.add_suffix(base_name)
 
-        secgroup = {'name': name}
-        secgroup = nc.create_security_group({'security_group': secgroup})['security_group']
+        def create_group(base_name):
+            name = self.add_suffix(base_name)
+            secgroup = nc.create_security_group({'security_group': {'name': name}})['security_group']
 
-        self.record_resource('secgroup', secgroup['id'])
-        self.secgroups[base_name] = secgroup['id']
+            self.record_resource('secgroup', secgroup['id'], name=name)
+            self.secgroups[base_name] = secgroup['id']
 
-        for rule in (info or []):
-            secgroup_rule = {"direction": "ingress",
-                             "ethertype": "IPv4",
-                             "port_range_min": rule['from_port'],
-                             "port_range_max": rule['to_port'],
-                             "protocol": rule['protocol'],
-                             "security_group_id": secgroup['id']}
+        utils.run_in_parallel(create_group, secgroups.keys(), self.parallel)
 
-            if 'source_group' in rule:
-                secgroup_rule['remote_group_id'] = self.secgroups.get(rule['source_group'], rule['source_group'])
-            else:
-                secgroup_rule['remote_ip_prefix'] = rule['cidr']
+        secgroup_rules = []
+        for base_name, info in secgroups.items():
+            for rule in (info or []):
+                secgroup_rule = {"direction": "ingress",
+                                 "ethertype": "IPv4",
+                                 "port_range_min": rule['from_port'],
+                                 "port_range_max": rule['to_port'],
+                                 "protocol": rule['protocol'],
+                                 "security_group_id": self.secgroups[base_name]}
 
-            secgroup_rule = nc.create_security_group_rule({'security_group_rule': secgroup_rule})
-            self.record_resource('secgroup_rule', secgroup_rule['security_group_rule']['id'])
+                if 'source_group' in rule:
+                    secgroup_rule['remote_group_id'] = self.secgroups.get(rule['source_group'], rule['source_group'])
+                else:
+                    secgroup_rule['remote_ip_prefix'] = rule['cidr']
+                secgroup_rules.append(secgroup_rule)
+
+        for chunk in utils.chunks(secgroup_rules, BULK_CHUNK_SIZE):
+            created = nc.create_security_group_rule({'security_group_rules': chunk})
+            for secgroup_rule in created['security_group_rules']:
+                self.record_resource('secgroup_rule', secgroup_rule['id'])
 
     def build_env_prefix(self, details):
         env_prefix = ''
@@ -533,57 +1103,149 @@ class DeploymentRunner(object):
         def wait():
             time.sleep(retry_delay)
 
+        # Output is echoed as it arrives and also kept per step, so it
+        # can be attached to failures and, with log_dir, stored.
+        if self.log_dir:
+            spill_path = os.path.join(self.log_dir,
+                                      'step-%03d.log' % (next(self.step_counter),))
+        else:
+            spill_path = None
+        output = OutputBuffer(spill_path=spill_path, echo=sys.stdout, stderr_echo=sys.stderr)
+
         # Four settings matter here:
         # retry-if-fails: True/False
         # retry-delay: Time to wait between retries
         # timeout: Max time per command execution
         # total-timeout: How long time to spend on this in total
-        while True:
-            if individual_exec_limit:
-                deadline = time.time() + individual_exec_limit
-                if overall_deadline:
-                    if deadline > overall_deadline:
-                        deadline = overall_deadline
-            elif overall_deadline:
-                deadline = overall_deadline
-            else:
-                deadline = None
-
-            try:
-                run_cmd_once(cmd, details['cmd'], environment, deadline)
-                break
-            except exceptions.CommandFailedException:
-                if details.get('retry-if-fails', False):
-                    wait()
-                    continue
-                raise
-            except exceptions.CommandTimedOutException:
-                if details.get('retry-if-fails', False):
-                    if time.time() + retry_delay < deadline:
+        try:
+            while True:
+                if individual_exec_limit:
+                    deadline = time.time() + individual_exec_limit
+                    if overall_deadline:
+                        if deadline > overall_deadline:
+                            deadline = overall_deadline
+                elif overall_deadline:
+                    deadline = overall_deadline
+                else:
+                    deadline = None
+
+                try:
+                    run_cmd_once(cmd, details['cmd'], environment, deadline,
+                                 output=output)
+                    break
+                except exceptions.CommandFailedException:
+                    if details.get('retry-if-fails', False):
                         wait()
                         continue
-                raise
+                    raise
+                except exceptions.CommandTimedOutException:
+                    if details.get('retry-if-fails', False):
+                        if time.time() + retry_delay < deadline:
+                            wait()
+                            continue
+                    raise
+        finally:
+            output.close()
 
     def shell_step_cmd(self, details, env_prefix=''):
         if details.get('type', None) == 'remote':
             fip_addr = self.nodes[details['node']].floating_ip
-            return 'ssh -o StrictHostKeyChecking=no ubuntu@%s "%s bash"' % (fip_addr, env_prefix)
+            host = 'ubuntu@%s' % (fip_addr,)
+            self.ssh_hosts.add(host)
+            ssh_args = ['-o', 'StrictHostKeyChecking=no']
+            return 'ssh %s %s%s "%s bash"' % (' '.join(ssh_args), self.ssh_options(host, ssh_args),
+                                              host, env_prefix)
         else:
              return '%s bash' % (env_prefix,)
 
+    def ssh_options(self, host, ssh_args=()):
+        """
+        Extra options for ssh to host in remote shell steps. Unless
+        multiplexing is disabled, they make all steps and retries on a
+        node share a single connection. It's set up the first time it's
+        needed (see start_ssh_master()) and closed by
+        close_ssh_connections(). ssh_args are the other options ssh is
+        given, which the connection is set up with too.
+        """
+        if not self.ssh_multiplexing:
+            return ''
+
+        self.start_ssh_master(host, ssh_args)
+        return '-o ControlMaster=no -o ControlPath=%s ' % (self._ssh_control_path(),)
+
+    def start_ssh_master(self, host, ssh_args=()):
+        """
+        Open the shared ssh connection to host, unless it's open already.
+        Returns whether it is.
+
+        The connection is opened by an ssh of its own, with its stdio on
+        /dev/null, rather than by the first step that needs it. The
+        process that keeps it open would otherwise hold on to that
+        step's output pipe, and we'd wait for it. If it can't be opened
+        (e.g. the node isn't up yet), steps connect on their own and the
+        next one tries again.
+        """
+        with self.conncache_lock:
+            if self.ssh_control_dir is None:
+                # Keep it short. Unix socket paths are limited to ~100 chars.
+                self.ssh_control_dir = tempfile.mkdtemp(prefix='overcast-')
+            lock = self.ssh_master_locks.setdefault(host, threading.Lock())
+
+        ssh_args = list(ssh_args) + ['-o', 'ControlPath=%s' % (self._ssh_control_path(),)]
+        with lock:
+            with open(os.devnull, 'r+') as devnull:
+                if subprocess.call(['ssh'] + ssh_args + ['-O', 'check', host],
+                                   stdin=devnull, stdout=devnull, stderr=devnull) == 0:
+                    return True
+                return subprocess.call(['ssh'] + ssh_args +
+                                       ['-o', 'BatchMode=yes',
+                                        '-o', 'ConnectTimeout=%d' % (SSH_MASTER_CONNECT_TIMEOUT,),
+                                        '-o', 'ControlMaster=yes',
+                                        '-o', 'ControlPersist=%s' % (SSH_CONTROL_PERSIST,),
+                                        '-N', '-f', host],
+                                       stdin=devnull, stdout=devnull, stderr=devnull) == 0
+
+    def _ssh_control_path(self):
+        return os.path.join(self.ssh_control_dir, '%r@%h:%p')
+
+    def close_ssh_connections(self):
+        if self.ssh_control_dir is None:
+            return
+
+        with open(os.devnull, 'w') as devnull:
+            for host in self.ssh_hosts:
+                subprocess.call(['ssh', '-o', 'ControlPath=%s' % (self._ssh_control_path(),),
+                                 '-O', 'exit', host],
+                                stdout=devnull, stderr=devnull)
+
+        shutil.rmtree(self.ssh_control_dir, ignore_errors=True)
+        self.ssh_control_dir = None
+        self.ssh_hosts = set()
+
     def add_suffix(self, s):
         if self.suffix:
             return '%s_%s' % (s, self.suffix)
         else:
             return s
 
+    def polling_policy(self, stack_config=None):
+        """
+        A new PollingPolicy from a stack file's `polling:` section and
+        the command line options. ETAs given on the command line are
+        pinned, so what is learned while polling doesn't replace them.
+        """
+        config = PollingPolicy.merge(stack_config or {}, self.polling_config)
+        return PollingPolicy.from_config(config, pinned=self.polling_config.get('eta', {}))
+
     def provision_step(self, details):
         stack = load_yaml(details['stack'])
 
+        self.resolve_flavors_and_images(stack['nodes'].values())
+
         if self.key:
             keypair_name = self.add_suffix('pubkey')
             self.create_keypair(keypair_name, self.key)
-            self.record_resource('keypair', keypair_name)
+            self.record_resource('keypair', keypair_name, name=keypair_name)
         else:
             keypair_name = None
 
@@ -593,10 +1255,12 @@ class DeploymentRunner(object):
         else:
             userdata = None
 
+        pending_volumes = set()
         pending_nodes = set()
 
-        def wait():
-            time.sleep(5)
+        # What this step learns about how long things take stays with
+        # this step.
+        polling = self.polling_policy(stack.get('polling'))
 
         for base_network_name, network_info in stack['networks'].items():
             if base_network_name in self.networks:
@@ -605,31 +1269,51 @@ class DeploymentRunner(object):
             self.networks[base_network_name] = self.create_network(network_name,
                                                                    network_info)
 
-        for base_secgroup_name, secgroup_info in stack['securitygroups'].items():
-            if base_secgroup_name in self.secgroups:
-                continue
-            self.create_security_group(base_secgroup_name, secgroup_info)
+        self.create_security_groups(dict((base_secgroup_name, secgroup_info)
+                                         for base_secgroup_name, secgroup_info
+                                         in stack['securitygroups'].items()
+                                         if base_secgroup_name not in self.secgroups))
 
+        node_jobs = []
         for base_node_name, node_info in stack['nodes'].items():
             if 'number' in node_info:
                 count = node_info.pop('number')
                 for idx in range(1, count+1):
                     node_name = '%s%d' % (base_node_name, idx)
-                    name = self._create_node(node_name, node_info,
-                                             keypair_name=keypair_name, userdata=userdata)
-                    if name:
-                        pending_nodes.add(name)
+                    node_jobs.append((node_name, node_info))
             else:
-                name = self._create_node(base_node_name, node_info,
-                                         keypair_name=keypair_name, userdata=userdata)
-                if name:
-                    pending_nodes.add(name)
+                node_jobs.append((base_node_name, node_info))
 
+        def create_node(job):
+            node_name, node_info = job
+            return self._create_node(node_name, node_info,
+                                     keypair_name=keypair_name, userdata=userdata)
+
+        for name in utils.run_in_parallel(create_node, node_jobs, self.parallel):
+            if name:
+                pending_volumes.add(name)
+
+        self.prepare_ports(pending_volumes)
+        self.prepare_floating_ips(pending_volumes)
+
+        # Nodes move from pending_volumes to pending_nodes as soon as
+        # their volume is ready and their server has been requested.
+        waiter = None
         while True:
-            pending_nodes = self._poll_pending_nodes(pending_nodes)
-            if not pending_nodes:
+            if pending_volumes:
+                still_pending = self._poll_pending_volumes(pending_volumes, polling)
+                pending_nodes.update(pending_volumes.difference(still_pending))
+                pending_volumes = still_pending
+            if pending_nodes:
+                pending_nodes = self._poll_pending_nodes(pending_nodes, polling)
+            if not pending_nodes and not pending_volumes:
                 break
-            wait()
+
+            # Wait for volumes first, then for the servers booted from them
+            kind = pending_volumes and 'volume' or 'server'
+            if waiter is None or waiter.kind != kind:
+                waiter = polling.waiter(kind, time.time())
+            self._sleep(waiter.next_delay(time.time()))
 
     def _create_node(self, base_name, node_info, keypair_name, userdata):
         if base_name in self.nodes:
@@ -639,35 +1323,163 @@ class DeploymentRunner(object):
                                      runner=self,
                                      keypair=keypair_name,
                                      userdata=userdata)
-        self.nodes[base_name].build()
+        self.nodes[base_name].create_volume()
         return base_name
 
+    def root_volume_metadata(self):
+        """
+        The metadata the root volumes of this deployment's nodes are
+        tagged with.
+        """
+        return {'overcast_root_volume': self.add_suffix('root')}
+
+    def get_volume_statuses(self, volume_ids):
+        """
+        Fetch the status of all the given volumes with a single
+        volumes.list call. Only our root volumes are listed, not every
+        volume in the tenant.
+        """
+        if not volume_ids:
+            return {}
+
+        volume_ids = set(volume_ids)
+        cinder = self.get_cinder_client()
+        search_opts = {'metadata': self.root_volume_metadata()}
+        return {volume.id: volume.status
+                for volume in cinder.volumes.list(search_opts=search_opts)
+                if volume.id in volume_ids}
+
+    def _poll_pending_volumes(self, pending_volumes, polling=None):
+        polling = polling or self.polling
+        ready = set()
+        statuses = self.get_volume_statuses([self.nodes[name].volume_id
+                                             for name in pending_volumes])
+        for name in pending_volumes:
+            state = self.nodes[name].poll_volume(statuses=statuses)
+            if state == 'available':
+                ready.add(name)
+                if self.nodes[name].volume_requested_at is not None:
+                    polling.observe('volume', time.time() - self.nodes[name].volume_requested_at)
+            elif state == 'error':
+                raise exceptions.ProvisionFailedException()
+
+        utils.run_in_parallel(lambda name: self.nodes[name].boot(),
+                              ready, self.parallel)
+        return pending_volumes.difference(ready)
+
+
+    def get_server_statuses(self, server_ids):
+        """
+        Fetch the status of all the given servers with a single
+        servers.list call rather than one servers.get per server.
+        """
+        if not server_ids:
+            return {}
+
+        search_opts = {}
+        suffix = self.add_suffix('')
+        if suffix:
+            search_opts['name'] = '%s$' % (re.escape(suffix),)
+
+        server_ids = set(server_ids)
+        nova = self.get_nova_client()
+        return {server.id: server.status
+                for server in utils.paginate_nova(nova.servers.list, search_opts=search_opts)
+                if server.id in server_ids}
 
-    def _poll_pending_nodes(self, pending_nodes):
+    def _poll_pending_nodes(self, pending_nodes, polling=None):
+        polling = polling or self.polling
         done = set()
+        statuses = self.get_server_statuses([self.nodes[name].server_id
+                                             for name in pending_nodes
+                                             if self.nodes[name].server_status != 'ACTIVE'])
         for name in pending_nodes:
-            state = self.nodes[name].poll()
+            state = self.nodes[name].poll(statuses=statuses)
             if state == 'ACTIVE':
                 done.add(name)
+                if self.nodes[name].boot_requested_at is not None:
+                    polling.observe('server', time.time() - self.nodes[name].boot_requested_at)
             elif state == 'ERROR':
                 if self.retry_count:
                     self.nodes[name].clean()
                     if self.nodes[name].attempts_left:
-                         self.nodes[name].build()
+                         self.nodes[name].build(polling)
                          continue
                 raise exceptions.ProvisionFailedException()
         return pending_nodes.difference(done)
 
 
-    def deploy(self, name):
-        for step in self.cfg[name]:
-            step_type = step.keys()[0]
-            details = step[step_type]
-            func = getattr(self, '%s_step' % step_type)
-            func(details)
+    def parallel_step(self, details):
+        """
+        Run the steps listed in details['steps'] concurrently, at most
+        details['max-concurrency'] at a time (default: all of them).
+
+        With fail-fast (the default), no more steps are started once one
+        has failed. Otherwise, all steps run to completion. Either way,
+        the first failure is raised once the running steps are done.
+
+        Each step is known as <parallel step>/<step>, e.g.
+        parallel-2/shell-1, and is traced on its own.
+        """
+        parent = getattr(utils.context, 'step', None)
+
+        def run_child(job):
+            idx, step = job
+            name = step_id(step, idx)
+            utils.context.step = parent and '%s/%s' % (parent, name) or name
+            try:
+                if self.tracer:
+                    with self.tracer.span('step', utils.context.step):
+                        self.run_step(step)
+                else:
+                    self.run_step(step)
+            finally:
+                # With a concurrency of 1, this runs in our own thread
+                utils.context.step = parent
+
+        utils.run_in_parallel(run_child, enumerate(details['steps']),
+                              details.get('max-concurrency'),
+                              fail_fast=details.get('fail-fast', True))
+
+    def run_step(self, step):
+        step_type = step.keys()[0]
+        details = step[step_type]
+        func = getattr(self, '%s_step' % step_type)
+        func(details)
+
+    def deploy(self, name, stdout=None):
+        stdout = stdout or sys.stdout
+        steps = self.cfg[name]
+
+        run_step = self.run_step
+        if self.tracer:
+            def run_step(step):
+                with self.tracer.span('step', utils.context.step):
+                    self.run_step(step)
+
+        try:
+            if StepGraph.uses_dependencies(steps):
+                # Checks for cycles and unknown ids before anything runs
+                graph = StepGraph(steps)
+                graph.run(run_step)
+                stdout.write(graph.format_critical_path())
+            else:
+                for idx, step in enumerate(steps):
+                    utils.context.step = step_id(step, idx)
+                    run_step(step)
+        finally:
+            self.close_ssh_connections()
+            stdout.write(self.governor.report())
 
 
 def main(argv=sys.argv[1:], stdout=sys.stdout):
+    def get_token_cache(args):
+        if args.token_cache or os.environ.get('OVERCAST_TOKEN_CACHE'):
+            return TokenCache()
+
+    def get_governor(args):
+        return Governor(rate=args.api_rate, max_in_flight=args.api_max_in_flight)
+
     def deploy(args):
         cfg = load_yaml(args.cfg)
 
@@ -675,40 +1487,71 @@ def main(argv=sys.argv[1:], stdout=sys.stdout):
             with open(args.key, 'r') as fp:
                 key = fp.read()
 
+        if args.log_dir and not os.path.isdir(args.log_dir):
+            os.makedirs(args.log_dir)
+
 
         dr = DeploymentRunner(config=cfg,
                               suffix=args.suffix,
                               mappings=load_mappings(args.mappings),
                               key=key,
-                              retry_count=args.retry_count)
+                              retry_count=args.retry_count,
+                              parallel=args.parallel,
+                              log_dir=args.log_dir,
+                              ssh_multiplexing=not args.no_ssh_multiplexing,
+                              reuse_floating_ips=args.reuse_floating_ips,
+                              token_cache=get_token_cache(args),
+                              polling=PollingPolicy.parse(args.polling),
+                              governor=get_governor(args),
+                              tracer=args.timing_report and Tracer(),
+                              clone_volumes=args.clone_volumes)
 
         if args.cont:
             dr.detect_existing_resources()
 
-        if args.cleanup:
-            with open(args.cleanup, 'a+') as cleanup:
-                def record_resource(type_, id):
-                    cleanup.write('%s: %s\n' % (type_, id))
-                dr.record_resource = record_resource
-
-                dr.deploy(args.name)
-        else:
-            dr.deploy(args.name)
+        try:
+            if args.cleanup:
+                with Journal(args.cleanup) as journal:
+                    def record_resource(type_, id, name=None):
+                        journal.record(type_, id, name=name,
+                                       step=getattr(utils.context, 'step', None))
+                    dr.record_resource = record_resource
+
+                    dr.deploy(args.name, stdout)
+            else:
+                dr.deploy(args.name, stdout)
+        finally:
+            if args.timing_report == '-':
+                stdout.write(dr.tracer.report())
+            elif args.timing_report:
+                with open(args.timing_report, 'w') as fp:
+                    fp.write(dr.tracer.report())
 
     def cleanup(args):
-        dr = DeploymentRunner()
+        dr = DeploymentRunner(token_cache=get_token_cache(args),
+                              governor=get_governor(args))
 
-        with open(args.log, 'r') as fp:
-            lines = [l.strip() for l in fp]
+        resources = [(entry['type'], entry['id']) for entry in read_journal(args.log)]
 
-        lines.reverse()
-        for l in lines:
-            resource_type, uuid = l.split(': ')
-            func = getattr(dr, 'delete_%s' % resource_type)
-            try:
-                func(uuid)
-            except Exception, e:
-                print e
+        keep = () if args.golden_volumes else KEPT_TYPES
+        cleaner = Cleaner(dr, parallel=args.parallel, retries=args.retries, keep=keep)
+        with Journal(args.log) as journal:
+            cleaner.record_deletion = journal.record_deletion
+            failures = cleaner.run(resources)
+
+        for resource_type, uuid, e in failures:
+            print '%s %s: %s' % (resource_type, uuid, e)
+        stdout.write(dr.governor.report())
+
+    def compact(args):
+        kept = compact_journal(args.log)
+        stdout.write('%d resources left in %s\n' % (kept, args.log))
+
+    def add_api_arguments(subparser):
+        subparser.add_argument('--api-rate', type=float,
+                               help='Make at most API_RATE requests per second to each service')
+        subparser.add_argument('--api-max-in-flight', type=int,
+                               help='Have at most API_MAX_IN_FLIGHT API requests in progress at once')
 
     parser = argparse.ArgumentParser(description='Run deployment')
 
@@ -730,16 +1573,57 @@ def main(argv=sys.argv[1:], stdout=sys.stdout):
     deploy_parser.add_argument('--cleanup', help='Cleanup file')
     deploy_parser.add_argument('--retry-count', type=int, default=0,
                                help='Retry RETRY-COUNT times before giving up provisioning a VM')
+    deploy_parser.add_argument('--parallel', type=int, default=1,
+                               help='Build up to PARALLEL nodes concurrently')
+    deploy_parser.add_argument('--log-dir',
+                               help='Store the output of each shell step in LOG_DIR')
+    deploy_parser.add_argument('--no-ssh-multiplexing', action='store_true',
+                               help="Don't share ssh connections between remote shell steps")
+    deploy_parser.add_argument('--reuse-floating-ips', action='store_true',
+                               help='Use floating IPs that already exist in the tenant and are '
+                                    'not associated with anything before allocating new ones')
+    deploy_parser.add_argument('--clone-volumes', action='store_true',
+                               help="Clone nodes' root volumes from a volume made once per image "
+                                    "and size, rather than creating each from the image. The "
+                                    "golden volumes are left behind by cleanup unless it is "
+                                    "given --golden-volumes")
+    deploy_parser.add_argument('--polling', default='',
+                               help='How to poll for volumes and servers, e.g. '
+                                    '"initial=1,maximum=10,factor=2,jitter=0.1"')
+    add_api_arguments(deploy_parser)
+    deploy_parser.add_argument('--timing-report', metavar='FILE',
+                               help='Time steps and API calls, and write a report to FILE '
+                                    '("-" for stdout)')
+    deploy_parser.add_argument('--token-cache', action='store_true',
+                               help='Reuse Keystone tokens across invocations')
     deploy_parser.add_argument('--incremental', dest='cont', action='store_true',
                                help="Don't create resources if identically named ones already exist")
     deploy_parser.add_argument('name', help='Deployment to perform')
 
     cleanup_parser = subparsers.add_parser('cleanup', help='Clean up')
     cleanup_parser.set_defaults(func=cleanup)
+    cleanup_parser.add_argument('--parallel', type=int, default=10,
+                                help='Delete up to PARALLEL resources concurrently')
+    cleanup_parser.add_argument('--retries', type=int, default=8,
+                                help='Retry deleting a resource that is still in use RETRIES '
+                                     'times before giving up')
+    cleanup_parser.add_argument('--golden-volumes', action='store_true',
+                                help='Also delete golden volumes (see deploy --clone-volumes), '
+                                     'which are kept by default')
+    add_api_arguments(cleanup_parser)
+    cleanup_parser.add_argument('--token-cache', action='store_true',
+                                help='Reuse Keystone tokens across invocations')
     cleanup_parser.add_argument('log', help='Clean up log (generated by deploy)')
 
+    compact_parser = subparsers.add_parser('compact-journal',
+                                           help='Drop deleted resources from a clean up log')
+    compact_parser.set_defaults(func=compact)
+    compact_parser.add_argument('log', help='Clean up log (generated by deploy)')
+
     args = parser.parse_args(argv)
 
+    logging.basicConfig(format='%(message)s')
+
     if args.func:
         args.func(args)
 
@@ -0,0 +1,178 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import sys
+import threading
+import time
+
+from overcast import exceptions
+from overcast import utils
+
+def step_details(step):
+    details = step.values()[0]
+    if isinstance(details, dict):
+        return details
+    return {}
+
+def step_id(step, idx):
+    """
+    The id of a step: its `id:` if it has one, otherwise
+    <type>-<position>, e.g. shell-3. idx is 0-based.
+    """
+    return str(step_details(step).get('id', '%s-%d' % (step.keys()[0], idx+1)))
+
+class StepGraph(object):
+    """
+    The steps of a deployment sequence and their dependencies.
+
+    A step can be given an id with `id:` and list the steps it depends
+    on with `after:`. A step without `after:` depends on the step right
+    before it, so a sequence keeps its usual order unless told otherwise.
+    Steps without an id are called <type>-<position>, e.g. shell-3.
+    """
+    def __init__(self, steps):
+        self.steps = steps
+        self.ids = []
+        self.deps = []
+        self.timings = {}
+
+        index_by_id = {}
+        for idx, step in enumerate(steps):
+            this_id = step_id(step, idx)
+            if this_id in index_by_id:
+                raise exceptions.InvalidStepGraphException('Duplicate step id: %s' % (this_id,))
+            index_by_id[this_id] = idx
+            self.ids.append(this_id)
+
+        for idx, step in enumerate(steps):
+            details = step_details(step)
+            if 'after' in details:
+                after = details['after']
+                if isinstance(after, basestring):
+                    after = [after]
+                deps = set()
+                for dep_id in after:
+                    if str(dep_id) not in index_by_id:
+                        raise exceptions.InvalidStepGraphException('Step %s depends on unknown step %s' %
+                                                                   (self.ids[idx], dep_id))
+                    deps.add(index_by_id[str(dep_id)])
+            elif idx > 0:
+                deps = set([idx - 1])
+            else:
+                deps = set()
+            self.deps.append(deps)
+
+        self.order = self._topological_order()
+
+    @staticmethod
+    def uses_dependencies(steps):
+        return any('after' in step_details(step) for step in steps)
+
+    def _topological_order(self):
+        remaining = dict((idx, set(deps)) for idx, deps in enumerate(self.deps))
+        order = []
+        while remaining:
+            ready = sorted(idx for idx, deps in remaining.items() if not deps)
+            if not ready:
+                cycle = ', '.join(self.ids[idx] for idx in sorted(remaining))
+                raise exceptions.InvalidStepGraphException('Dependency cycle between steps: %s' % (cycle,))
+            for idx in ready:
+                del remaining[idx]
+                order.append(idx)
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+    def run(self, func, concurrency=None):
+        """
+        Call func(step) for every step, each as soon as the steps it
+        depends on have finished, with at most `concurrency` running at
+        once. If a step fails, nothing more is started and the first
+        failure is raised once the running steps are done.
+        """
+        cond = threading.Condition()
+        done = set()
+        running = set()
+        errors = []
+        pending = list(self.order)
+
+        def worker(idx):
+            utils.context.step = self.ids[idx]
+            start = time.time()
+            try:
+                func(self.steps[idx])
+                failed = False
+            except Exception:
+                failed = True
+                with cond:
+                    errors.append(sys.exc_info())
+            with cond:
+                self.timings[idx] = (start, time.time())
+                running.discard(idx)
+                if not failed:
+                    done.add(idx)
+                cond.notify_all()
+
+        with cond:
+            while True:
+                if not errors:
+                    for idx in list(pending):
+                        if concurrency and len(running) >= concurrency:
+                            break
+                        if self.deps[idx].issubset(done):
+                            pending.remove(idx)
+                            running.add(idx)
+                            thread = threading.Thread(target=worker, args=(idx,))
+                            thread.daemon = True
+                            thread.start()
+                if not running:
+                    break
+                # With a timeout, so Ctrl-C still works
+                cond.wait(1)
+
+        if errors:
+            exc_type, exc_value, exc_tb = errors[0]
+            raise exc_type, exc_value, exc_tb
+
+    def critical_path(self):
+        """
+        The chain of dependent steps that took the longest in the last
+        run, as a list of (step id, seconds) pairs.
+        """
+        finish = {}
+        previous = {}
+        for idx in self.order:
+            if idx not in self.timings:
+                continue
+            start, end = self.timings[idx]
+            before = [dep for dep in self.deps[idx] if dep in finish]
+            slowest = max(before, key=lambda dep: finish[dep]) if before else None
+            previous[idx] = slowest
+            finish[idx] = (end - start) + (finish[slowest] if slowest is not None else 0)
+
+        if not finish:
+            return []
+
+        path = []
+        idx = max(finish, key=lambda idx: finish[idx])
+        while idx is not None:
+            start, end = self.timings[idx]
+            path.insert(0, (self.ids[idx], end - start))
+            idx = previous[idx]
+        return path
+
+    def format_critical_path(self):
+        path = self.critical_path()
+        return 'Critical path (%.1fs): %s\n' % (sum(duration for _, duration in path),
+                                               ' -> '.join('%s (%.1fs)' % step for step in path))
@@ -0,0 +1,836 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+An in-process stand-in for the Nova, Neutron, Cinder and Keystone APIs,
+as far as DeploymentRunner uses them. Install it in a runner with
+FakeCloud.install() and the runner works against it unmodified, which
+makes it possible to run (and time) large deployments offline.
+
+Every operation can be given a latency distribution, volumes and
+servers become ready asynchronously, errors can be injected and each
+service can be rate limited. All calls are counted.
+"""
+import collections
+import itertools
+import random
+import re
+import threading
+import time
+import uuid
+
+from cinderclient import exceptions as cinder_exceptions
+from neutronclient.common import exceptions as neutron_exceptions
+from novaclient import exceptions as nova_exceptions
+
+from overcast.ratelimit import Governor
+
+def sampler(spec):
+    """
+    Turn a duration spec into a function of a random.Random that
+    returns seconds. A spec is a number (fixed), a (low, high) tuple
+    (uniform), ('lognormal', median, sigma) or a function.
+    """
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, long, float)):
+        return lambda rnd: spec
+    if len(spec) == 2:
+        low, high = spec
+        return lambda rnd: rnd.uniform(low, high)
+    kind, median, sigma = spec
+    if kind != 'lognormal':
+        raise ValueError('Unknown distribution: %s' % (kind,))
+    return lambda rnd: median * rnd.lognormvariate(0, sigma)
+
+def lookup(specs, label, default=None):
+    """
+    Find the spec for an operation like "nova servers.create" in a
+    dict keyed by operation, by service ("nova") or "*".
+    """
+    for key in (label, label.split(' ')[0], '*'):
+        if key in specs:
+            return specs[key]
+    return default
+
+class FakeError(Exception):
+    """
+    Raised by the fake services to reject a request with an HTTP status.
+    """
+    def __init__(self, status_code, message=''):
+        super(FakeError, self).__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+NOVA_ERRORS = {400: nova_exceptions.BadRequest,
+               404: nova_exceptions.NotFound,
+               409: nova_exceptions.Conflict,
+               413: nova_exceptions.OverLimit,
+               429: nova_exceptions.RateLimit}
+
+CINDER_ERRORS = {400: cinder_exceptions.BadRequest,
+                 404: cinder_exceptions.NotFound,
+                 413: cinder_exceptions.OverLimit}
+
+NEUTRON_ERRORS = {400: neutron_exceptions.BadRequest,
+                  404: neutron_exceptions.NotFound,
+                  409: neutron_exceptions.Conflict,
+                  500: neutron_exceptions.InternalServerError,
+                  503: neutron_exceptions.ServiceUnavailable}
+
+def client_exception(service, status_code, message):
+    """
+    The exception the real client library raises for a response with
+    this status.
+    """
+    if service == 'neutron':
+        cls = NEUTRON_ERRORS.get(status_code, neutron_exceptions.NeutronClientException)
+        return cls(message=message, status_code=status_code)
+    if service == 'cinder':
+        cls = CINDER_ERRORS.get(status_code, cinder_exceptions.ClientException)
+    else:
+        cls = NOVA_ERRORS.get(status_code, nova_exceptions.ClientException)
+    return cls(status_code, message=message)
+
+class FakeResponse(object):
+    """
+    What a request to the fake cloud comes back with. It has what the
+    Governor looks at (status_code and headers) and the result of the
+    call or the exception to raise.
+    """
+    def __init__(self, status_code, result=None, message='', headers=None):
+        self.status_code = status_code
+        self.result = result
+        self.message = message
+        self.headers = headers or {}
+
+class Limit(object):
+    """
+    A service's rate limit: `rate` requests per second, with bursts of
+    up to `burst`. Unlike ratelimit.TokenBucket, requests over the
+    limit are turned away rather than queued.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = None
+
+    def admit(self, now):
+        """
+        Returns 0 if the request is allowed, otherwise the number of
+        seconds until it would be.
+        """
+        if self.updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class Resource(object):
+    """
+    A snapshot of a resource, like the objects novaclient and
+    cinderclient return.
+    """
+    def __init__(self, info):
+        self._info = info
+        for key, value in info.items():
+            setattr(self, key, value)
+
+    def to_dict(self):
+        return dict(self._info)
+
+    def __repr__(self):
+        return '<Resource %s>' % (self._info,)
+
+class FakeCloud(object):
+    """
+    The state of the fake cloud and the behaviour of its APIs.
+
+    latency: dict of operation ("nova servers.create"), service ("nova")
+        or "*" to a duration spec (see sampler()) for every request.
+    build_times: dict of 'volume' and 'server' to duration specs for
+        how long they take to become available/ACTIVE.
+    delete_time: duration spec for how long deleted servers take to
+        disappear.
+    failure_rates: dict of 'volume' and 'server' to the fraction that
+        end up in error rather than ready.
+    errors: dict of operation, service or "*" to the fraction of
+        requests that fail with a 500.
+    rate_limits: dict of service to a requests per second limit, or a
+        (rate, burst) tuple. Requests over it get a 429 with a
+        Retry-After header.
+    flavors, images: ids of the flavors and images that exist. If not
+        given, any id does.
+    governor: what requests are sent through, like the real clients'
+        requests are by ratelimit.GovernedSession. install() replaces it
+        with the runner's.
+    """
+    def __init__(self, latency=None, build_times=None, delete_time=0, failure_rates=None,
+                 errors=None, rate_limits=None, flavors=None, images=None, seed=None,
+                 governor=None):
+        self.latency = dict((key, sampler(spec)) for key, spec in (latency or {}).items())
+        build_times = build_times or {}
+        self.build_times = {'volume': sampler(build_times.get('volume', 0)),
+                            'server': sampler(build_times.get('server', 0))}
+        self.delete_time = sampler(delete_time)
+        self.failure_rates = failure_rates or {}
+        self.errors = errors or {}
+        self.limits = {}
+        for service, limit in (rate_limits or {}).items():
+            if isinstance(limit, tuple):
+                self.limits[service] = Limit(*limit)
+            else:
+                self.limits[service] = Limit(limit)
+        self.flavors = flavors
+        self.images = images
+        self.random = random.Random(seed)
+        self.governor = governor or Governor()
+
+        self.calls = collections.Counter()
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.ips = itertools.count(10)
+
+        self.servers = collections.OrderedDict()
+        self.deleted_servers = set()
+        self.volumes = collections.OrderedDict()
+        self.keypairs = {}
+        self.networks = collections.OrderedDict()
+        self.subnets = collections.OrderedDict()
+        self.ports = collections.OrderedDict()
+        self.security_groups = collections.OrderedDict()
+        self.security_group_rules = collections.OrderedDict()
+        self.floatingips = collections.OrderedDict()
+        self.routers = collections.OrderedDict()
+
+        # Every tenant has somewhere to get floating IPs from and a
+        # router to plug its subnets into
+        self.external_network = self._new_id()
+        self.networks[self.external_network] = {'id': self.external_network, 'name': 'public',
+                                                'admin_state_up': True, 'router:external': True,
+                                                'subnets': []}
+        self.router = self._new_id()
+        self.routers[self.router] = {'id': self.router, 'name': 'router'}
+
+        self.nova = FakeNova(self)
+        self.cinder = FakeCinder(self)
+        self.neutron = FakeNeutron(self)
+        self.keystone = FakeKeystone(self)
+
+    def install(self, runner):
+        """
+        Make a DeploymentRunner use the fake cloud instead of a real one.
+        """
+        self.governor = runner.governor
+        with runner.conncache_lock:
+            runner.conncache['keystone_session'] = self.keystone
+            runner.conncache['keystone'] = self.keystone
+            runner.conncache['nova'] = runner._traced(self.nova, 'nova')
+            runner.conncache['cinder'] = runner._traced(self.cinder, 'cinder')
+            runner.conncache['neutron'] = runner._traced(self.neutron, 'neutron')
+
+    def _new_id(self):
+        return str(uuid.UUID(int=next(self.ids)))
+
+    def _new_ip(self, prefix='10.0'):
+        n = next(self.ips)
+        return '%s.%d.%d' % (prefix, n // 250 % 250, n % 250 + 2)
+
+    def _sample(self, func):
+        with self.lock:
+            return func(self.random)
+
+    def _chance(self, rate):
+        if not rate:
+            return False
+        with self.lock:
+            return self.random.random() < rate
+
+    def request(self, service, operation, func):
+        """
+        Make a request: count it, wait out its latency and then, unless
+        it's rate limited or an error is injected, call func() with the
+        cloud locked. What func() returns is returned. Errors are raised
+        as the exceptions the real client library would raise.
+        """
+        label = '%s %s' % (service, operation)
+        response = self.governor.call(service, lambda: self._respond(service, label, func))
+        if response.status_code >= 400:
+            raise client_exception(service, response.status_code, response.message)
+        return response.result
+
+    def _respond(self, service, label, func):
+        with self.lock:
+            self.calls[label] += 1
+
+        latency = lookup(self.latency, label)
+        if latency:
+            time.sleep(self._sample(latency))
+
+        with self.lock:
+            limit = self.limits.get(service)
+            if limit:
+                wait = limit.admit(time.time())
+                if wait:
+                    return FakeResponse(429, message='Rate limit exceeded',
+                                        headers={'Retry-After': '%.3f' % (wait,)})
+
+        if self._chance(lookup(self.errors, label)):
+            return FakeResponse(500, message='Injected failure: %s' % (label,))
+
+        with self.lock:
+            self._expire(time.time())
+            try:
+                return FakeResponse(200, result=func())
+            except FakeError, e:
+                return FakeResponse(e.status_code, message=e.message)
+
+    def _expire(self, now):
+        """
+        Remove the servers whose deletion has completed, releasing
+        their ports and volumes.
+        """
+        for server in self.servers.values():
+            if server['deleted_at'] is not None and server['deleted_at'] <= now:
+                del self.servers[server['id']]
+                self.deleted_servers.add(server['id'])
+                for port in self.ports.values():
+                    if port['device_id'] == server['id']:
+                        port['device_id'] = ''
+                        port['device_owner'] = ''
+                if server['volume_id'] in self.volumes:
+                    self.volumes[server['volume_id']]['attached_to'] = None
+
+    def volume_status(self, volume, now):
+        if volume['ready_at'] > now:
+            return 'creating'
+        if volume['failed']:
+            return 'error'
+        if volume['attached_to']:
+            return 'in-use'
+        return 'available'
+
+    def server_status(self, server, now):
+        if server['ready_at'] > now:
+            return 'BUILD'
+        if server['failed']:
+            return 'ERROR'
+        return 'ACTIVE'
+
+    def counts(self):
+        """
+        The number of each type of resource in the cloud, not counting
+        those it started out with.
+        """
+        with self.lock:
+            self._expire(time.time())
+            return {'server': len(self.servers),
+                    'volume': len(self.volumes),
+                    'keypair': len(self.keypairs),
+                    'network': len(self.networks) - 1,
+                    'subnet': len(self.subnets),
+                    'port': len([port for port in self.ports.values()
+                                 if port['device_owner'] != 'network:router_interface']),
+                    'secgroup': len(self.security_groups),
+                    'secgroup_rule': len(self.security_group_rules),
+                    'floatingip': len(self.floatingips)}
+
+def filter_items(items, filters):
+    """
+    Neutron style filtering: a list value matches any of its elements.
+    """
+    for key, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            items = [item for item in items if item.get(key) in value]
+        else:
+            items = [item for item in items if item.get(key) == value]
+    return items
+
+def after_marker(items, marker, deleted=()):
+    """
+    The items after the one with id `marker`. Like Nova, which looks
+    markers up with read_deleted='yes', a deleted item (one of
+    `deleted`) is still a valid marker. Ids are handed out in order,
+    so the items after it are those with greater ids.
+    """
+    if marker is None:
+        return items
+    ids = [item['id'] for item in items]
+    if marker in ids:
+        return items[ids.index(marker)+1:]
+    if marker in deleted:
+        return [item for item in items if item['id'] > marker]
+    raise FakeError(400, 'marker [%s] not found' % (marker,))
+
+class FakeNovaManager(object):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def _request(self, operation, func):
+        return self.cloud.request('nova', operation, func)
+
+class FakeServers(FakeNovaManager):
+    def _server(self, server):
+        cloud = self.cloud
+        addresses = {}
+        for port_id in server['port_ids']:
+            port = cloud.ports.get(port_id)
+            if port is None:
+                continue
+            network = cloud.networks.get(port['network_id'], {}).get('name', port['network_id'])
+            addresses.setdefault(network, []).append({'addr': port['fixed_ips'][0]['ip_address'],
+                                                      'version': 4,
+                                                      'OS-EXT-IPS-MAC:mac_addr': port['mac_address']})
+        return Resource({'id': server['id'],
+                         'name': server['name'],
+                         'status': cloud.server_status(server, time.time()),
+                         'addresses': addresses})
+
+    def _get(self, server_id):
+        if server_id not in self.cloud.servers:
+            raise FakeError(404, 'Instance %s could not be found.' % (server_id,))
+        return self.cloud.servers[server_id]
+
+    def create(self, name, image, flavor, block_device_mapping=None, nics=None,
+               key_name=None, userdata=None, **kwargs):
+        cloud = self.cloud
+        def create():
+            flavor_id = getattr(flavor, 'id', flavor)
+            if cloud.flavors is not None and flavor_id not in cloud.flavors:
+                raise FakeError(400, 'Flavor %s could not be found.' % (flavor_id,))
+            if key_name and key_name not in cloud.keypairs:
+                raise FakeError(400, 'Invalid key_name provided.')
+
+            volume_id = None
+            for mapping in (block_device_mapping or {}).values():
+                volume_id = mapping.split(':')[0]
+                volume = cloud.volumes.get(volume_id)
+                if volume is None or cloud.volume_status(volume, time.time()) != 'available':
+                    raise FakeError(400, 'Volume %s is not available.' % (volume_id,))
+
+            port_ids = []
+            for nic in nics or []:
+                port = cloud.ports.get(nic.get('port-id'))
+                if port is None:
+                    raise FakeError(404, 'Port %s could not be found.' % (nic.get('port-id'),))
+                if port['device_id']:
+                    raise FakeError(409, 'Port %s is still in use.' % (port['id'],))
+                port_ids.append(port['id'])
+
+            server_id = cloud._new_id()
+            now = time.time()
+            server = {'id': server_id,
+                      'name': name,
+                      'flavor': flavor_id,
+                      'key_name': key_name,
+                      'volume_id': volume_id,
+                      'port_ids': port_ids,
+                      'ready_at': now + cloud._sample(cloud.build_times['server']),
+                      'failed': cloud._chance(cloud.failure_rates.get('server')),
+                      'deleted_at': None}
+            cloud.servers[server_id] = server
+            if volume_id:
+                cloud.volumes[volume_id]['attached_to'] = server_id
+            for port_id in port_ids:
+                cloud.ports[port_id]['device_id'] = server_id
+                cloud.ports[port_id]['device_owner'] = 'compute:nova'
+            return self._server(server)
+        return self._request('servers.create', create)
+
+    def get(self, server_id):
+        return self._request('servers.get', lambda: self._server(self._get(server_id)))
+
+    def list(self, detailed=True, search_opts=None, marker=None, limit=None):
+        def list_():
+            servers = list(self.cloud.servers.values())
+            name = (search_opts or {}).get('name')
+            if name:
+                servers = [server for server in servers if re.search(name, server['name'])]
+            servers = after_marker(servers, marker, self.cloud.deleted_servers)
+            if limit is not None:
+                servers = servers[:limit]
+            return [self._server(server) for server in servers]
+        return self._request('servers.list', list_)
+
+    def delete(self, server_id):
+        def delete():
+            server = self._get(server_id)
+            if server['deleted_at'] is None:
+                server['deleted_at'] = time.time() + self.cloud._sample(self.cloud.delete_time)
+        return self._request('servers.delete', delete)
+
+class FakeFlavors(FakeNovaManager):
+    def get(self, flavor_id):
+        def get():
+            if self.cloud.flavors is not None and flavor_id not in self.cloud.flavors:
+                raise FakeError(404, 'Flavor %s could not be found.' % (flavor_id,))
+            return Resource({'id': flavor_id, 'name': flavor_id})
+        return self._request('flavors.get', get)
+
+class FakeImages(FakeNovaManager):
+    def get(self, image_id):
+        def get():
+            if self.cloud.images is not None and image_id not in self.cloud.images:
+                raise FakeError(404, 'Image %s could not be found.' % (image_id,))
+            return Resource({'id': image_id, 'name': image_id})
+        return self._request('images.get', get)
+
+class FakeKeypairs(FakeNovaManager):
+    def create(self, name, public_key=None):
+        def create():
+            if name in self.cloud.keypairs:
+                raise FakeError(409, 'Key pair %s already exists.' % (name,))
+            self.cloud.keypairs[name] = public_key
+            return Resource({'id': name, 'name': name})
+        return self._request('keypairs.create', create)
+
+    def delete(self, name):
+        def delete():
+            if self.cloud.keypairs.pop(name, None) is None:
+                raise FakeError(404, 'Keypair %s not found.' % (name,))
+        return self._request('keypairs.delete', delete)
+
+class FakeNova(object):
+    def __init__(self, cloud):
+        self.servers = FakeServers(cloud)
+        self.flavors = FakeFlavors(cloud)
+        self.images = FakeImages(cloud)
+        self.keypairs = FakeKeypairs(cloud)
+
+class FakeVolumes(object):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def _request(self, operation, func):
+        return self.cloud.request('cinder', operation, func)
+
+    def _volume(self, volume):
+        return Resource({'id': volume['id'],
+                         'display_name': volume['display_name'],
+                         'metadata': volume['metadata'],
+                         'size': volume['size'],
+                         'status': self.cloud.volume_status(volume, time.time())})
+
+    def _get(self, volume_id):
+        if volume_id not in self.cloud.volumes:
+            raise FakeError(404, 'Volume %s could not be found.' % (volume_id,))
+        return self.cloud.volumes[volume_id]
+
+    def create(self, size, imageRef=None, source_volid=None, display_name=None, metadata=None,
+               **kwargs):
+        cloud = self.cloud
+        def create():
+            if source_volid is not None:
+                source = self._get(source_volid)
+                if cloud.volume_status(source, time.time()) not in ('available', 'in-use'):
+                    raise FakeError(400, 'Volume %s is not available.' % (source_volid,))
+            elif cloud.images is not None and imageRef not in cloud.images:
+                raise FakeError(400, 'Image %s could not be found.' % (imageRef,))
+
+            volume = {'id': cloud._new_id(),
+                      'display_name': display_name,
+                      'metadata': dict(metadata or {}),
+                      'size': size,
+                      'image': imageRef,
+                      'source_volid': source_volid,
+                      'ready_at': time.time() + cloud._sample(cloud.build_times['volume']),
+                      'failed': cloud._chance(cloud.failure_rates.get('volume')),
+                      'attached_to': None}
+            cloud.volumes[volume['id']] = volume
+            return self._volume(volume)
+        return self._request('volumes.create', create)
+
+    def get(self, volume_id):
+        return self._request('volumes.get', lambda: self._volume(self._get(volume_id)))
+
+    def list(self, detailed=True, search_opts=None):
+        def list_():
+            volumes = self.cloud.volumes.values()
+            for key, value in (search_opts or {}).items():
+                if key == 'metadata':
+                    # Volumes that have (at least) the given metadata
+                    volumes = [volume for volume in volumes
+                               if all(volume['metadata'].get(k) == v for k, v in value.items())]
+                else:
+                    volumes = [volume for volume in volumes if volume.get(key) == value]
+            return [self._volume(volume) for volume in volumes]
+        return self._request('volumes.list', list_)
+
+    def delete(self, volume_id):
+        def delete():
+            volume = self._get(volume_id)
+            if volume['attached_to']:
+                raise FakeError(400, 'Volume %s is still attached.' % (volume_id,))
+            del self.cloud.volumes[volume_id]
+        return self._request('volumes.delete', delete)
+
+class FakeCinder(object):
+    def __init__(self, cloud):
+        self.volumes = FakeVolumes(cloud)
+
+class FakeNeutron(object):
+    """
+    The parts of neutronclient.v2_0.client.Client the runner uses.
+    """
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def _request(self, operation, func):
+        return self.cloud.request('neutron', operation, func)
+
+    def _get(self, collection, kind, id):
+        items = getattr(self.cloud, collection)
+        if id not in items:
+            raise FakeError(404, '%s %s could not be found.' % (kind, id))
+        return items[id]
+
+    def _list(self, operation, collection, retrieve_all=True, limit=None, fields=None, **filters):
+        def page(marker):
+            items = filter_items(getattr(self.cloud, collection).values(), filters)
+            items = after_marker(items, marker)
+            if limit:
+                items = items[:limit]
+            return list(items)
+
+        def project(items):
+            if fields:
+                return [dict((key, item[key]) for key in fields) for item in items]
+            return [dict(item) for item in items]
+
+        if retrieve_all:
+            return {collection: project(self._request(operation, lambda: page(None)))}
+
+        def pages():
+            marker = None
+            while True:
+                items = self._request(operation, lambda: page(marker))
+                yield {collection: project(items)}
+                if not limit or len(items) < limit:
+                    return
+                marker = items[-1]['id']
+        return pages()
+
+    def list_networks(self, **kwargs):
+        return self._list('list_networks', 'networks', **kwargs)
+
+    def list_ports(self, **kwargs):
+        return self._list('list_ports', 'ports', **kwargs)
+
+    def list_security_groups(self, **kwargs):
+        return self._list('list_security_groups', 'security_groups', **kwargs)
+
+    def list_floatingips(self, **kwargs):
+        return self._list('list_floatingips', 'floatingips', **kwargs)
+
+    def create_network(self, body):
+        cloud = self.cloud
+        def create():
+            network = dict(body['network'], id=cloud._new_id(), subnets=[])
+            network.setdefault('router:external', False)
+            cloud.networks[network['id']] = network
+            return {'network': dict(network)}
+        return self._request('create_network', create)
+
+    def delete_network(self, network_id):
+        cloud = self.cloud
+        def delete():
+            self._get('networks', 'Network', network_id)
+            if filter_items(cloud.ports.values(), {'network_id': network_id}):
+                raise FakeError(409, 'Network %s has ports in use.' % (network_id,))
+            for subnet_id in cloud.networks.pop(network_id)['subnets']:
+                del cloud.subnets[subnet_id]
+        return self._request('delete_network', delete)
+
+    def create_subnet(self, body):
+        cloud = self.cloud
+        def create():
+            subnet = dict(body['subnet'], id=cloud._new_id())
+            network = self._get('networks', 'Network', subnet['network_id'])
+            network['subnets'].append(subnet['id'])
+            cloud.subnets[subnet['id']] = subnet
+            return {'subnet': dict(subnet)}
+        return self._request('create_subnet', create)
+
+    def delete_subnet(self, subnet_id):
+        cloud = self.cloud
+        def delete():
+            subnet = self._get('subnets', 'Subnet', subnet_id)
+            for port in cloud.ports.values():
+                if any(fixed_ip['subnet_id'] == subnet_id for fixed_ip in port['fixed_ips']):
+                    raise FakeError(409, 'Subnet %s has ports in use.' % (subnet_id,))
+            cloud.networks[subnet['network_id']]['subnets'].remove(subnet_id)
+            del cloud.subnets[subnet_id]
+        return self._request('delete_subnet', delete)
+
+    def add_interface_router(self, router_id, body):
+        def add():
+            self._get('routers', 'Router', router_id)
+            subnet = self._get('subnets', 'Subnet', body['subnet_id'])
+            port = self._new_port({'network_id': subnet['network_id']})
+            port['device_id'] = router_id
+            port['device_owner'] = 'network:router_interface'
+            return {'id': router_id, 'subnet_id': subnet['id'], 'port_id': port['id']}
+        return self._request('add_interface_router', add)
+
+    def remove_interface_router(self, router_id, body):
+        cloud = self.cloud
+        def remove():
+            for port in filter_items(cloud.ports.values(),
+                                     {'device_id': router_id,
+                                      'device_owner': 'network:router_interface'}):
+                if port['fixed_ips'][0]['subnet_id'] == body['subnet_id']:
+                    del cloud.ports[port['id']]
+                    return {'id': router_id, 'subnet_id': body['subnet_id']}
+            raise FakeError(404, 'Router %s has no interface on subnet %s.' %
+                            (router_id, body['subnet_id']))
+        return self._request('remove_interface_router', remove)
+
+    def delete_router(self, router_id):
+        cloud = self.cloud
+        def delete():
+            self._get('routers', 'Router', router_id)
+            if filter_items(cloud.ports.values(), {'device_id': router_id}):
+                raise FakeError(409, 'Router %s still has ports.' % (router_id,))
+            del cloud.routers[router_id]
+        return self._request('delete_router', delete)
+
+    def _new_port(self, body):
+        cloud = self.cloud
+        network = self._get('networks', 'Network', body['network_id'])
+        for secgroup_id in body.get('security_groups') or []:
+            self._get('security_groups', 'Security group', secgroup_id)
+        subnet_id = network['subnets'][0] if network['subnets'] else None
+        port = dict(body,
+                    id=cloud._new_id(),
+                    mac_address='fa:16:3e:%02x:%02x:%02x' % tuple(cloud.random.randint(0, 255)
+                                                                  for _ in range(3)),
+                    fixed_ips=[{'subnet_id': subnet_id, 'ip_address': cloud._new_ip()}],
+                    device_id='',
+                    device_owner='')
+        port.setdefault('security_groups', [])
+        cloud.ports[port['id']] = port
+        return port
+
+    def create_port(self, body):
+        def create():
+            if 'ports' in body:
+                return {'ports': [dict(self._new_port(port)) for port in body['ports']]}
+            return {'port': dict(self._new_port(body['port']))}
+        return self._request('create_port', create)
+
+    def delete_port(self, port_id):
+        cloud = self.cloud
+        def delete():
+            port = self._get('ports', 'Port', port_id)
+            if port['device_owner'] == 'network:router_interface':
+                raise FakeError(409, 'Port %s is a router interface.' % (port_id,))
+            for fip in cloud.floatingips.values():
+                if fip['port_id'] == port_id:
+                    fip['port_id'] = None
+            del cloud.ports[port_id]
+        return self._request('delete_port', delete)
+
+    def create_security_group(self, body):
+        cloud = self.cloud
+        def create():
+            secgroup = dict(body['security_group'], id=cloud._new_id())
+            cloud.security_groups[secgroup['id']] = secgroup
+            return {'security_group': dict(secgroup, security_group_rules=[])}
+        return self._request('create_security_group', create)
+
+    def delete_security_group(self, secgroup_id):
+        cloud = self.cloud
+        def delete():
+            self._get('security_groups', 'Security group', secgroup_id)
+            for port in cloud.ports.values():
+                if secgroup_id in port['security_groups']:
+                    raise FakeError(409, 'Security group %s is in use.' % (secgroup_id,))
+            del cloud.security_groups[secgroup_id]
+            for rule in cloud.security_group_rules.values():
+                if rule['security_group_id'] == secgroup_id:
+                    del cloud.security_group_rules[rule['id']]
+        return self._request('delete_security_group', delete)
+
+    def create_security_group_rule(self, body):
+        cloud = self.cloud
+        def create_rule(rule):
+            self._get('security_groups', 'Security group', rule['security_group_id'])
+            rule = dict(rule, id=cloud._new_id())
+            cloud.security_group_rules[rule['id']] = rule
+            return dict(rule)
+
+        def create():
+            if 'security_group_rules' in body:
+                return {'security_group_rules': [create_rule(rule)
+                                                 for rule in body['security_group_rules']]}
+            return {'security_group_rule': create_rule(body['security_group_rule'])}
+        return self._request('create_security_group_rule', create)
+
+    def delete_security_group_rule(self, rule_id):
+        def delete():
+            self._get('security_group_rules', 'Security group rule', rule_id)
+            del self.cloud.security_group_rules[rule_id]
+        return self._request('delete_security_group_rule', delete)
+
+    def create_floatingip(self, body):
+        cloud = self.cloud
+        def create():
+            network = self._get('networks', 'Network', body['floatingip']['floating_network_id'])
+            if not network.get('router:external'):
+                raise FakeError(400, 'Network %s is not external.' % (network['id'],))
+            fip = dict(body['floatingip'],
+                       id=cloud._new_id(),
+                       floating_ip_address=cloud._new_ip('172.24'),
+                       port_id=None)
+            cloud.floatingips[fip['id']] = fip
+            return {'floatingip': dict(fip)}
+        return self._request('create_floatingip', create)
+
+    def update_floatingip(self, fip_id, body):
+        def update():
+            fip = self._get('floatingips', 'Floating IP', fip_id)
+            port_id = body['floatingip'].get('port_id')
+            if port_id is not None:
+                self._get('ports', 'Port', port_id)
+            fip['port_id'] = port_id
+            return {'floatingip': dict(fip)}
+        return self._request('update_floatingip', update)
+
+    def delete_floatingip(self, fip_id):
+        def delete():
+            self._get('floatingips', 'Floating IP', fip_id)
+            del self.cloud.floatingips[fip_id]
+        return self._request('delete_floatingip', delete)
+
+class FakeKeystone(object):
+    """
+    Stands in for both the Keystone session and client. Nothing else
+    is needed of them once the other clients exist.
+    """
+    def __init__(self, cloud):
+        self.cloud = cloud
+        self.token = None
+
+    def get_token(self):
+        if self.token is None:
+            self.token = self.cloud.request('keystone', 'tokens.authenticate',
+                                            lambda: uuid.uuid4().hex)
+        return self.token
+
+    @property
+    def auth_token(self):
+        return self.get_token()
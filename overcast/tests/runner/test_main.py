@@ -14,12 +14,21 @@
 #   limitations under the License.
 from contextlib import nested
 import mock
+from novaclient.exceptions import NotFound as NovaNotFound
 import os.path
+import re
+import shutil
+import tempfile
+import time
 import unittest
 from StringIO import StringIO
 import yaml
 
+import overcast.output
 import overcast.runner
+from overcast import exceptions
+from overcast import utils
+from overcast.tracing import Tracer, TracedObject
 
 yaml_data = '''---
 foo:
@@ -87,6 +96,7 @@ class NodeTests(unittest.TestCase):
             def status(self):
                 return self.statuses.pop()
 
+        cinderclient.volumes.create.return_value.id = 'voluuid'
         cinderclient.volumes.get.return_value = Volume('voluuid')
         create_nics.return_value = ['portuuid1', 'portuuid2']
 
@@ -101,6 +111,41 @@ class NodeTests(unittest.TestCase):
                                                      block_device_mapping={'vda': 'voluuid:::1'},
                                                      key_name=None, flavor='flavor_obj')
 
+    @mock.patch('overcast.runner.DeploymentRunner.get_nova_client')
+    def test_poll_with_statuses(self, get_nova_client):
+        nc = get_nova_client.return_value
+        self.node.server_id = 'someuuid'
+
+        self.assertEquals(self.node.poll(statuses={'someuuid': 'BUILD'}), 'BUILD')
+        self.assertEquals(self.node.poll(statuses={'someuuid': 'ACTIVE'}), 'ACTIVE')
+        self.assertFalse(nc.servers.get.called)
+
+        # Not in the listing, so ask nova directly
+        self.node.server_status = None
+        nc.servers.get.return_value.status = 'ERROR'
+        self.assertEquals(self.node.poll(statuses={}), 'ERROR')
+        nc.servers.get.assert_called_with('someuuid')
+
+    @mock.patch('overcast.runner.DeploymentRunner.get_cinder_client')
+    def test_create_volume(self, get_cinder_client):
+        cc = get_cinder_client.return_value
+        cc.volumes.create.return_value.id = 'voluuid'
+        cc.volumes.create.return_value.status = 'creating'
+        self.node.info['image'] = 'someimage'
+        self.node.info['disk'] = 10
+
+        self.node.create_volume()
+
+        cc.volumes.create.assert_called_once_with(size=10, imageRef='someimage',
+                                                  display_name='root-%s' % (self.node.name,),
+                                                  metadata={'overcast_root_volume': 'root'})
+        self.assertEquals(self.node.volume_id, 'voluuid')
+
+        self.assertEquals(self.node.poll_volume(statuses={'voluuid': 'downloading'}), 'downloading')
+        self.assertEquals(self.node.poll_volume(statuses={'voluuid': 'available'}), 'available')
+        self.assertEquals(self.node.poll_volume(), 'available')
+        self.assertFalse(cc.volumes.get.called)
+
     def test_floating_ip(self):
         self.node.ports = [{'floating_ip': '1.2.3.4'}]
         self.assertEquals(self.node.floating_ip, '1.2.3.4')
@@ -126,6 +171,36 @@ class NodeTests(unittest.TestCase):
         delete_server.assert_any_call('serveruuid')
         self.assertEquals(self.node.server_id, None)
 
+    @mock.patch('overcast.runner.DeploymentRunner.delete_server')
+    @mock.patch('overcast.runner.DeploymentRunner.delete_port')
+    @mock.patch('overcast.runner.DeploymentRunner.find_floating_network')
+    @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
+    def test_clean_reused_floating_ip(self, get_neutron_client, find_floating_network,
+                                      delete_port, delete_server):
+        nc = get_neutron_client.return_value
+        find_floating_network.return_value = 'netuuid'
+        nc.list_floatingips.return_value = {'floatingips': [{'id': 'free', 'floating_ip_address': '1.1.1.2',
+                                                             'port_id': None}]}
+        self.dr.reuse_floating_ips = True
+        self.dr.preallocate_floating_ips(1)
+        networks = [{'network': 'network1', 'assign_floating_ip': True}]
+        self.node.prepared_ports = [{'id': 'port1uuid'}]
+        self.node.create_nics(networks)
+        self.node.server_id = 'serveruuid'
+
+        self.node.clean()
+
+        # Not ours, so it's only disassociated and can be used again
+        self.assertFalse(nc.delete_floatingip.called)
+        nc.update_floatingip.assert_called_with('free', {'floatingip': {'port_id': None}})
+        self.assertEquals(self.dr.floating_ip_pool, [('free', '1.1.1.2')])
+
+        self.node.prepared_ports = [{'id': 'port2uuid'}]
+        self.node.create_nics(networks)
+        nc.update_floatingip.assert_called_with('free', {'floatingip': {'port_id': 'port2uuid'}})
+        self.assertEquals(self.node.floating_ip, '1.1.1.2')
+        self.assertFalse(nc.create_floatingip.called)
+
     @mock.patch('overcast.runner.DeploymentRunner.create_port')
     @mock.patch('overcast.runner.DeploymentRunner.create_floating_ip')
     @mock.patch('overcast.runner.DeploymentRunner.associate_floating_ip')
@@ -149,6 +224,18 @@ class NodeTests(unittest.TestCase):
 
         self.assertEquals(nics, ['port1uuid', 'port2uuid'])
 
+    @mock.patch('overcast.runner.DeploymentRunner.create_port')
+    def test_create_nics_prepared_ports(self, create_port):
+        self.node.prepared_ports = [{'id': 'port1uuid'}, {'id': 'port2uuid'}]
+
+        nics = self.node.create_nics([{'network': 'network1'},
+                                      {'network': 'network2'}])
+
+        self.assertFalse(create_port.called)
+        self.assertEquals(nics, ['port1uuid', 'port2uuid'])
+        self.assertEquals(self.node.ports, [{'id': 'port1uuid'}, {'id': 'port2uuid'}])
+        self.assertEquals(self.node.prepared_ports, None)
+
 
 class MainTests(unittest.TestCase):
     def setUp(self):
@@ -161,6 +248,34 @@ class MainTests(unittest.TestCase):
                               {'foo': ['bar', {'baz': {'wibble': []}}]})
             m.assert_called_once_with('.overcast.yaml', 'r')
 
+    def test_load_yaml_safe(self):
+        with mock.patch('__builtin__.open') as m:
+            m.return_value.__enter__.return_value = StringIO('foo: !!python/name:os.system\n')
+            self.assertRaises(yaml.YAMLError, overcast.runner.load_yaml)
+
+    def test_load_yaml_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            stack_file = os.path.join(tmpdir, 'stack.yaml')
+            cache_dir = os.path.join(tmpdir, 'cache')
+            with open(stack_file, 'w') as fp:
+                fp.write(yaml_data)
+
+            expected = {'foo': ['bar', {'baz': {'wibble': []}}]}
+            self.assertEquals(overcast.runner.load_yaml(stack_file, cache_dir=cache_dir), expected)
+            self.assertEquals(len(os.listdir(cache_dir)), 1)
+
+            with mock.patch('overcast.runner.yaml.load') as yaml_load:
+                self.assertEquals(overcast.runner.load_yaml(stack_file, cache_dir=cache_dir), expected)
+                self.assertFalse(yaml_load.called)
+
+            with open(stack_file, 'a') as fp:
+                fp.write('bar: 1\n')
+            self.assertEquals(overcast.runner.load_yaml(stack_file, cache_dir=cache_dir)['bar'], 1)
+            self.assertEquals(len(os.listdir(cache_dir)), 2)
+        finally:
+            shutil.rmtree(tmpdir)
+
     def test_load_mappings(self):
         with mock.patch('__builtin__.open') as m:
             m.return_value.__enter__.return_value = StringIO(mappings_data)
@@ -208,18 +323,112 @@ class MainTests(unittest.TestCase):
                                                             environment={},
                                                             deadline=deadline)
 
+    def test_run_cmd_once_subsecond_timeout(self):
+        start = time.time()
+        self.assertRaises(overcast.exceptions.CommandTimedOutException,
+                          overcast.runner.run_cmd_once, shell_cmd='bash',
+                                                        real_cmd='sleep 10',
+                                                        environment={},
+                                                        deadline=start + 0.2)
+        self.assertLess(time.time() - start, 1)
+
+    def test_run_cmd_once_large_cmd(self):
+        overcast.runner.run_cmd_once(shell_cmd='bash',
+                                     real_cmd='true ' + 'x' * 200000,
+                                     environment={},
+                                     deadline=None)
+
+    def test_run_cmd_once_stdin_not_read(self):
+        self.assertRaises(overcast.exceptions.CommandFailedException,
+                          overcast.runner.run_cmd_once, shell_cmd='exit 1',
+                                                        real_cmd='x' * 200000,
+                                                        environment={},
+                                                        deadline=None)
+
+    def test_run_cmd_once_captures_output(self):
+        output = overcast.output.OutputBuffer()
+        overcast.runner.run_cmd_once(shell_cmd='bash',
+                                     real_cmd='echo foo; echo bar >&2',
+                                     environment={},
+                                     deadline=None,
+                                     output=output)
+        self.assertEquals(output.tail(), 'foo\nbar\n')
+
+    def test_shell_step_keeps_stderr_apart(self):
+        stdout, stderr = StringIO(), StringIO()
+        with mock.patch('sys.stdout', stdout), mock.patch('sys.stderr', stderr):
+            try:
+                self.dr.shell_step({'cmd': 'echo foo; sleep 0.1; echo bar >&2; sleep 0.1; echo baz; false'}, {})
+            except overcast.exceptions.CommandFailedException, e:
+                # Both streams end up in the output kept for failures
+                self.assertEquals(e.output, 'foo\nbar\nbaz\n')
+            else:
+                self.fail('CommandFailedException not raised')
+
+        self.assertEquals(stdout.getvalue(), 'foo\nbaz\n')
+        self.assertEquals(stderr.getvalue(), 'bar\n')
+
+    def test_run_cmd_once_failure_carries_output(self):
+        output = overcast.output.OutputBuffer()
+        try:
+            overcast.runner.run_cmd_once(shell_cmd='bash',
+                                         real_cmd='echo it broke; false',
+                                         environment={},
+                                         deadline=None,
+                                         output=output)
+        except overcast.exceptions.CommandFailedException, e:
+            self.assertEquals(e.output, 'it broke\n')
+        else:
+            self.fail('CommandFailedException not raised')
+
+    def test_run_cmd_once_timeout_carries_output(self):
+        output = overcast.output.OutputBuffer()
+        try:
+            overcast.runner.run_cmd_once(shell_cmd='bash',
+                                         real_cmd='echo waiting; sleep 10',
+                                         environment={},
+                                         deadline=time.time() + 0.5,
+                                         output=output)
+        except overcast.exceptions.CommandTimedOutException, e:
+            self.assertEquals(e.output, 'waiting\n')
+        else:
+            self.fail('CommandTimedOutException not raised')
+
+    def test_run_cmd_once_background_child_keeps_stdout(self):
+        output = overcast.output.OutputBuffer()
+        start = time.time()
+        overcast.runner.run_cmd_once(shell_cmd='bash',
+                                     real_cmd='sleep 5 &',
+                                     environment={},
+                                     deadline=None,
+                                     output=output)
+        self.assertLess(time.time() - start, 3)
+
+    def test_run_cmd_once_background_child_keeps_writing(self):
+        output = overcast.output.OutputBuffer()
+        start = time.time()
+        # The loop stops once its writes fail, i.e. when we close stdout
+        overcast.runner.run_cmd_once(shell_cmd='bash',
+                                     real_cmd='echo started; '
+                                              'while :; do echo x || exit; sleep 0.1; done &',
+                                     environment={},
+                                     deadline=start + 5,
+                                     output=output)
+        self.assertLess(time.time() - start, 3)
+        self.assertTrue(output.tail().startswith('started\n'))
+
 
     @mock.patch('overcast.runner.run_cmd_once')
     def test_shell_step(self, run_cmd_once):
         details = {'cmd': 'true'}
         self.dr.shell_step(details, {})
-        run_cmd_once.assert_called_once_with(mock.ANY, 'true', mock.ANY, None)
+        run_cmd_once.assert_called_once_with(mock.ANY, 'true', mock.ANY, None, output=mock.ANY)
 
     @mock.patch('overcast.runner.run_cmd_once')
     def test_shell_step_failure(self, run_cmd_once):
         details = {'cmd': 'false'}
         self.dr.shell_step(details, {})
-        run_cmd_once.assert_called_once_with(mock.ANY, 'false', mock.ANY, None)
+        run_cmd_once.assert_called_once_with(mock.ANY, 'false', mock.ANY, None, output=mock.ANY)
 
     @mock.patch('overcast.runner.run_cmd_once')
     def test_shell_step_retries_if_failed_until_success(self, run_cmd_once):
@@ -262,6 +471,94 @@ class MainTests(unittest.TestCase):
         self.dr.shell_step(details, {})
         self.assertEquals(list(run_cmd_once.side_effect), [])
 
+    def test_shell_step_cmd_local(self):
+        self.assertEquals(self.dr.shell_step_cmd({'cmd': 'true'}, 'FOO=bar '),
+                          'FOO=bar  bash')
+        self.assertEquals(self.dr.ssh_control_dir, None)
+
+    @mock.patch('overcast.runner.subprocess')
+    def test_shell_step_cmd_remote(self, subprocess):
+        node = overcast.runner.Node('node1', {}, self.dr)
+        node.ports = [{'floating_ip': '1.2.3.4'}]
+        self.dr.nodes['node1'] = node
+        # No connection yet, then opening it works, then it's open
+        subprocess.call.side_effect = [255, 0, 0]
+
+        cmd = self.dr.shell_step_cmd({'type': 'remote', 'node': 'node1'})
+        control_dir = self.dr.ssh_control_dir
+        control_path = '-o ControlPath=%s/%%r@%%h:%%p' % (control_dir,)
+
+        self.assertTrue(os.path.isdir(control_dir))
+        # The step itself never becomes the master
+        self.assertIn('-o ControlMaster=no', cmd)
+        self.assertIn(control_path, cmd)
+        self.assertTrue(cmd.endswith('ubuntu@1.2.3.4 " bash"'))
+        master_cmd = subprocess.call.mock_calls[1][1][0]
+        self.assertEquals(master_cmd[-3:], ['-N', '-f', 'ubuntu@1.2.3.4'])
+        self.assertIn('ControlMaster=yes', master_cmd)
+        self.assertIn('StrictHostKeyChecking=no', master_cmd)
+
+        # Same control dir for every step, and the connection is reused
+        self.dr.shell_step_cmd({'type': 'remote', 'node': 'node1'})
+        self.assertEquals(self.dr.ssh_control_dir, control_dir)
+        self.assertEquals(len(subprocess.call.mock_calls), 3)
+        self.assertIn('check', subprocess.call.mock_calls[2][1][0])
+
+        subprocess.call.side_effect = None
+        subprocess.call.reset_mock()
+        self.dr.close_ssh_connections()
+
+        subprocess.call.assert_called_once_with(['ssh', '-o', 'ControlPath=%s/%%r@%%h:%%p' % (control_dir,),
+                                                 '-O', 'exit', 'ubuntu@1.2.3.4'],
+                                                stdout=mock.ANY, stderr=mock.ANY)
+        self.assertFalse(os.path.exists(control_dir))
+        self.assertEquals(self.dr.ssh_control_dir, None)
+
+    @mock.patch('overcast.runner.MAX_READ_WAIT', 5)
+    def test_shell_step_remote_ssh_master_detached(self):
+        # A stand-in for ssh that runs the command locally. When it's
+        # asked to be a control master, it leaves a process behind that
+        # holds on to its stdio, like ControlPersist does.
+        bindir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, bindir)
+        with open(os.path.join(bindir, 'ssh'), 'w') as fp:
+            fp.write('#!/bin/bash\n'
+                     'for arg; do\n'
+                     '  case "$arg" in\n'
+                     '    ControlMaster=yes|ControlMaster=auto) sleep 10 & ;;\n'
+                     '    -O) exit 255 ;;\n'
+                     '    -N) exit 0 ;;\n'
+                     '  esac\n'
+                     '  last="$arg"\n'
+                     'done\n'
+                     'exec bash -c "$last"\n')
+        os.chmod(os.path.join(bindir, 'ssh'), 0755)
+        path = '%s:%s' % (bindir, os.environ['PATH'])
+
+        node = overcast.runner.Node('node1', {}, self.dr)
+        node.ports = [{'floating_ip': '1.2.3.4'}]
+        self.dr.nodes['node1'] = node
+        self.addCleanup(self.dr.close_ssh_connections)
+
+        stdout = StringIO()
+        start = time.time()
+        with mock.patch.dict('os.environ', {'PATH': path}), mock.patch('sys.stdout', stdout):
+            self.dr.shell_step({'type': 'remote', 'node': 'node1', 'cmd': 'echo done'},
+                               {'PATH': path})
+
+        # The master's leftover process doesn't hold up the step
+        self.assertLess(time.time() - start, 3)
+        self.assertEquals(stdout.getvalue(), 'done\n')
+
+    def test_shell_step_cmd_remote_no_multiplexing(self):
+        node = overcast.runner.Node('node1', {}, self.dr)
+        node.ports = [{'floating_ip': '1.2.3.4'}]
+        self.dr.nodes['node1'] = node
+        self.dr.ssh_multiplexing = False
+
+        self.assertEquals(self.dr.shell_step_cmd({'type': 'remote', 'node': 'node1'}),
+                          'ssh -o StrictHostKeyChecking=no ubuntu@1.2.3.4 " bash"')
+
     def test_build_env_prefix(self):
         class Node(object):
             def __init__(self, name, ports, export):
@@ -396,8 +693,8 @@ class MainTests(unittest.TestCase):
 
         neutron.list_networks.return_value = {'networks': []}
         neutron.list_security_groups.return_value = {'security_groups': []}
-        nova.servers.list.return_value = [Server('server1', 'uuid1'),
-                                          Server('server1', 'uuid2')]
+        nova.servers.list.side_effect = [[Server('server1', 'uuid1'),
+                                          Server('server1', 'uuid2')], []]
 
         self.assertRaises(overcast.exceptions.DuplicateResourceException,
                           self.dr.detect_existing_resources)
@@ -415,8 +712,8 @@ class MainTests(unittest.TestCase):
 
         neutron.list_networks.return_value = {'networks': []}
         neutron.list_security_groups.return_value = {'security_groups': []}
-        nova.servers.list.return_value = [Server('server1_foo', 'uuid1'),
-                                          Server('server1_foo', 'uuid2')]
+        nova.servers.list.side_effect = [[Server('server1_foo', 'uuid1'),
+                                          Server('server1_foo', 'uuid2')], []]
 
         self.dr.suffix = 'bar'
         self.dr.detect_existing_resources()
@@ -491,8 +788,8 @@ class MainTests(unittest.TestCase):
                                                              "addr": "10.0.0.4",
                                                              "OS-EXT-IPS:type": "fixed"}]}
 
-        nova.servers.list.return_value = [Server('server1', 'server1uuid'),
-                                          Server('server1_mysuffix', 'server1_mysuffixuuid')]
+        nova.servers.list.side_effect = [[Server('server1', 'server1uuid'),
+                                          Server('server1_mysuffix', 'server1_mysuffixuuid')], []]
 
         self.dr.suffix = suffix
         self.dr.detect_existing_resources()
@@ -503,11 +800,86 @@ class MainTests(unittest.TestCase):
             self.assertIn(node, self.dr.nodes)
 
 
+    @mock.patch('overcast.runner.FILTER_CHUNK_SIZE', 2)
+    @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
+    @mock.patch('overcast.runner.DeploymentRunner.get_nova_client')
+    def test_detect_existing_resources_filters(self, get_nova_client, get_neutron_client):
+        neutron = get_neutron_client.return_value
+        nova = get_nova_client.return_value
+
+        class Server(object):
+            def __init__(self, idx):
+                self.name = 'server%d_x123' % idx
+                self.id = 'server%duuid' % idx
+                self.addresses = {'net': [{'OS-EXT-IPS-MAC:mac_addr': 'mac%d' % idx}]}
+
+        nova.servers.list.side_effect = [[Server(idx) for idx in range(3)], []]
+        neutron.list_networks.return_value = {'networks': []}
+        neutron.list_security_groups.return_value = {'security_groups': []}
+        fips = [{'port_id': 'port1uuid', 'floating_ip_address': '1.2.3.4'},
+                {'port_id': None, 'floating_ip_address': '1.2.3.5'}]
+        def list_floatingips(port_id, fields, **kwargs):
+            return {'floatingips': [fip for fip in fips if fip['port_id'] in port_id]}
+        neutron.list_floatingips.side_effect = list_floatingips
+        def list_ports(device_id, fields, **kwargs):
+            return {'ports': [{'id': server_id.replace('server', 'port'),
+                               'fixed_ips': [{'ip_address': '10.0.0.1'}],
+                               'mac_address': server_id.replace('server', 'mac').replace('uuid', ''),
+                               'network_id': 'netuuid'}
+                              for server_id in device_id]}
+        neutron.list_ports.side_effect = list_ports
+
+        self.dr.suffix = 'x123'
+        self.dr.parallel = 3
+        with mock.patch('overcast.utils.run_in_parallel',
+                        wraps=utils.run_in_parallel) as run_in_parallel:
+            self.dr.detect_existing_resources()
+
+        # The chunks of ports are fetched at most --parallel at a time
+        self.assertEquals(run_in_parallel.mock_calls[-1][1][2], 3)
+        self.assertEquals(nova.servers.list.mock_calls,
+                          [mock.call(search_opts={'name': r'\_x123$'},
+                                     limit=utils.PAGE_SIZE, marker=None),
+                           mock.call(search_opts={'name': r'\_x123$'},
+                                     limit=utils.PAGE_SIZE, marker='server2uuid')])
+        neutron.list_networks.assert_called_once_with(fields=['id', 'name'],
+                                                      retrieve_all=False, limit=utils.PAGE_SIZE)
+        neutron.list_security_groups.assert_called_once_with(fields=['id', 'name'],
+                                                             retrieve_all=False, limit=utils.PAGE_SIZE)
+        self.assertEquals(len(neutron.list_ports.mock_calls), 2)
+        neutron.list_ports.assert_any_call(device_id=['server0uuid', 'server1uuid'], fields=mock.ANY,
+                                           retrieve_all=False, limit=utils.PAGE_SIZE)
+        neutron.list_ports.assert_any_call(device_id=['server2uuid'], fields=mock.ANY,
+                                           retrieve_all=False, limit=utils.PAGE_SIZE)
+        # Only the floating IPs of our ports are fetched
+        self.assertEquals(sorted(sorted(call[2]['port_id'])
+                                 for call in neutron.list_floatingips.mock_calls),
+                          [['port0uuid', 'port1uuid'], ['port2uuid']])
+
+        self.assertEquals(sorted(self.dr.nodes), ['server0', 'server1', 'server2'])
+        self.assertEquals(self.dr.nodes['server1'].floating_ip, '1.2.3.4')
+        self.assertEquals(self.dr.nodes['server2'].ports[0]['id'], 'port2uuid')
+
+    @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
+    @mock.patch('overcast.runner.DeploymentRunner.get_nova_client')
+    def test_detect_existing_resources_no_servers(self, get_nova_client, get_neutron_client):
+        neutron = get_neutron_client.return_value
+        nova = get_nova_client.return_value
+        nova.servers.list.return_value = []
+        neutron.list_networks.return_value = {'networks': []}
+        neutron.list_security_groups.return_value = {'security_groups': []}
+
+        self.dr.detect_existing_resources()
+
+        self.assertFalse(neutron.list_ports.called)
+        self.assertFalse(neutron.list_floatingips.called)
+
     @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
     def test_find_floating_network(self, get_neutron_client):
         nc = get_neutron_client.return_value
         nc.list_networks.return_value = {'networks': [{'id': 'netuuid'}]}
 
+        self.assertEquals(self.dr.find_floating_network(), 'netuuid')
         self.assertEquals(self.dr.find_floating_network(), 'netuuid')
 
         nc.list_networks.assert_called_once_with(**{'router:external': True})
@@ -526,6 +898,88 @@ class MainTests(unittest.TestCase):
 
         nc.create_floatingip.assert_called_once_with({'floatingip': {'floating_network_id': 'netuuid'}})
 
+    @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
+    @mock.patch('overcast.runner.DeploymentRunner.find_floating_network')
+    def test_preallocate_floating_ips(self, find_floating_network, get_neutron_client):
+        nc = get_neutron_client.return_value
+        find_floating_network.return_value = 'netuuid'
+        nc.create_floatingip.side_effect = [{'floatingip': {'id': 'fip%duuid' % idx,
+                                                            'floating_ip_address': '1.2.3.%d' % idx}}
+                                            for idx in range(1, 4)]
+        self.dr.record_resource = mock.MagicMock()
+
+        self.dr.preallocate_floating_ips(3)
+
+        self.assertEquals(len(nc.create_floatingip.mock_calls), 3)
+        self.assertFalse(nc.list_floatingips.called)
+        self.dr.record_resource.assert_any_call('floatingip', 'fip1uuid')
+
+        # Already have enough
+        self.dr.preallocate_floating_ips(2)
+        self.assertEquals(len(nc.create_floatingip.mock_calls), 3)
+
+        fips = [self.dr.create_floating_ip() for _ in range(3)]
+        self.assertEquals(sorted(fips), [('fip1uuid', '1.2.3.1'),
+                                         ('fip2uuid', '1.2.3.2'),
+                                         ('fip3uuid', '1.2.3.3')])
+        self.assertEquals(len(nc.create_floatingip.mock_calls), 3)
+
+    @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
+    @mock.patch('overcast.runner.DeploymentRunner.find_floating_network')
+    def test_preallocate_floating_ips_reuse(self, find_floating_network, get_neutron_client):
+        nc = get_neutron_client.return_value
+        find_floating_network.return_value = 'netuuid'
+        nc.list_floatingips.return_value = {'floatingips': [{'id': 'used', 'floating_ip_address': '1.1.1.1',
+                                                             'port_id': 'someport'},
+                                                            {'id': 'free', 'floating_ip_address': '1.1.1.2',
+                                                             'port_id': None}]}
+        nc.create_floatingip.return_value = {'floatingip': {'id': 'new', 'floating_ip_address': '1.1.1.3'}}
+        self.dr.reuse_floating_ips = True
+        self.dr.record_resource = mock.MagicMock()
+
+        self.dr.preallocate_floating_ips(2)
+
+        nc.list_floatingips.assert_called_once_with(floating_network_id='netuuid',
+                                                    retrieve_all=False, limit=utils.PAGE_SIZE)
+        self.assertEquals(len(nc.create_floatingip.mock_calls), 1)
+        self.assertEquals(self.dr.floating_ip_pool, [('free', '1.1.1.2'), ('new', '1.1.1.3')])
+        self.assertEquals(self.dr.record_resource.mock_calls, [mock.call('floatingip', 'new')])
+
+    @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
+    @mock.patch('overcast.runner.DeploymentRunner.find_floating_network')
+    def test_preallocate_floating_ips_reuse_once(self, find_floating_network, get_neutron_client):
+        nc = get_neutron_client.return_value
+        find_floating_network.return_value = 'netuuid'
+        nc.list_floatingips.return_value = {'floatingips': [{'id': 'free1', 'floating_ip_address': '1.1.1.1',
+                                                             'port_id': None},
+                                                            {'id': 'free2', 'floating_ip_address': '1.1.1.2',
+                                                             'port_id': None},
+                                                            {'id': 'free3', 'floating_ip_address': '1.1.1.3',
+                                                             'port_id': None}]}
+        self.dr.reuse_floating_ips = True
+
+        self.dr.preallocate_floating_ips(1)
+        # Handed out, but not associated yet
+        self.assertEquals(self.dr.create_floating_ip(), ('free1', '1.1.1.1'))
+        self.dr.preallocate_floating_ips(1)
+        # Another step wants more while free2 is still in the pool
+        self.dr.preallocate_floating_ips(2)
+
+        self.assertEquals(self.dr.floating_ip_pool, [('free2', '1.1.1.2'), ('free3', '1.1.1.3')])
+        self.assertFalse(nc.create_floatingip.called)
+
+    @mock.patch('overcast.runner.DeploymentRunner.preallocate_floating_ips')
+    def test_prepare_floating_ips(self, preallocate_floating_ips):
+        self.dr.nodes['node1'] = overcast.runner.Node('node1', {'networks': [{'network': 'net1',
+                                                                              'assign_floating_ip': True},
+                                                                             {'network': 'net2'}]},
+                                                      self.dr)
+        self.dr.nodes['node2'] = overcast.runner.Node('node2', {'networks': [{'network': 'net1',
+                                                                              'assign_floating_ip': True}]},
+                                                      self.dr)
+        self.dr.prepare_floating_ips(['node1', 'node2'])
+        preallocate_floating_ips.assert_called_once_with(2)
+
     @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
     def test_create_port(self, get_neutron_client):
         nc = get_neutron_client.return_value
@@ -557,6 +1011,56 @@ class MainTests(unittest.TestCase):
                                  'fixed_ip': '10.0.0.4'})
 
 
+    @mock.patch('overcast.runner.BULK_CHUNK_SIZE', 2)
+    @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
+    def test_create_ports(self, get_neutron_client):
+        nc = get_neutron_client.return_value
+        def create_port(body):
+            return {'port': None,
+                    'ports': [{'id': port['name'] + 'uuid',
+                               'mac_address': 'mac',
+                               'fixed_ips': [{'ip_address': '10.0.0.1'}]}
+                              for port in body['ports']]}
+        nc.create_port.side_effect = create_port
+        self.dr.record_resource = mock.MagicMock()
+        self.dr.networks = {'net1': 'net1uuid'}
+
+        ports = self.dr.create_ports([('port%d' % idx, 'net1', ['sg']) for idx in range(5)])
+
+        self.assertEquals(len(nc.create_port.mock_calls), 3)
+        nc.create_port.assert_any_call({'ports': [{'name': 'port4',
+                                                   'admin_state_up': True,
+                                                   'network_id': 'net1uuid',
+                                                   'security_groups': ['sg']}]})
+        self.assertEquals([port['id'] for port in ports],
+                          ['port%duuid' % idx for idx in range(5)])
+        self.assertEquals(ports[0], {'id': 'port0uuid',
+                                     'fixed_ip': '10.0.0.1',
+                                     'mac': 'mac',
+                                     'network_name': 'net1'})
+        for idx in range(5):
+            self.dr.record_resource.assert_any_call('port', 'port%duuid' % idx, name='port%d' % idx)
+
+    @mock.patch('overcast.runner.DeploymentRunner.create_ports')
+    def test_prepare_ports(self, create_ports):
+        create_ports.side_effect = lambda requests: [{'id': name} for name, _, _ in requests]
+        self.dr.secgroups = {'sg': 'sguuid'}
+        self.dr.nodes['node1'] = overcast.runner.Node('node1', {'networks': [{'network': 'net1'},
+                                                                             {'network': 'net2',
+                                                                              'securitygroups': ['sg']}]},
+                                                      self.dr)
+        self.dr.nodes['node2'] = overcast.runner.Node('node2', {'networks': [{'network': 'net1'}]},
+                                                      self.dr)
+
+        self.dr.prepare_ports(['node1', 'node2'])
+
+        create_ports.assert_called_once_with([('node1_eth0', 'net1', []),
+                                              ('node1_eth1', 'net2', ['sguuid']),
+                                              ('node2_eth0', 'net1', [])])
+        self.assertEquals(self.dr.nodes['node1'].prepared_ports, [{'id': 'node1_eth0'},
+                                                                  {'id': 'node1_eth1'}])
+        self.assertEquals(self.dr.nodes['node2'].prepared_ports, [{'id': 'node2_eth0'}])
+
     @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
     def test_create_network(self, get_neutron_client):
         nc = get_neutron_client.return_value
@@ -572,15 +1076,15 @@ class MainTests(unittest.TestCase):
                                                              'cidr': '10.0.0.0/12',
                                                              'ip_version': 4,
                                                              'network_id': 'theuuid'}})
-        self.dr.record_resource.assert_any_call('network', 'theuuid')
-        self.dr.record_resource.assert_any_call('subnet', 'thesubnetuuid')
+        self.dr.record_resource.assert_any_call('network', 'theuuid', name='netname')
+        self.dr.record_resource.assert_any_call('subnet', 'thesubnetuuid', name='netname')
 
     @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
     def test_create_security_group(self, get_neutron_client):
         nc = get_neutron_client.return_value
         nc.create_security_group.return_value = {'security_group': {'id': 'theuuid'}}
-        nc.create_security_group_rule.side_effect = [{'security_group_rule': {'id': 'theruleuuid1'}},
-                                                     {'security_group_rule': {'id': 'theruleuuid2'}}]
+        nc.create_security_group_rule.return_value = {'security_group_rules': [{'id': 'theruleuuid1'},
+                                                                               {'id': 'theruleuuid2'}]}
 
         self.dr.record_resource = mock.MagicMock()
         self.dr.create_security_group('secgroupname', [{'source_group': 'secgroupname',
@@ -593,21 +1097,22 @@ class MainTests(unittest.TestCase):
                                                         'to_port': 22}])
 
         nc.create_security_group.assert_called_once_with({'security_group': {'name': 'secgroupname'}})
-        nc.create_security_group_rule.assert_any_call({'security_group_rule': {'remote_ip_prefix': '12.0.0.0/12',
-                                                                               'direction': 'ingress',
-                                                                               'ethertype': 'IPv4',
-                                                                               'port_range_min': 21,
-                                                                               'port_range_max': 22,
-                                                                               'protocol': 'tcp',
-                                                                               'security_group_id': 'theuuid'}})
-        nc.create_security_group_rule.assert_any_call({'security_group_rule': {'remote_group_id': 'theuuid',
-                                                                               'direction': 'ingress',
-                                                                               'ethertype': 'IPv4',
-                                                                               'port_range_min': 23,
-                                                                               'port_range_max': 24,
-                                                                               'protocol': 'tcp',
-                                                                               'security_group_id': 'theuuid'}})
-        self.dr.record_resource.assert_any_call('secgroup', 'theuuid')
+        nc.create_security_group_rule.assert_called_once_with({'security_group_rules': [
+                                                                  {'remote_group_id': 'theuuid',
+                                                                   'direction': 'ingress',
+                                                                   'ethertype': 'IPv4',
+                                                                   'port_range_min': 23,
+                                                                   'port_range_max': 24,
+                                                                   'protocol': 'tcp',
+                                                                   'security_group_id': 'theuuid'},
+                                                                  {'remote_ip_prefix': '12.0.0.0/12',
+                                                                   'direction': 'ingress',
+                                                                   'ethertype': 'IPv4',
+                                                                   'port_range_min': 21,
+                                                                   'port_range_max': 22,
+                                                                   'protocol': 'tcp',
+                                                                   'security_group_id': 'theuuid'}]})
+        self.dr.record_resource.assert_any_call('secgroup', 'theuuid', name='secgroupname')
         self.dr.record_resource.assert_any_call('secgroup_rule', 'theruleuuid1')
         self.dr.record_resource.assert_any_call('secgroup_rule', 'theruleuuid2')
 
@@ -618,6 +1123,40 @@ class MainTests(unittest.TestCase):
 
         self.dr.create_security_group('secgroupname', None)
         nc.create_security_group.assert_called_once_with({'security_group': {'name': 'secgroupname'}})
+        self.assertFalse(nc.create_security_group_rule.called)
+
+    @mock.patch('overcast.runner.BULK_CHUNK_SIZE', 2)
+    @mock.patch('overcast.runner.DeploymentRunner.get_neutron_client')
+    def test_create_security_groups(self, get_neutron_client):
+        nc = get_neutron_client.return_value
+        nc.create_security_group.side_effect = lambda body: {'security_group': {'id': body['security_group']['name'] + 'uuid'}}
+        nc.create_security_group_rule.side_effect = lambda body: {'security_group_rules': [
+                                                                      {'id': '%s-%d' % (rule['security_group_id'],
+                                                                                        rule['port_range_min'])}
+                                                                      for rule in body['security_group_rules']]}
+        self.dr.record_resource = mock.MagicMock()
+
+        def rules(*ports):
+            return [{'cidr': '0.0.0.0/0', 'protocol': 'tcp', 'from_port': port, 'to_port': port}
+                    for port in ports]
+
+        # web refers to db, which may be created after it
+        self.dr.create_security_groups({'web': rules(80, 443) + [{'source_group': 'db',
+                                                                  'protocol': 'tcp',
+                                                                  'from_port': 1,
+                                                                  'to_port': 65535}],
+                                        'db': rules(3306),
+                                        'empty': None})
+
+        self.assertEquals(self.dr.secgroups, {'web': 'webuuid', 'db': 'dbuuid', 'empty': 'emptyuuid'})
+        self.assertEquals(len(nc.create_security_group_rule.mock_calls), 2)
+
+        all_rules = sum([c[1][0]['security_group_rules'] for c in nc.create_security_group_rule.mock_calls], [])
+        self.assertEquals(len(all_rules), 4)
+        self.assertIn('dbuuid', [rule.get('remote_group_id') for rule in all_rules])
+
+        for rule_id in ('webuuid-80', 'webuuid-443', 'webuuid-1', 'dbuuid-3306'):
+            self.dr.record_resource.assert_any_call('secgroup_rule', rule_id)
 
     @mock.patch('overcast.runner.DeploymentRunner.create_port')
     @mock.patch('overcast.runner.DeploymentRunner.get_nova_client')
@@ -663,6 +1202,7 @@ class MainTests(unittest.TestCase):
             def status(self):
                 return self.statuses.pop()
 
+        cinderclient.volumes.create.return_value.id = 'voluuid'
         cinderclient.volumes.get.return_value = Volume('voluuid')
 
         node.build()
@@ -678,9 +1218,10 @@ class MainTests(unittest.TestCase):
                                              key_name='key_x123',
                                              flavor='smallflavorobject')
 
-        self.dr.record_resource.assert_any_call('port', 'nicuuid1')
-        self.dr.record_resource.assert_any_call('port', 'nicuuid2')
-        self.dr.record_resource.assert_any_call('server', 'serveruuid')
+        self.dr.record_resource.assert_any_call('port', 'nicuuid1', name='test1_x123_eth0')
+        self.dr.record_resource.assert_any_call('port', 'nicuuid2', name='test1_x123_eth1')
+        self.dr.record_resource.assert_any_call('volume', 'voluuid', name='test1_x123')
+        self.dr.record_resource.assert_any_call('server', 'serveruuid', name='test1_x123')
 
     def test_list_refs_human(self):
         self._test_list_refs(False, 'Images:\n  trusty\n\nFlavors:\n  bootstrap\n')
@@ -701,8 +1242,8 @@ class MainTests(unittest.TestCase):
         self.assertEquals(output.getvalue(), expected_value)
 
 
-    @mock.patch('overcast.runner.Node.build')
-    def test__create_node(self, node_build):
+    @mock.patch('overcast.runner.Node.create_volume')
+    def test__create_node(self, node_create_volume):
         self.dr.nodes['existing_node'] = overcast.runner.Node('existing_node', {}, self.dr)
 
         self.assertEquals(self.dr._create_node('nodename', {}, 'keypair', ''),
@@ -710,17 +1251,72 @@ class MainTests(unittest.TestCase):
 
         self.assertIn('nodename', self.dr.nodes)
 
-        self.dr.nodes['nodename'].build.assert_called_once_with()
+        self.dr.nodes['nodename'].create_volume.assert_called_once_with()
+
+        self.assertEquals(self.dr._create_node('existing_node', {}, 'keypair', ''),
+                          None)
+
+    @mock.patch('overcast.runner.time')
+    @mock.patch('overcast.runner.DeploymentRunner.get_cinder_client')
+    def test_golden_volume(self, get_cinder_client, time):
+        cc = get_cinder_client.return_value
+        cc.volumes.list.return_value = [mock.Mock(id='old', status='error')]
+        cc.volumes.create.return_value = mock.Mock(id='new', status='creating')
+        cc.volumes.get.return_value = mock.Mock(id='new', status='available')
+        self.dr.suffix = 'x123'
+        self.dr.record_resource = mock.Mock()
+
+        self.assertEquals(self.dr.golden_volume('img', 10), 'new')
+        self.assertEquals(self.dr.golden_volume('img', 10), 'new')
 
-    def test_poll_pending_nodes_retry(self):
+        cc.volumes.list.assert_called_once_with(search_opts={'display_name': 'golden-img-10_x123'})
+        cc.volumes.create.assert_called_once_with(size=10, imageRef='img',
+                                                  display_name='golden-img-10_x123')
+        self.dr.record_resource.assert_called_once_with('golden_volume', 'new',
+                                                        name='golden-img-10_x123')
+        self.assertEquals(len(time.sleep.mock_calls), 1)
+
+    @mock.patch('overcast.runner.DeploymentRunner.get_cinder_client')
+    def test_poll_pending_volumes(self, get_cinder_client):
+        cc = get_cinder_client.return_value
+
+        class Volume(object):
+            def __init__(self, id, status):
+                self.id = id
+                self.status = status
+
+        cc.volumes.list.return_value = [Volume('vol1', 'available'),
+                                        Volume('vol2', 'downloading')]
+        self.dr.suffix = 'x123'
+        for idx in range(1, 3):
+            node = mock.MagicMock()
+            node.volume_id = 'vol%d' % idx
+            node.poll_volume.side_effect = lambda statuses, node=node: statuses[node.volume_id]
+            self.dr.nodes['node%d' % idx] = node
+
+        pending_volumes = self.dr._poll_pending_volumes(set(['node1', 'node2']))
+
+        self.assertEquals(pending_volumes, set(['node2']))
+        cc.volumes.list.assert_called_once_with(
+            search_opts={'metadata': {'overcast_root_volume': 'root_x123'}})
+        self.dr.nodes['node1'].boot.assert_called_once_with()
+        self.assertFalse(self.dr.nodes['node2'].boot.called)
+
+        cc.volumes.list.return_value = [Volume('vol2', 'error')]
+        self.assertRaises(overcast.exceptions.ProvisionFailedException,
+                          self.dr._poll_pending_volumes, pending_volumes)
+
+    @mock.patch('overcast.runner.DeploymentRunner.get_server_statuses')
+    def test_poll_pending_nodes_retry(self, get_server_statuses):
+        get_server_statuses.return_value = {}
         self.dr.nodes['node1'] = node1 = mock.MagicMock()
         self.dr.nodes['node2'] = node2 = mock.MagicMock()
 
         def decrement_attempts_left(node):
             node.attempts_left -= 1
 
-        node1.build.side_effect = lambda: decrement_attempts_left(node1)
-        node2.build.side_effect = lambda: decrement_attempts_left(node2)
+        node1.build.side_effect = lambda polling: decrement_attempts_left(node1)
+        node2.build.side_effect = lambda polling: decrement_attempts_left(node2)
 
         node1.poll.side_effect = ['BUILD', 'BUILD', 'BUILD', 'ACTIVE']
         node2.poll.side_effect = ['BUILD', 'BUILD', 'ERROR', 'BUILD', 'BUILD', 'ERROR']
@@ -753,7 +1349,7 @@ class MainTests(unittest.TestCase):
         self.assertFalse(node1.build.called)
 
         node2.clean.assert_called_with()
-        node2.build.assert_called_with()
+        node2.build.assert_called_with(self.dr.polling)
 
         self.assertEquals(self.dr.nodes['node2'], node2, 'Node obj was replaced')
 
@@ -770,15 +1366,61 @@ class MainTests(unittest.TestCase):
                           self.dr._poll_pending_nodes, pending_nodes)
 
 
+    @mock.patch('overcast.runner.DeploymentRunner.get_nova_client')
+    def test_poll_pending_nodes_batched(self, get_nova_client):
+        nc = get_nova_client.return_value
+
+        class Server(object):
+            def __init__(self, id, status):
+                self.id = id
+                self.status = status
+
+        nc.servers.list.side_effect = [[Server('uuid1', 'ACTIVE'),
+                                         Server('uuid2', 'BUILD'),
+                                         Server('uuid3', 'ACTIVE'),
+                                         Server('unrelated', 'ERROR')], []]
+        for idx in range(1, 4):
+            node = overcast.runner.Node('node%d_x123' % idx, {}, self.dr)
+            node.server_id = 'uuid%d' % idx
+            self.dr.nodes['node%d' % idx] = node
+
+        self.dr.suffix = 'x123'
+        pending_nodes = self.dr._poll_pending_nodes(set(['node1', 'node2', 'node3']))
+
+        self.assertEquals(pending_nodes, set(['node2']))
+        self.assertEquals(nc.servers.list.mock_calls,
+                          [mock.call(search_opts={'name': r'\_x123$'},
+                                     limit=utils.PAGE_SIZE, marker=None),
+                           mock.call(search_opts={'name': r'\_x123$'},
+                                     limit=utils.PAGE_SIZE, marker='unrelated')])
+        self.assertFalse(nc.servers.get.called)
+
+    @mock.patch('overcast.runner.DeploymentRunner.get_nova_client')
+    def test_get_server_statuses_escapes_suffix(self, get_nova_client):
+        nc = get_nova_client.return_value
+        nc.servers.list.return_value = []
+
+        self.dr.suffix = 'v1.2+rc(1)'
+        self.dr.get_server_statuses(['uuid1'])
+
+        search_opts = nc.servers.list.call_args[1]['search_opts']
+        self.assertTrue(re.search(search_opts['name'], 'node1_v1.2+rc(1)'))
+        self.assertFalse(re.search(search_opts['name'], 'node1_v142+rc1'))
+
+    @mock.patch('overcast.runner.DeploymentRunner.resolve_flavors_and_images')
     @mock.patch('overcast.runner.DeploymentRunner.create_network')
-    @mock.patch('overcast.runner.DeploymentRunner.create_security_group')
+    @mock.patch('overcast.runner.DeploymentRunner.create_security_groups')
     @mock.patch('overcast.runner.DeploymentRunner._create_node')
+    @mock.patch('overcast.runner.DeploymentRunner.prepare_ports')
+    @mock.patch('overcast.runner.DeploymentRunner.prepare_floating_ips')
+    @mock.patch('overcast.runner.DeploymentRunner._poll_pending_volumes')
     @mock.patch('overcast.runner.DeploymentRunner._poll_pending_nodes')
     @mock.patch('overcast.runner.time')
-    def test_provision_step(self, time, _poll_pending_nodes, _create_node,
-                            create_security_group, create_network):
+    def test_provision_step(self, time, _poll_pending_nodes, _poll_pending_volumes,
+                            prepare_floating_ips, prepare_ports, _create_node,
+                            create_security_groups, create_network, resolve_flavors_and_images):
+        _poll_pending_volumes.return_value = set()
         create_network.return_value = 'netuuid'
-        create_security_group.return_value = 'sguuid'
         self.dr.suffix = 'x123'
         _poll_pending_nodes.side_effect = [set(['other', 'bootstrap1', 'bootstrap2']),
                                            set(['bootstrap1', 'bootstrap2']),
@@ -786,19 +1428,23 @@ class MainTests(unittest.TestCase):
                                            set()]
 
         _create_node.side_effect = lambda base_name, node_info, keypair_name, userdata: base_name
+        self.dr.polling_config = {'initial': 1, 'factor': 2, 'jitter': 0}
 
         self.dr.provision_step({'stack': 'overcast/tests/runner/examplestack1.yaml'})
 
+        self.assertEquals(time.sleep.mock_calls, [mock.call(1), mock.call(2), mock.call(4)])
+        self.assertEquals(len(resolve_flavors_and_images.call_args[0][0]), 2)
+        prepare_ports.assert_called_once_with(set(['other', 'bootstrap1', 'bootstrap2']))
+        prepare_floating_ips.assert_called_once_with(set(['other', 'bootstrap1', 'bootstrap2']))
         create_network.assert_called_with('undercloud_x123', {'cidr': '10.240.292.0/24'})
-        create_security_group.assert_called_with('jumphost',
-                                                 [{'to_port': 22,
-                                                   'cidr': '0.0.0.0/0',
-                                                   'from_port': 22}])
+        create_security_groups.assert_called_with({'jumphost': [{'to_port': 22,
+                                                                 'cidr': '0.0.0.0/0',
+                                                                 'from_port': 22}]})
         self.assertEquals(_poll_pending_nodes.mock_calls,
-                          [mock.call(set(['other', 'bootstrap1', 'bootstrap2'])),
-                           mock.call(set(['other', 'bootstrap1', 'bootstrap2'])),
-                           mock.call(set(['bootstrap1', 'bootstrap2'])),
-                           mock.call(set(['bootstrap1']))])
+                          [mock.call(set(['other', 'bootstrap1', 'bootstrap2']), mock.ANY),
+                           mock.call(set(['other', 'bootstrap1', 'bootstrap2']), mock.ANY),
+                           mock.call(set(['bootstrap1', 'bootstrap2']), mock.ANY),
+                           mock.call(set(['bootstrap1']), mock.ANY)])
         _create_node.assert_any_call('other',
                                      {'networks': [{'securitygroups': ['jumphost'],
                                                     'network': 'default',
@@ -823,6 +1469,226 @@ class MainTests(unittest.TestCase):
                                      userdata=None,
                                      keypair_name=None)
 
+    @mock.patch('overcast.runner.DeploymentRunner.resolve_flavors_and_images')
+    @mock.patch('overcast.runner.DeploymentRunner.create_network')
+    @mock.patch('overcast.runner.DeploymentRunner.create_security_groups')
+    @mock.patch('overcast.runner.DeploymentRunner._create_node')
+    @mock.patch('overcast.runner.DeploymentRunner.prepare_ports')
+    @mock.patch('overcast.runner.DeploymentRunner.prepare_floating_ips')
+    @mock.patch('overcast.runner.DeploymentRunner._poll_pending_volumes')
+    @mock.patch('overcast.runner.DeploymentRunner._poll_pending_nodes')
+    @mock.patch('overcast.runner.time')
+    def test_provision_step_parallel(self, time, _poll_pending_nodes, _poll_pending_volumes,
+                                     prepare_floating_ips, prepare_ports, _create_node,
+                                     create_security_groups, create_network,
+                                     resolve_flavors_and_images):
+        self.dr.parallel = 4
+        _poll_pending_volumes.return_value = set()
+        _poll_pending_nodes.return_value = set()
+        _create_node.side_effect = lambda base_name, node_info, keypair_name, userdata: base_name
+
+        with mock.patch('overcast.utils.run_in_parallel',
+                        wraps=utils.run_in_parallel) as run_in_parallel:
+            self.dr.provision_step({'stack': 'overcast/tests/runner/examplestack1.yaml'})
+
+        self.assertEquals(len(_create_node.mock_calls), 3)
+        # Grouped and ungrouped nodes share the one pool of --parallel workers
+        self.assertEquals([(len(call[1][1]), call[1][2]) for call in run_in_parallel.mock_calls],
+                          [(3, 4)])
+        _poll_pending_nodes.assert_called_once_with(set(['other', 'bootstrap1', 'bootstrap2']),
+                                                    mock.ANY)
+
+    def test_polling_policy(self):
+        self.dr.polling_config = {'maximum': 20, 'eta': {'server': 45}}
+
+        policy = self.dr.polling_policy({'initial': 2, 'maximum': 30,
+                                         'eta': {'server': 60, 'volume': 20}})
+        self.assertEquals((policy.initial, policy.maximum), (2, 20))
+        self.assertEquals(policy.etas, {'server': 45, 'volume': 20})
+
+        # Hints from the command line aren't replaced by what's learned
+        policy.observe('server', 100)
+        policy.observe('volume', 30)
+        self.assertEquals(policy.eta('server'), 45)
+        self.assertNotEquals(policy.eta('volume'), 20)
+
+    @mock.patch('overcast.runner.DeploymentRunner.resolve_flavors_and_images')
+    @mock.patch('overcast.runner.DeploymentRunner.create_network')
+    @mock.patch('overcast.runner.DeploymentRunner.create_security_groups')
+    @mock.patch('overcast.runner.DeploymentRunner._create_node')
+    @mock.patch('overcast.runner.DeploymentRunner.prepare_ports')
+    @mock.patch('overcast.runner.DeploymentRunner.prepare_floating_ips')
+    @mock.patch('overcast.runner.DeploymentRunner._poll_pending_volumes')
+    @mock.patch('overcast.runner.DeploymentRunner._poll_pending_nodes')
+    @mock.patch('overcast.runner.time')
+    def test_provision_step_polling_per_step(self, time, _poll_pending_nodes, _poll_pending_volumes,
+                                             prepare_floating_ips, prepare_ports, _create_node,
+                                             create_security_groups, create_network,
+                                             resolve_flavors_and_images):
+        _poll_pending_volumes.return_value = set()
+        _create_node.side_effect = lambda base_name, node_info, keypair_name, userdata: base_name
+        policies = []
+        durations = [100, 40]
+
+        def poll_pending_nodes(pending_nodes, polling):
+            policies.append(polling)
+            polling.observe('server', durations.pop(0))
+            return set()
+        _poll_pending_nodes.side_effect = poll_pending_nodes
+
+        self.dr.provision_step({'stack': 'overcast/tests/runner/examplestack1.yaml'})
+        self.dr.nodes = {}
+        self.dr.provision_step({'stack': 'overcast/tests/runner/examplestack1.yaml'})
+
+        self.assertEquals(len(policies), 2)
+        self.assertFalse(policies[0] is policies[1])
+        self.assertEquals(policies[0].eta('server'), 100)
+        # The second step doesn't start from what the first one learned
+        self.assertEquals(policies[1].eta('server'), 40)
+        self.assertFalse(self.dr.polling is policies[0])
+        self.assertEquals(self.dr.polling.eta('server'), None)
+
+    @mock.patch('overcast.runner.DeploymentRunner.get_nova_client')
+    def test_resolve_flavors_and_images(self, get_nova_client):
+        nc = get_nova_client.return_value
+        nc.flavors.get.side_effect = lambda uuid: 'flavor-' + uuid
+        nc.glance.find_image.side_effect = lambda uuid: 'image-' + uuid
+        self.dr.mappings = {'images': {'trusty': 'trustyuuid'},
+                            'flavors': {'small': 'smalluuid'}}
+        nodes = [{'flavor': 'small', 'image': 'trusty'} for _ in range(10)]
+        nodes.append({'flavor': 'big', 'image': 'trusty'})
+
+        self.dr.resolve_flavors_and_images(nodes)
+        self.dr.resolve_flavors_and_images(nodes)
+
+        self.assertEquals(sorted(nc.flavors.get.mock_calls),
+                          [mock.call('big'), mock.call('smalluuid')])
+        nc.glance.find_image.assert_called_once_with('trustyuuid')
+        self.assertEquals(self.dr.get_flavor('smalluuid'), 'flavor-smalluuid')
+        self.assertEquals(len(nc.flavors.get.mock_calls), 2)
+
+    @mock.patch('overcast.runner.DeploymentRunner.get_nova_client')
+    def test_resolve_flavors_and_images_missing(self, get_nova_client):
+        nc = get_nova_client.return_value
+        nc.flavors.get.return_value = 'flavor'
+        nc.glance.find_image.side_effect = NovaNotFound(404)
+
+        try:
+            self.dr.resolve_flavors_and_images([{'flavor': 'small', 'image': 'trusty'}])
+            self.fail('Missing image not reported')
+        except exceptions.UnknownResourceException, e:
+            self.assertEquals(str(e), 'Not found: image trusty')
+
+    @mock.patch('overcast.runner.DeploymentRunner.provision_step')
+    @mock.patch('overcast.runner.DeploymentRunner.shell_step')
+    def test_deploy(self, shell_step, provision_step):
+        self.dr.cfg = {'main': [{'shell': {'cmd': 'true'}},
+                                {'provision': {'stack': 'stack.yaml'}}]}
+
+        self.dr.deploy('main')
+
+        shell_step.assert_called_once_with({'cmd': 'true'})
+        provision_step.assert_called_once_with({'stack': 'stack.yaml'})
+
+    @mock.patch('overcast.runner.DeploymentRunner.provision_step')
+    @mock.patch('overcast.runner.DeploymentRunner.shell_step')
+    def test_deploy_with_dependencies(self, shell_step, provision_step):
+        self.dr.cfg = {'main': [{'provision': {'stack': 'stack.yaml', 'id': 'stack'}},
+                                {'shell': {'cmd': 'make_userdata', 'after': []}},
+                                {'shell': {'cmd': 'true', 'after': ['stack', 'shell-2']}}]}
+
+        output = StringIO()
+        self.dr.deploy('main', output)
+
+        self.assertEquals(len(shell_step.mock_calls), 2)
+        provision_step.assert_called_once_with({'stack': 'stack.yaml', 'id': 'stack'})
+        self.assertTrue(output.getvalue().startswith('Critical path'))
+
+    @mock.patch('overcast.runner.time')
+    @mock.patch('overcast.runner.DeploymentRunner.provision_step')
+    @mock.patch('overcast.runner.DeploymentRunner.shell_step')
+    def test_deploy_with_tracer(self, shell_step, provision_step, time):
+        self.dr.tracer = Tracer()
+        self.dr.cfg = {'main': [{'shell': {'cmd': 'true'}},
+                                {'provision': {'stack': 'stack.yaml', 'id': 'stack'}}]}
+
+        self.dr.deploy('main')
+        self.dr._sleep(3)
+
+        time.sleep.assert_called_once_with(3)
+        self.assertEquals([(kind, name) for kind, name, _, _ in self.dr.tracer.records],
+                          [('step', 'shell-1'), ('step', 'stack'), ('sleep', 'poll')])
+        self.assertTrue(isinstance(self.dr._traced(object(), 'nova'), TracedObject))
+
+    def test_deploy_with_cycle(self):
+        self.dr.cfg = {'main': [{'shell': {'cmd': 'true', 'id': 'a', 'after': ['b']}},
+                                {'shell': {'cmd': 'true', 'id': 'b', 'after': ['a']}}]}
+
+        with mock.patch('overcast.runner.DeploymentRunner.shell_step') as shell_step:
+            self.assertRaises(overcast.exceptions.InvalidStepGraphException,
+                              self.dr.deploy, 'main')
+            self.assertFalse(shell_step.called)
+
+    @mock.patch('overcast.runner.DeploymentRunner.shell_step')
+    def test_parallel_step(self, shell_step):
+        running = []
+        max_running = []
+        def _shell_step(details):
+            running.append(details['cmd'])
+            max_running.append(len(running))
+            time.sleep(0.05)
+            running.remove(details['cmd'])
+
+        shell_step.side_effect = _shell_step
+
+        self.dr.parallel_step({'max-concurrency': 2,
+                               'steps': [{'shell': {'cmd': 'cmd%d' % idx}}
+                                         for idx in range(5)]})
+
+        self.assertEquals(len(shell_step.mock_calls), 5)
+        self.assertEquals(max(max_running), 2)
+
+    @mock.patch('overcast.runner.DeploymentRunner.provision_step')
+    @mock.patch('overcast.runner.DeploymentRunner.shell_step')
+    def test_parallel_step_with_tracer(self, shell_step, provision_step):
+        self.dr.tracer = Tracer()
+        steps = {}
+        shell_step.side_effect = lambda details: steps.setdefault(details['cmd'],
+                                                                  utils.context.step)
+        self.dr.cfg = {'main': [{'parallel': {'steps': [{'shell': {'cmd': 'a'}},
+                                                        {'shell': {'cmd': 'b', 'id': 'b'}}]}},
+                                {'provision': {'stack': 'stack.yaml'}}]}
+
+        self.dr.deploy('main', StringIO())
+
+        self.assertEquals(steps, {'a': 'parallel-1/shell-1', 'b': 'parallel-1/b'})
+        self.assertEquals(sorted(name for kind, name, _, _ in self.dr.tracer.records
+                                 if kind == 'step'),
+                          ['parallel-1', 'parallel-1/b', 'parallel-1/shell-1', 'provision-2'])
+
+    @mock.patch('overcast.runner.DeploymentRunner.shell_step')
+    def test_parallel_step_fail_fast(self, shell_step):
+        def _shell_step(details):
+            if details['cmd'] == 'false':
+                raise overcast.exceptions.CommandFailedException()
+
+        shell_step.side_effect = _shell_step
+        steps = [{'shell': {'cmd': 'false'}},
+                 {'shell': {'cmd': 'true'}},
+                 {'shell': {'cmd': 'true'}}]
+
+        self.assertRaises(overcast.exceptions.CommandFailedException,
+                          self.dr.parallel_step, {'max-concurrency': 1,
+                                                  'steps': steps})
+        self.assertEquals(len(shell_step.mock_calls), 1)
+
+        shell_step.reset_mock()
+        self.assertRaises(overcast.exceptions.CommandFailedException,
+                          self.dr.parallel_step, {'max-concurrency': 1,
+                                                  'fail-fast': False,
+                                                  'steps': steps})
+        self.assertEquals(len(shell_step.mock_calls), 3)
+
     @mock.patch('overcast.runner.DeploymentRunner.get_nova_client')
     def test_delete_server(self, get_nova_client):
         nc = get_nova_client.return_value
@@ -0,0 +1,154 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import mock
+import unittest
+
+from cinderclient.exceptions import BadRequest as CinderBadRequest
+from neutronclient.common.exceptions import Conflict as NeutronConflict
+from neutronclient.common.exceptions import NotFound as NeutronNotFound
+from novaclient.exceptions import ClientException as NovaClientException
+from novaclient.exceptions import NotFound as NovaNotFound
+
+from overcast import cleanup
+
+class CleanupTests(unittest.TestCase):
+    def test_tiers(self):
+        resources = [('keypair', 'key1'),
+                     ('network', 'net1'),
+                     ('subnet', 'subnet1'),
+                     ('secgroup', 'sg1'),
+                     ('secgroup_rule', 'rule1'),
+                     ('volume', 'vol1'),
+                     ('port', 'port1'),
+                     ('floatingip', 'fip1'),
+                     ('server', 'server1'),
+                     ('port', 'port2'),
+                     ('port', 'port1'),
+                     ('something', 'else')]
+        self.assertEquals(cleanup.tiers(resources),
+                          [[('server', 'server1'), ('floatingip', 'fip1')],
+                           [('port', 'port1'), ('port', 'port2'), ('volume', 'vol1')],
+                           [('secgroup_rule', 'rule1')],
+                           [('secgroup', 'sg1'), ('subnet', 'subnet1')],
+                           [('network', 'net1'), ('keypair', 'key1')],
+                           [('something', 'else')]])
+
+    @mock.patch('overcast.cleanup.time')
+    def test_delete_retries_conflicts(self, time):
+        runner = mock.Mock()
+        runner.delete_volume.side_effect = [CinderBadRequest(400), CinderBadRequest(400), None]
+
+        cleaner = cleanup.Cleaner(runner)
+        self.assertIsNone(cleaner.delete(('volume', 'vol1')))
+
+        self.assertEquals(runner.delete_volume.call_count, 3)
+        self.assertEquals(time.sleep.mock_calls, [mock.call(1), mock.call(2)])
+
+    @mock.patch('overcast.cleanup.time')
+    def test_delete_gives_up(self, time):
+        runner = mock.Mock()
+        runner.delete_subnet.side_effect = NeutronConflict()
+
+        cleaner = cleanup.Cleaner(runner, retries=5)
+        self.assertIsInstance(cleaner.delete(('subnet', 'subnet1')), NeutronConflict)
+
+        self.assertEquals(runner.delete_subnet.call_count, 6)
+        self.assertEquals(time.sleep.mock_calls,
+                          [mock.call(1), mock.call(2), mock.call(4), mock.call(8), mock.call(10)])
+
+    @mock.patch('overcast.cleanup.time')
+    def test_delete_gone(self, time):
+        runner = mock.Mock()
+        runner.delete_port.side_effect = NeutronNotFound()
+
+        cleaner = cleanup.Cleaner(runner)
+        self.assertIsNone(cleaner.delete(('port', 'port1')))
+        self.assertEquals(runner.delete_port.call_count, 1)
+
+    def test_record_deletion(self):
+        runner = mock.Mock()
+        runner.delete_port.side_effect = [None, NeutronNotFound()]
+        runner.delete_network.side_effect = ValueError('boom')
+
+        cleaner = cleanup.Cleaner(runner)
+        cleaner.record_deletion = mock.Mock()
+        cleaner.delete(('port', 'port1'))
+        cleaner.delete(('port', 'port2'))
+        cleaner.delete(('network', 'net1'))
+
+        self.assertEquals(cleaner.record_deletion.mock_calls,
+                          [mock.call('port', 'port1'), mock.call('port', 'port2')])
+
+    def test_delete_other_error(self):
+        runner = mock.Mock()
+        runner.delete_port.side_effect = ValueError('boom')
+
+        cleaner = cleanup.Cleaner(runner)
+        self.assertIsInstance(cleaner.delete(('port', 'port1')), ValueError)
+        self.assertEquals(runner.delete_port.call_count, 1)
+
+    @mock.patch('overcast.cleanup.time')
+    def test_run(self, time):
+        time.time.return_value = 0
+        calls = []
+        runner = mock.Mock()
+        runner.delete_server.side_effect = lambda uuid: calls.append(('server', uuid))
+        runner.delete_port.side_effect = lambda uuid: calls.append(('port', uuid))
+        runner.delete_network.side_effect = ValueError('boom')
+        nova = runner.get_nova_client.return_value
+        nova.servers.get.side_effect = [mock.Mock(), NovaNotFound(404)]
+
+        cleaner = cleanup.Cleaner(runner, parallel=4)
+        failures = cleaner.run([('network', 'net1'),
+                                ('server', 'server1'),
+                                ('port', 'port1')])
+
+        self.assertEquals(calls, [('server', 'server1'), ('port', 'port1')])
+        self.assertEquals(nova.servers.get.mock_calls,
+                          [mock.call('server1'), mock.call('server1')])
+        self.assertFalse(nova.servers.list.called)
+        time.sleep.assert_called_once_with(1)
+        self.assertEquals(len(failures), 1)
+        self.assertEquals(failures[0][:2], ('network', 'net1'))
+        self.assertIsInstance(failures[0][2], ValueError)
+
+    def test_run_keeps_golden_volumes(self):
+        runner = mock.Mock()
+        resources = [('golden_volume', 'golden1'), ('volume', 'vol1')]
+
+        self.assertEquals(cleanup.Cleaner(runner).run(resources), [])
+        runner.delete_volume.assert_called_once_with('vol1')
+        self.assertFalse(runner.delete_golden_volume.called)
+
+        self.assertEquals(cleanup.Cleaner(runner, keep=()).run(resources), [])
+        runner.delete_golden_volume.assert_called_once_with('golden1')
+
+    @mock.patch('overcast.cleanup.time')
+    def test_run_wait_fails(self, time):
+        time.time.return_value = 0
+        runner = mock.Mock()
+        nova = runner.get_nova_client.return_value
+        nova.servers.get.side_effect = NovaClientException(503)
+
+        cleaner = cleanup.Cleaner(runner)
+        failures = cleaner.run([('network', 'net1'),
+                                ('server', 'server1'),
+                                ('port', 'port1')])
+
+        # The later tiers are still deleted
+        self.assertEquals(failures, [])
+        runner.delete_port.assert_called_once_with('port1')
+        runner.delete_network.assert_called_once_with('net1')
+        self.assertFalse(time.sleep.called)
@@ -0,0 +1,221 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import mock
+import os
+import tempfile
+import unittest
+
+from neutronclient.common.exceptions import Conflict as NeutronConflict
+from novaclient.exceptions import BadRequest as NovaBadRequest
+from novaclient.exceptions import ClientException as NovaClientException
+
+from overcast.cleanup import Cleaner
+from overcast.runner import DeploymentRunner
+from overcast.tests.fakecloud import FakeCloud, Limit
+
+STACK = '''
+nodes:
+  bootstrap:
+    number: 2
+    flavor: small
+    image: trusty
+    disk: 10
+    networks:
+    - network: default
+      securitygroups:
+      - jumphost
+    - network: undercloud
+  other:
+    flavor: small
+    image: trusty
+    disk: 10
+    networks:
+    - network: default
+      securitygroups:
+      - jumphost
+      assign_floating_ip: true
+    - network: undercloud
+networks:
+  undercloud:
+    cidr: 10.240.29.0/24
+securitygroups:
+  jumphost:
+  - cidr: 0.0.0.0/0
+    from_port: 22
+    to_port: 22
+    protocol: tcp
+'''
+
+class FakeCloudTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.stack = tempfile.mkstemp(suffix='.yaml')
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(STACK)
+
+    def tearDown(self):
+        os.unlink(self.stack)
+
+    def make_runner(self, cloud, **kwargs):
+        default = cloud.neutron.create_network({'network': {'name': 'default'}})['network']
+        cloud.neutron.create_subnet({'subnet': {'network_id': default['id'], 'cidr': '10.0.0.0/16'}})
+
+        dr = DeploymentRunner(suffix='test',
+                              mappings={'networks': {'default': default['id']},
+                                        'routers': {'*': cloud.router}},
+                              key='ssh-rsa AAAA',
+                              polling={'initial': 0.001, 'maximum': 0.01},
+                              **kwargs)
+        cloud.install(dr)
+
+        self.recorded = []
+        dr.record_resource = lambda type_, id, name=None: self.recorded.append((type_, id))
+        return dr
+
+    def test_provision_and_cleanup(self):
+        cloud = FakeCloud(build_times={'volume': 0.01, 'server': 0.02})
+        dr = self.make_runner(cloud, parallel=3)
+
+        dr.provision_step({'stack': self.stack})
+
+        self.assertEquals(sorted(dr.nodes), ['bootstrap1', 'bootstrap2', 'other'])
+        for node in dr.nodes.values():
+            self.assertEquals(node.server_status, 'ACTIVE')
+        self.assertTrue(dr.nodes['other'].floating_ip.startswith('172.24.'))
+        self.assertEquals(sorted(volume['display_name'] for volume in cloud.volumes.values()),
+                          ['root-bootstrap1_test', 'root-bootstrap2_test', 'root-other_test'])
+        self.assertEquals(cloud.counts(), {'server': 3, 'volume': 3, 'keypair': 1,
+                                           'network': 2, 'subnet': 2, 'port': 6,
+                                           'secgroup': 1, 'secgroup_rule': 1,
+                                           'floatingip': 1})
+
+        recorded = self.recorded
+
+        # Picking up where we left off finds the same nodes
+        redo = self.make_runner(cloud)
+        redo.detect_existing_resources()
+        self.assertEquals(sorted(redo.nodes), ['bootstrap1', 'bootstrap2', 'other'])
+        self.assertEquals(sorted(port['mac'] for port in redo.nodes['other'].ports),
+                          sorted(port['mac'] for port in dr.nodes['other'].ports))
+
+        with mock.patch('overcast.cleanup.time'):
+            failures = Cleaner(dr).run(recorded)
+
+        self.assertEquals(failures, [])
+        # Only the networks make_runner() created are left
+        self.assertEquals(cloud.counts(), {'server': 0, 'volume': 0, 'keypair': 0,
+                                           'network': 2, 'subnet': 2, 'port': 0,
+                                           'secgroup': 0, 'secgroup_rule': 0,
+                                           'floatingip': 0})
+
+    def test_clone_volumes(self):
+        cloud = FakeCloud(build_times={'volume': 0.01, 'server': 0.01})
+        dr = self.make_runner(cloud, parallel=3, clone_volumes=True)
+
+        dr.provision_step({'stack': self.stack})
+
+        golden = [id for type_, id in self.recorded if type_ == 'golden_volume']
+        self.assertEquals(len(golden), 1)
+        self.assertEquals(cloud.volumes[golden[0]]['image'], 'trusty')
+        self.assertEquals(sorted(volume['source_volid'] for volume in cloud.volumes.values()),
+                          [None] + golden * 3)
+        recorded = self.recorded
+
+        # A later deploy with the same suffix finds it
+        redo = self.make_runner(cloud, clone_volumes=True)
+        self.assertEquals(redo.golden_volume('trusty', 10), golden[0])
+        self.assertEquals(self.recorded, [])
+
+        with mock.patch('overcast.cleanup.time'):
+            self.assertEquals(Cleaner(dr).run(recorded), [])
+        # The golden volume is kept unless asked for
+        self.assertEquals(cloud.volumes.keys(), golden)
+
+        with mock.patch('overcast.cleanup.time'):
+            self.assertEquals(Cleaner(dr, keep=()).run(recorded), [])
+        self.assertEquals(cloud.counts()['volume'], 0)
+
+    def test_async_transitions(self):
+        cloud = FakeCloud(build_times={'volume': 10, 'server': (20, 20)},
+                          failure_rates={'server': 1.0})
+        with mock.patch('overcast.tests.fakecloud.time') as time:
+            time.time.return_value = 100
+            volume = cloud.cinder.volumes.create(size=10, imageRef='trusty')
+            self.assertEquals(volume.status, 'creating')
+
+            time.time.return_value = 110
+            self.assertEquals(cloud.cinder.volumes.get(volume.id).status, 'available')
+
+            server = cloud.nova.servers.create('node1', image=None, flavor='small',
+                                               block_device_mapping={'vda': '%s:::1' % (volume.id,)})
+            self.assertEquals(server.status, 'BUILD')
+            self.assertEquals(cloud.cinder.volumes.get(volume.id).status, 'in-use')
+
+            time.time.return_value = 130
+            self.assertEquals(cloud.nova.servers.get(server.id).status, 'ERROR')
+
+    def test_errors(self):
+        cloud = FakeCloud(errors={'nova keypairs.create': 1.0})
+        self.assertRaises(NovaClientException, cloud.nova.keypairs.create, 'key', 'ssh-rsa AAAA')
+        # Other operations are unaffected
+        self.assertEquals(cloud.nova.flavors.get('small').id, 'small')
+
+        network = cloud.neutron.create_network({'network': {'name': 'net'}})['network']
+        cloud.neutron.create_port({'port': {'network_id': network['id']}})
+        self.assertRaises(NeutronConflict, cloud.neutron.delete_network, network['id'])
+
+    @mock.patch('overcast.ratelimit.time')
+    def test_rate_limits(self, ratelimit_time):
+        cloud = FakeCloud(rate_limits={'nova': (1, 1)})
+        with mock.patch('overcast.tests.fakecloud.time') as time:
+            time.time.return_value = 100
+            ratelimit_time.time.return_value = 100
+            def sleep(seconds):
+                time.time.return_value += seconds
+            ratelimit_time.sleep.side_effect = sleep
+
+            cloud.nova.flavors.get('small')
+            cloud.nova.flavors.get('small')
+
+        self.assertEquals(cloud.calls['nova flavors.get'], 3)
+        self.assertEquals(cloud.governor.retries['nova'], 1)
+
+    def test_limit(self):
+        limit = Limit(2, 2)
+        self.assertEquals(limit.admit(100), 0)
+        self.assertEquals(limit.admit(100), 0)
+        self.assertEquals(limit.admit(100), 0.5)
+        self.assertEquals(limit.admit(100.5), 0)
+
+    def test_pagination(self):
+        cloud = FakeCloud()
+        for idx in range(5):
+            cloud.neutron.create_network({'network': {'name': 'net%d' % (idx,)}})
+
+        pages = list(cloud.neutron.list_networks(retrieve_all=False, limit=2, fields=['name']))
+        # Like Neutron, it takes an empty page to find out there's no more
+        self.assertEquals([len(page['networks']) for page in pages], [2, 2, 2, 0])
+        self.assertEquals(pages[0]['networks'][0], {'name': 'public'})
+        self.assertEquals(cloud.calls['neutron list_networks'], 4)
+
+    def test_deleted_server_marker(self):
+        cloud = FakeCloud()
+        servers = [cloud.nova.servers.create('node%d' % (idx,), image=None, flavor='small')
+                   for idx in range(3)]
+        cloud.nova.servers.delete(servers[1].id)
+
+        # Nova still finds markers for deleted servers
+        self.assertEquals([server.id for server in cloud.nova.servers.list(marker=servers[1].id)],
+                          [servers[2].id])
+        self.assertRaises(NovaBadRequest, cloud.nova.servers.list, marker='no-such-server')
@@ -0,0 +1,99 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import json
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from overcast.journal import Journal, compact_journal, read_journal
+
+class JournalTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cleanup.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, data):
+        with open(self.path, 'w') as fp:
+            fp.write(data)
+
+    def _read(self):
+        with open(self.path, 'r') as fp:
+            return fp.read()
+
+    def test_record(self):
+        with Journal(self.path) as journal:
+            journal.record('port', 'portuuid', name='node1_eth0', step='provision-1')
+            # Visible before the journal is closed
+            self.assertIn('portuuid', self._read())
+
+        entry = json.loads(self._read())
+        self.assertEquals(entry['op'], 'create')
+        self.assertEquals(entry['type'], 'port')
+        self.assertEquals(entry['id'], 'portuuid')
+        self.assertEquals(entry['name'], 'node1_eth0')
+        self.assertEquals(entry['step'], 'provision-1')
+        self.assertIn('timestamp', entry)
+
+    @mock.patch('overcast.journal.os.fsync')
+    def test_group_commit(self, fsync):
+        with Journal(self.path, sync_interval=10) as journal:
+            for idx in range(100):
+                journal.record('port', 'port%d' % idx)
+        # One sync for the first entry, one for the rest
+        self.assertTrue(1 <= fsync.call_count <= 2)
+
+    def test_read_legacy(self):
+        self._write('network: netuuid\nport: portuuid\n\n')
+        self.assertEquals(read_journal(self.path),
+                          [{'op': 'create', 'type': 'network', 'id': 'netuuid'},
+                           {'op': 'create', 'type': 'port', 'id': 'portuuid'}])
+
+    def test_read_skips_deleted_and_duplicates(self):
+        with Journal(self.path) as journal:
+            journal.record('network', 'net1')
+            journal.record('port', 'port1')
+            journal.record('port', 'port1')
+            journal.record('port', 'port2')
+            journal.record_deletion('port', 'port1')
+
+        self.assertEquals([(entry['type'], entry['id']) for entry in read_journal(self.path)],
+                          [('network', 'net1'), ('port', 'port2')])
+
+    def test_truncated_line(self):
+        self._write('network: netuuid\n{"op": "create", "type": "po')
+        with Journal(self.path) as journal:
+            journal.record('port', 'port1')
+
+        self.assertEquals([(entry['type'], entry['id']) for entry in read_journal(self.path)],
+                          [('network', 'netuuid'), ('port', 'port1')])
+
+    def test_compact(self):
+        self._write('network: net1\nport: port1\n')
+        with Journal(self.path) as journal:
+            journal.record('port', 'port2', name='node1_eth0')
+            journal.record_deletion('port', 'port1')
+
+        self.assertEquals(compact_journal(self.path), 2)
+
+        lines = self._read().splitlines()
+        self.assertEquals(len(lines), 2)
+        self.assertEquals(json.loads(lines[0]), {'op': 'create', 'type': 'network', 'id': 'net1'})
+        self.assertEquals(json.loads(lines[1])['name'], 'node1_eth0')
+        self.assertEquals(os.listdir(self.tmpdir), ['cleanup.log'])
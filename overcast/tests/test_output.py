@@ -0,0 +1,69 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import os.path
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from overcast.output import OutputBuffer
+
+class OutputBufferTests(unittest.TestCase):
+    def test_tail(self):
+        output = OutputBuffer(max_bytes=10)
+        output.write('abc')
+        output.write('def')
+        self.assertEquals(output.tail(), 'abcdef')
+
+        output.write('ghijkl')
+        self.assertEquals(output.tail(), 'cdefghijkl')
+
+        output.write('0123456789abc')
+        self.assertEquals(output.tail(), '3456789abc')
+        self.assertEquals(output.total_bytes, 25)
+
+    def test_bounded(self):
+        output = OutputBuffer(max_bytes=1024)
+        for _ in range(10000):
+            output.write('x' * 1000)
+        self.assertEquals(len(output.tail()), 1024)
+
+    def test_echo_and_spill(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            echo = StringIO()
+            path = os.path.join(tmpdir, 'step.log')
+            output = OutputBuffer(max_bytes=4, spill_path=path, echo=echo)
+            output.write('hello ')
+            output.write('world')
+            output.close()
+
+            self.assertEquals(output.tail(), 'orld')
+            self.assertEquals(echo.getvalue(), 'hello world')
+            with open(path, 'r') as fp:
+                self.assertEquals(fp.read(), 'hello world')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_stderr_echo(self):
+        echo, stderr_echo = StringIO(), StringIO()
+        output = OutputBuffer(echo=echo, stderr_echo=stderr_echo)
+        output.write('out ')
+        output.write('err ', stderr=True)
+        output.write('out')
+
+        self.assertEquals(output.tail(), 'out err out')
+        self.assertEquals(echo.getvalue(), 'out out')
+        self.assertEquals(stderr_echo.getvalue(), 'err ')
@@ -0,0 +1,84 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import unittest
+
+from overcast import exceptions
+from overcast.polling import PollingPolicy
+
+class PollingPolicyTests(unittest.TestCase):
+    def test_backoff(self):
+        policy = PollingPolicy(initial=1, maximum=10, factor=2, jitter=0)
+        waiter = policy.waiter('volume', 0)
+        self.assertEquals([waiter.next_delay(0) for _ in range(6)], [1, 2, 4, 8, 10, 10])
+
+    def test_jitter(self):
+        policy = PollingPolicy(initial=1, maximum=10, factor=2, jitter=0.1)
+        for _ in range(100):
+            self.assertTrue(0.9 <= policy.jittered(1) <= 1.1)
+
+    def test_eta(self):
+        policy = PollingPolicy(initial=1, maximum=10, factor=2, jitter=0, etas={'volume': 30})
+        waiter = policy.waiter('volume', 100)
+        self.assertEquals(waiter.next_delay(105), 25)
+        self.assertEquals([waiter.next_delay(130) for _ in range(3)], [1, 2, 4])
+
+    def test_eta_passed(self):
+        policy = PollingPolicy(initial=1, maximum=10, factor=2, jitter=0, etas={'volume': 30})
+        waiter = policy.waiter('volume', 100)
+        self.assertEquals(waiter.next_delay(140), 1)
+
+    def test_observe(self):
+        policy = PollingPolicy()
+        self.assertEquals(policy.eta('server'), None)
+        policy.observe('server', 40)
+        self.assertEquals(policy.eta('server'), 40)
+        policy.observe('server', 50, weight=0.5)
+        self.assertEquals(policy.eta('server'), 45)
+
+    def test_observe_pinned(self):
+        policy = PollingPolicy(etas={'server': 40}, pinned=['server'])
+        policy.observe('server', 100)
+        policy.observe('volume', 20)
+        self.assertEquals(policy.etas, {'server': 40, 'volume': 20})
+
+    def test_merge(self):
+        self.assertEquals(PollingPolicy.merge({'initial': 1, 'maximum': 10,
+                                               'eta': {'volume': 20, 'server': 60}},
+                                              {'maximum': 30, 'eta': {'server': 45}}),
+                          {'initial': 1, 'maximum': 30, 'eta': {'volume': 20, 'server': 45}})
+        self.assertEquals(PollingPolicy.merge({}, {}), {})
+
+    def test_from_config(self):
+        policy = PollingPolicy.from_config({'initial': '2', 'maximum': 20,
+                                            'eta': {'volume': 30, 'server': 60}},
+                                           etas={'server': 45})
+        self.assertEquals(policy.initial, 2.0)
+        self.assertEquals(policy.maximum, 20.0)
+        self.assertEquals(policy.etas, {'volume': 30.0, 'server': 45})
+
+    def test_from_config_invalid(self):
+        self.assertRaises(exceptions.InvalidPollingConfigException,
+                          PollingPolicy.from_config, {'initail': 2})
+        self.assertRaises(exceptions.InvalidPollingConfigException,
+                          PollingPolicy.from_config, {'initial': 'soon'})
+        self.assertRaises(exceptions.InvalidPollingConfigException,
+                          PollingPolicy.from_config, {'eta': 30})
+
+    def test_parse(self):
+        self.assertEquals(PollingPolicy.parse(''), {})
+        self.assertEquals(PollingPolicy.parse('initial=2, maximum=30,eta.volume=60'),
+                          {'initial': '2', 'maximum': '30', 'eta': {'volume': '60'}})
+        self.assertRaises(exceptions.InvalidPollingConfigException,
+                          PollingPolicy.parse, 'initial')
@@ -0,0 +1,211 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import json
+import mock
+import requests
+import threading
+import time
+import unittest
+
+from keystoneclient import exceptions as keystone_exceptions
+from keystoneclient.auth.identity import v2
+
+from overcast import ratelimit
+
+def response(status_code, headers=None):
+    return mock.Mock(status_code=status_code, headers=headers or {})
+
+class FakeSession(object):
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, url, method, **kwargs):
+        self.calls.append((url, method, kwargs))
+        return self.responses.pop(0)
+
+class Session(ratelimit.GovernedSessionMixin, FakeSession):
+    pass
+
+def http_response(status_code, body):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.headers['Content-Type'] = 'application/json'
+    resp._content = json.dumps(body)
+    return resp
+
+class FakeHTTP(object):
+    """
+    Stands in for the requests session under a keystone Session. Token
+    requests get a fresh token, the rest get the given responses.
+    """
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url))
+        if url.endswith('/tokens'):
+            return http_response(200, {'access': {
+                'token': {'id': 'tok%d' % len(self.calls), 'expires': '2999-01-01T00:00:00Z'},
+                'serviceCatalog': [{'type': 'compute',
+                                    'endpoints': [{'publicURL': 'http://nova:8774/v2'}]}],
+                'user': {'id': 'userid'}}})
+        return self.responses.pop(0)
+
+class RateLimitTests(unittest.TestCase):
+    def test_token_bucket(self):
+        bucket = ratelimit.TokenBucket(rate=2, burst=2)
+        self.assertEquals(bucket.reserve(100), 0)
+        self.assertEquals(bucket.reserve(100), 0)
+        self.assertEquals(bucket.reserve(100), 0.5)
+        self.assertEquals(bucket.reserve(100), 1)
+        # Refilled, but the reservations have to be paid back first
+        self.assertEquals(bucket.reserve(101), 0.5)
+        self.assertEquals(bucket.reserve(110), 0)
+
+    def test_retry_after(self):
+        self.assertEquals(ratelimit.retry_after(response(429)), None)
+        self.assertEquals(ratelimit.retry_after(response(429, {'Retry-After': '3'})), 3)
+        self.assertEquals(ratelimit.retry_after(response(429, {'Retry-After': 'soon'})), None)
+        date = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(time.time() + 30))
+        self.assertTrue(25 < ratelimit.retry_after(response(503, {'Retry-After': date})) <= 30)
+
+    @mock.patch('overcast.ratelimit.time')
+    def test_rate(self, time):
+        time.time.return_value = 100
+        governor = ratelimit.Governor(rate=1, burst=1)
+        for _ in range(3):
+            governor.call('nova', lambda: response(200))
+        governor.call('neutron', lambda: response(200))
+
+        self.assertEquals(time.sleep.mock_calls, [mock.call(1), mock.call(2)])
+        self.assertEquals(governor.throttled, {'nova': 3})
+
+    @mock.patch('overcast.ratelimit.time')
+    def test_retries(self, time):
+        time.time.return_value = 100
+        responses = [response(429, {'Retry-After': '7'}), response(503), response(200)]
+        governor = ratelimit.Governor()
+
+        self.assertEquals(governor.call('nova', lambda: responses.pop(0), method='GET').status_code,
+                          200)
+        self.assertEquals(time.sleep.mock_calls, [mock.call(7), mock.call(2)])
+        self.assertEquals(governor.throttled['nova'], 9)
+        self.assertEquals(governor.retries['nova'], 2)
+        self.assertEquals(governor.report(), 'Throttled: nova 9.0s (2 retries)\n')
+
+    @mock.patch('overcast.ratelimit.time')
+    def test_retries_503_idempotent_only(self, time):
+        time.time.return_value = 100
+        governor = ratelimit.Governor()
+
+        # The server may have been created before a proxy gave up on
+        # the request, so it's not created again
+        responses = [response(503), response(200)]
+        self.assertEquals(governor.call('nova', lambda: responses.pop(0), method='POST').status_code,
+                          503)
+        responses = [response(503), response(200)]
+        self.assertEquals(governor.call('nova', lambda: responses.pop(0)).status_code, 503)
+        # A 429 means the request was turned away, so it's safe to retry
+        responses = [response(429), response(200)]
+        self.assertEquals(governor.call('nova', lambda: responses.pop(0), method='POST').status_code,
+                          200)
+        responses = [response(503), response(200)]
+        self.assertEquals(governor.call('nova', lambda: responses.pop(0), method='delete').status_code,
+                          200)
+        self.assertEquals(governor.retries['nova'], 2)
+
+    @mock.patch('overcast.ratelimit.time')
+    def test_retries_give_up(self, time):
+        time.time.return_value = 100
+        governor = ratelimit.Governor(max_retries=2)
+        self.assertEquals(governor.call('nova', lambda: response(429)).status_code, 429)
+        self.assertEquals(len(time.sleep.mock_calls), 2)
+
+    def test_max_in_flight(self):
+        governor = ratelimit.Governor(max_in_flight=2)
+        lock = threading.Lock()
+        in_flight = [0]
+        max_in_flight = [0]
+        def request():
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.05)
+            with lock:
+                in_flight[0] -= 1
+            return response(200)
+
+        threads = [threading.Thread(target=governor.call, args=('nova', request))
+                   for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(max_in_flight[0], 2)
+
+    def test_slot_reentrant(self):
+        governor = ratelimit.Governor(max_in_flight=1)
+        with governor.slot('nova'):
+            # e.g. following a redirect
+            with governor.slot('nova'):
+                pass
+            self.assertFalse(governor.in_flight.acquire(False))
+        self.assertTrue(governor.in_flight.acquire(False))
+
+    def test_report_empty(self):
+        self.assertEquals(ratelimit.Governor().report(), '')
+
+    def test_session(self):
+        governor = mock.Mock(wraps=ratelimit.Governor())
+        session = Session(governor=governor, responses=[response(200)])
+
+        resp = session.request('/servers', 'GET', endpoint_filter={'service_type': 'compute'})
+
+        self.assertEquals(resp.status_code, 200)
+        governor.call.assert_called_once_with('nova', mock.ANY, hold_slot=False, method='GET')
+        self.assertEquals(session.calls, [('/servers', 'GET',
+                                           {'endpoint_filter': {'service_type': 'compute'},
+                                            'raise_exc': False})])
+
+    def test_session_authenticates_within_max_in_flight(self):
+        # Getting a token, or a new one after a 401, goes through the
+        # same session while the request that needs it is under way.
+        http = FakeHTTP([http_response(401, {}), http_response(200, {'servers': []})])
+        auth = v2.Password(auth_url='http://keystone:5000/v2.0', username='user',
+                           password='secret', tenant_name='tenant')
+        session = ratelimit.GovernedSession(auth=auth, session=http,
+                                            governor=ratelimit.Governor(max_in_flight=1))
+        result = []
+        thread = threading.Thread(target=lambda: result.append(
+            session.get('/servers', endpoint_filter={'service_type': 'compute'})))
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive(), 'request hung')
+        self.assertEquals(result[0].status_code, 200)
+        self.assertEquals(http.calls, [('POST', 'http://keystone:5000/v2.0/tokens'),
+                                       ('GET', 'http://nova:8774/v2/servers'),
+                                       ('POST', 'http://keystone:5000/v2.0/tokens'),
+                                       ('GET', 'http://nova:8774/v2/servers')])
+
+    def test_session_errors(self):
+        session = Session(responses=[response(404), response(404)])
+        self.assertRaises(keystone_exceptions.NotFound,
+                          session.request, '/ports/x', 'GET',
+                          endpoint_filter={'service_type': 'network'})
+        self.assertEquals(session.request('/ports/x', 'GET', raise_exc=False).status_code, 404)
@@ -0,0 +1,130 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import threading
+import time
+import unittest
+
+from overcast import exceptions
+from overcast import utils
+from overcast.scheduler import StepGraph
+
+def shell(cmd, **kwargs):
+    details = {'cmd': cmd}
+    details.update(kwargs)
+    return {'shell': details}
+
+class StepGraphTests(unittest.TestCase):
+    def test_uses_dependencies(self):
+        self.assertFalse(StepGraph.uses_dependencies([shell('a'), shell('b')]))
+        self.assertTrue(StepGraph.uses_dependencies([shell('a'), shell('b', after=[])]))
+
+    def test_implicit_dependencies(self):
+        graph = StepGraph([shell('a', id='first'),
+                           {'provision': {'stack': 'foo.yaml'}},
+                           shell('c', after=['first']),
+                           shell('d')])
+        self.assertEquals(graph.ids, ['first', 'provision-2', 'shell-3', 'shell-4'])
+        self.assertEquals(graph.deps, [set(), set([0]), set([0]), set([2])])
+
+    def test_after_string(self):
+        graph = StepGraph([shell('a', id='first'),
+                           shell('b', after='first')])
+        self.assertEquals(graph.deps, [set(), set([0])])
+
+    def test_unknown_dependency(self):
+        self.assertRaises(exceptions.InvalidStepGraphException,
+                          StepGraph, [shell('a', after=['nonexistent'])])
+
+    def test_duplicate_id(self):
+        self.assertRaises(exceptions.InvalidStepGraphException,
+                          StepGraph, [shell('a', id='x'), shell('b', id='x')])
+
+    def test_cycle(self):
+        self.assertRaises(exceptions.InvalidStepGraphException,
+                          StepGraph, [shell('a', id='a', after=['c']),
+                                      shell('b', id='b', after=['a']),
+                                      shell('c', id='c', after=['b'])])
+
+    def test_run_order(self):
+        graph = StepGraph([shell('a', id='a', after=[]),
+                           shell('b', id='b', after=['a']),
+                           shell('c', id='c', after=[]),
+                           shell('d', id='d', after=['b', 'c'])])
+        finished = []
+        lock = threading.Lock()
+        def func(step):
+            time.sleep(0.01)
+            with lock:
+                finished.append(step['shell']['cmd'])
+
+        graph.run(func)
+
+        self.assertEquals(sorted(finished), ['a', 'b', 'c', 'd'])
+        self.assertTrue(finished.index('a') < finished.index('b'))
+        self.assertEquals(finished[-1], 'd')
+
+    def test_run_overlaps_independent_steps(self):
+        graph = StepGraph([shell('a', after=[]),
+                           shell('b', after=[]),
+                           shell('c', after=[])])
+        start = time.time()
+        graph.run(lambda step: time.sleep(0.2))
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_run_concurrency(self):
+        graph = StepGraph([shell(str(idx), after=[]) for idx in range(4)])
+        running = []
+        max_running = []
+        def func(step):
+            running.append(step)
+            max_running.append(len(running))
+            time.sleep(0.05)
+            running.remove(step)
+
+        graph.run(func, concurrency=2)
+        self.assertEquals(max(max_running), 2)
+
+    def test_run_failure(self):
+        graph = StepGraph([shell('a', id='a', after=[]),
+                           shell('b', id='b', after=['a'])])
+        called = []
+        def func(step):
+            called.append(step['shell']['cmd'])
+            raise exceptions.CommandFailedException()
+
+        self.assertRaises(exceptions.CommandFailedException, graph.run, func)
+        self.assertEquals(called, ['a'])
+
+    def test_run_sets_step_context(self):
+        graph = StepGraph([shell('a', id='first'), shell('b')])
+        seen = {}
+        def func(step):
+            seen[step['shell']['cmd']] = utils.context.step
+        graph.run(func)
+        self.assertEquals(seen, {'a': 'first', 'b': 'shell-2'})
+
+    def test_critical_path(self):
+        graph = StepGraph([shell('a', id='a', after=[]),
+                           shell('b', id='b', after=['a']),
+                           shell('c', id='c', after=[]),
+                           shell('d', id='d', after=['b', 'c'])])
+        graph.timings = {0: (0, 2),
+                         1: (2, 3),
+                         2: (0, 5),
+                         3: (5, 6)}
+
+        self.assertEquals(graph.critical_path(), [('c', 5), ('d', 1)])
+        self.assertEquals(graph.format_critical_path(),
+                          'Critical path (6.0s): c (5.0s) -> d (1.0s)\n')
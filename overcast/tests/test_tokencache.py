@@ -0,0 +1,92 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import datetime
+import mock
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from keystoneclient import access
+from keystoneclient.auth.identity import v2
+
+from overcast.tokencache import CachedPassword, TokenCache
+
+CREDS = ('http://keystone:5000/v2.0', 'user', 'tenant')
+
+def make_auth_ref(token_id, expires_in):
+    expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=expires_in)
+    return access.AccessInfoV2(token={'id': token_id,
+                                      'expires': expires.strftime('%Y-%m-%dT%H:%M:%SZ')},
+                               serviceCatalog=[{'type': 'compute', 'endpoints': []}],
+                               user={'id': 'userid'})
+
+class TokenCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tmpdir, 'tokens')
+        self.cache = TokenCache(self.cachedir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_roundtrip(self):
+        self.cache.store(make_auth_ref('tok', 3600), *CREDS)
+
+        auth_ref = self.cache.load(*CREDS)
+        self.assertEquals(auth_ref.auth_token, 'tok')
+        self.assertEquals(auth_ref['serviceCatalog'], [{'type': 'compute', 'endpoints': []}])
+
+    def test_permissions(self):
+        self.cache.store(make_auth_ref('tok', 3600), *CREDS)
+
+        self.assertEquals(stat.S_IMODE(os.stat(self.cachedir).st_mode), 0700)
+        files = os.listdir(self.cachedir)
+        self.assertEquals(len(files), 1)
+        self.assertEquals(stat.S_IMODE(os.stat(os.path.join(self.cachedir, files[0])).st_mode),
+                          0600)
+
+    def test_keyed_by_credentials(self):
+        self.cache.store(make_auth_ref('tok', 3600), *CREDS)
+        self.assertIsNone(self.cache.load(CREDS[0], 'otheruser', CREDS[2]))
+        self.assertIsNone(self.cache.load(CREDS[0], CREDS[1], 'othertenant'))
+
+    def test_expiring(self):
+        self.cache.store(make_auth_ref('tok', 60), *CREDS)
+        self.assertIsNone(self.cache.load(*CREDS))
+
+    def test_missing_or_corrupt(self):
+        self.assertIsNone(self.cache.load(*CREDS))
+        self.cache.store(make_auth_ref('tok', 3600), *CREDS)
+        with open(self.cache._path(*CREDS), 'w') as fp:
+            fp.write('{"tok')
+        self.assertIsNone(self.cache.load(*CREDS))
+
+    def test_cached_password_uses_cache(self):
+        self.cache.store(make_auth_ref('cached', 3600), *CREDS)
+
+        plugin = CachedPassword(self.cache, auth_url=CREDS[0], username=CREDS[1],
+                                password='secret', tenant_name=CREDS[2])
+        self.assertEquals(plugin.get_access(mock.Mock()).auth_token, 'cached')
+
+    @mock.patch.object(v2.Password, 'get_auth_ref')
+    def test_cached_password_stores_new_tokens(self, get_auth_ref):
+        get_auth_ref.return_value = make_auth_ref('fresh', 3600)
+
+        plugin = CachedPassword(self.cache, auth_url=CREDS[0], username=CREDS[1],
+                                password='secret', tenant_name=CREDS[2])
+        self.assertEquals(plugin.get_access(mock.Mock()).auth_token, 'fresh')
+        self.assertEquals(self.cache.load(*CREDS).auth_token, 'fresh')
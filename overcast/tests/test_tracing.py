@@ -0,0 +1,109 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import mock
+import unittest
+
+from overcast import tracing
+
+class FakeServers(object):
+    def create(self, name):
+        return {'name': name}
+
+    def delete(self, id):
+        raise ValueError(id)
+
+class FakeNeutron(object):
+    def list_ports(self, retrieve_all=True):
+        for page in range(3):
+            yield {'ports': [page]}
+
+class FakeNova(object):
+    version = '2'
+
+    def __init__(self):
+        self.servers = FakeServers()
+
+class TracingTests(unittest.TestCase):
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEquals(tracing.percentile(values, 50), 50)
+        self.assertEquals(tracing.percentile(values, 95), 95)
+        self.assertEquals(tracing.percentile([3], 95), 3)
+
+    @mock.patch('overcast.tracing.time')
+    def test_span(self, time):
+        time.time.side_effect = [10, 12.5, 20, 21]
+        tracer = tracing.Tracer()
+        with tracer.span('step', 'provision'):
+            pass
+
+        def fail():
+            with tracer.span('step', 'shell'):
+                raise KeyError()
+        self.assertRaises(KeyError, fail)
+
+        self.assertEquals(tracer.records, [('step', 'provision', 2.5, 'ok'),
+                                           ('step', 'shell', 1, 'KeyError')])
+
+    def test_wrap(self):
+        tracer = tracing.Tracer()
+        nova = tracer.wrap(FakeNova(), 'nova')
+
+        self.assertEquals(nova.version, '2')
+        self.assertEquals(nova.servers.create('foo'), {'name': 'foo'})
+        self.assertRaises(ValueError, nova.servers.delete, 'abc')
+
+        self.assertEquals([(kind, name, outcome) for kind, name, _, outcome in tracer.records],
+                          [('api', 'nova servers.create', 'ok'),
+                           ('api', 'nova servers.delete', 'ValueError')])
+
+    @mock.patch('overcast.tracing.time')
+    def test_wrap_paginated(self, time):
+        # One fetch per page, and none until the first page is asked for
+        time.time.side_effect = [0, 10, 10.05, 11, 11.05, 12, 12.05, 13]
+        tracer = tracing.Tracer()
+        neutron = tracer.wrap(FakeNeutron(), 'neutron')
+
+        pages = neutron.list_ports(retrieve_all=False)
+        self.assertEquals(tracer.records, [])
+        self.assertEquals(list(pages), [{'ports': [0]}, {'ports': [1]}, {'ports': [2]}])
+
+        self.assertEquals([(kind, name, outcome) for kind, name, _, outcome in tracer.records],
+                          [('api', 'neutron list_ports', 'ok')] * 3)
+        for _, _, duration, _ in tracer.records:
+            self.assertAlmostEquals(duration, 0.05)
+
+    def test_report(self):
+        tracer = tracing.Tracer()
+        tracer.record('step', 'provision', 61.25)
+        tracer.record('api', 'nova servers.create', 0.5)
+        tracer.record('api', 'nova servers.create', 1.5, 'Conflict')
+        tracer.record('api', 'neutron create_port', 0.25)
+        tracer.record('sleep', 'poll', 4)
+        tracer.record('sleep', 'poll', 8)
+
+        self.assertEquals(tracer.report(),
+                          'Steps:\n'
+                          '  provision                           61.2s\n'
+                          '\n'
+                          'API calls:\n'
+                          '  operation                                 calls errors      p50      p95     total\n'
+                          '  neutron create_port                           1      0   0.250s   0.250s      0.2s\n'
+                          '  nova servers.create                           2      1   0.500s   1.500s      2.0s\n'
+                          '\n'
+                          'Sleeping in poll loops: 12.0s\n')
+
+    def test_report_empty(self):
+        self.assertEquals(tracing.Tracer().report(), 'Sleeping in poll loops: 0.0s\n')
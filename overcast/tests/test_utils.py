@@ -12,8 +12,11 @@
 #   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
+import mock
 import unittest
 
+from novaclient.exceptions import BadRequest as NovaBadRequest
+
 from overcast import utils
 from overcast import exceptions
 
@@ -29,3 +32,127 @@ class UtilsTests(unittest.TestCase):
         self.assertRaises(exceptions.InvalidTimeException, utils.parse_time, '2x')
         self.assertRaises(exceptions.InvalidTimeException, utils.parse_time, '-10')
         self.assertRaises(exceptions.InvalidTimeException, utils.parse_time, '-10m')
+
+    def test_run_in_parallel(self):
+        self.assertEquals(utils.run_in_parallel(lambda x: x*2, range(10), 4),
+                          [x*2 for x in range(10)])
+        self.assertEquals(utils.run_in_parallel(lambda x: x*2, [], 4), [])
+
+    def test_run_in_parallel_serial(self):
+        self.assertEquals(utils.run_in_parallel(lambda x: x+1, [1, 2, 3], 1),
+                          [2, 3, 4])
+
+    def test_run_in_parallel_failure(self):
+        called = []
+        def func(x):
+            called.append(x)
+            if x == 2:
+                raise exceptions.OvercastException()
+            return x
+
+        self.assertRaises(exceptions.OvercastException,
+                          utils.run_in_parallel, func, [1, 2, 3, 4], 1)
+        self.assertEquals(called, [1, 2])
+
+        called[:] = []
+        self.assertRaises(exceptions.OvercastException,
+                          utils.run_in_parallel, func, [1, 2, 3, 4], 1,
+                          fail_fast=False)
+        self.assertEquals(called, [1, 2, 3, 4])
+
+    def test_chunks(self):
+        self.assertEquals(list(utils.chunks(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEquals(list(utils.chunks([], 2)), [])
+
+    def test_paginate_neutron(self):
+        def list_ports(retrieve_all, limit, **filters):
+            self.assertFalse(retrieve_all)
+            self.assertEquals(limit, 2)
+            self.assertEquals(filters, {'device_id': 'x'})
+            yield {'ports': [1, 2]}
+            yield {'ports': [3]}
+        self.assertEquals(list(utils.paginate_neutron(list_ports, 'ports', 2, device_id='x')),
+                          [1, 2, 3])
+
+    def test_paginate_neutron_single_response(self):
+        list_ports = mock.Mock(return_value={'ports': [1, 2, 3]})
+        self.assertEquals(list(utils.paginate_neutron(list_ports, 'ports')), [1, 2, 3])
+
+    def test_paginate_nova(self):
+        servers = [mock.Mock(id=idx) for idx in range(5)]
+        def list_servers(limit, marker, **kwargs):
+            start = 0 if marker is None else marker + 1
+            return servers[start:start+limit]
+        list_servers = mock.Mock(side_effect=list_servers)
+
+        self.assertEquals(list(utils.paginate_nova(list_servers, 2, detailed=True)), servers)
+        self.assertEquals(list_servers.mock_calls,
+                          [mock.call(limit=2, marker=None, detailed=True),
+                           mock.call(limit=2, marker=1, detailed=True),
+                           mock.call(limit=2, marker=3, detailed=True),
+                           mock.call(limit=2, marker=4, detailed=True)])
+
+    def test_paginate_nova_capped_pages(self):
+        # Nova returns at most 3 servers per page, however many we ask for
+        servers = [mock.Mock(id=idx) for idx in range(8)]
+        def list_servers(limit, marker):
+            start = 0 if marker is None else marker + 1
+            return servers[start:start+min(limit, 3)]
+        list_servers = mock.Mock(side_effect=list_servers)
+
+        self.assertEquals(list(utils.paginate_nova(list_servers, 5)), servers)
+        self.assertEquals([call[2]['marker'] for call in list_servers.mock_calls],
+                          [None, 2, 5, 7])
+
+    def test_paginate_nova_marker_deleted(self):
+        servers = [mock.Mock(id=idx) for idx in range(7)]
+        def list_servers(limit, marker):
+            ids = [server.id for server in servers]
+            if marker is not None and marker not in ids:
+                raise NovaBadRequest(400, 'marker [%s] not found' % (marker,))
+            start = 0 if marker is None else ids.index(marker) + 1
+            page = servers[start:start+limit]
+            if marker is None:
+                # The last server on the first page goes away before
+                # we ask for the next one
+                servers.remove(page[-1])
+            return page
+        list_servers = mock.Mock(side_effect=list_servers)
+
+        self.assertEquals([server.id for server in utils.paginate_nova(list_servers, 3)],
+                          range(7))
+        self.assertEquals([call[2]['marker'] for call in list_servers.mock_calls],
+                          [None, 2, 1, 5, 6])
+
+    def test_paginate_nova_marker_page_deleted(self):
+        servers = [mock.Mock(id=idx) for idx in range(4)]
+        def list_servers(limit, marker):
+            ids = [server.id for server in servers]
+            if marker is not None and marker not in ids:
+                raise NovaBadRequest(400, 'marker [%s] not found' % (marker,))
+            start = 0 if marker is None else ids.index(marker) + 1
+            page = servers[start:start+limit]
+            if marker is None and page[0].id == 0:
+                # The whole first page goes away before we ask for the
+                # next one
+                del servers[:2]
+            return page
+        list_servers = mock.Mock(side_effect=list_servers)
+
+        # We start over rather than stop short
+        self.assertEquals([server.id for server in utils.paginate_nova(list_servers, 2)],
+                          range(4))
+        self.assertEquals([call[2]['marker'] for call in list_servers.mock_calls],
+                          [None, 1, 0, None, 3])
+
+    def test_paginate_nova_bad_request(self):
+        list_servers = mock.Mock(side_effect=NovaBadRequest(400))
+        self.assertRaises(NovaBadRequest, list, utils.paginate_nova(list_servers))
+
+    def test_run_in_parallel_context(self):
+        utils.context.step = 'step1'
+        try:
+            self.assertEquals(utils.run_in_parallel(lambda x: utils.context.step, [1, 2], 2),
+                              ['step1', 'step1'])
+        finally:
+            del utils.context.step
@@ -0,0 +1,103 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import hashlib
+import json
+import os
+import stat
+import tempfile
+
+from keystoneclient import access
+from keystoneclient.auth.identity import v2
+
+# Don't bother with cached tokens that expire sooner than this (seconds)
+MIN_TOKEN_LIFE = 300
+
+def default_cache_dir():
+    if os.environ.get('OVERCAST_TOKEN_CACHE'):
+        return os.environ['OVERCAST_TOKEN_CACHE']
+    return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                        'overcast', 'tokens')
+
+class TokenCache(object):
+    """
+    Keeps Keystone tokens, along with their service catalogs, on disk so
+    that separate overcast invocations can share them instead of each
+    authenticating from scratch. Tokens are keyed by auth URL, user and
+    tenant. The cache directory is only accessible by its owner, since
+    the tokens in it are as good as passwords until they expire.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory or default_cache_dir()
+
+    def _path(self, auth_url, username, tenant_name):
+        key = hashlib.sha256('\0'.join([auth_url, username, tenant_name])).hexdigest()
+        return os.path.join(self.directory, '%s.json' % (key,))
+
+    def _ensure_directory(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0700)
+        if stat.S_IMODE(os.stat(self.directory).st_mode) != 0700:
+            os.chmod(self.directory, 0700)
+
+    def load(self, auth_url, username, tenant_name):
+        """
+        Return the cached AccessInfo for the given credentials, or None
+        if there isn't one that's valid for a while yet.
+        """
+        try:
+            with open(self._path(auth_url, username, tenant_name), 'r') as fp:
+                auth_ref = access.AccessInfoV2(**json.load(fp))
+            if auth_ref.will_expire_soon(MIN_TOKEN_LIFE):
+                return None
+            return auth_ref
+        except Exception:
+            # Missing, unreadable or not a token. Either way, we'll have
+            # to authenticate.
+            return None
+
+    def store(self, auth_ref, auth_url, username, tenant_name):
+        self._ensure_directory()
+        # mkstemp creates the file with mode 0600
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(dict(auth_ref), fp)
+            os.rename(tmp_path, self._path(auth_url, username, tenant_name))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+class CachedPassword(v2.Password):
+    """
+    A Keystone v2 password auth plugin that starts out with a token from
+    `cache`, if there's a valid one, and stores every token it fetches
+    there. If a cached token turns out to have been revoked, the session
+    invalidates it and we fetch (and cache) a new one.
+    """
+    def __init__(self, cache, auth_url, username, password, tenant_name):
+        super(CachedPassword, self).__init__(auth_url=auth_url, username=username,
+                                             password=password, tenant_name=tenant_name)
+        self.cache = cache
+        self.cache_key = (auth_url, username, tenant_name)
+        self.auth_ref = cache.load(*self.cache_key)
+
+    def get_auth_ref(self, session, **kwargs):
+        auth_ref = super(CachedPassword, self).get_auth_ref(session, **kwargs)
+        try:
+            self.cache.store(auth_ref, *self.cache_key)
+        except EnvironmentError:
+            # Not being able to cache a token is no reason to fail
+            pass
+        return auth_ref
@@ -0,0 +1,158 @@
+#
+#   Copyright 2015 Reliance Jio Infocomm, Ltd.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import collections
+import contextlib
+import math
+import threading
+import time
+import types
+
+# Attributes of these types are returned as they are, not wrapped
+PLAIN_TYPES = (basestring, int, long, float, bool, type(None), list, tuple, dict, set)
+
+def percentile(values, pct):
+    """
+    The pct-th percentile of values (nearest rank).
+    """
+    values = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+class Tracer(object):
+    """
+    Records what a deployment spends its time on: API calls (service,
+    operation, latency, outcome), steps and sleeps in poll loops.
+
+    Tracing is off unless the runner is given a Tracer. Without one,
+    its clients aren't wrapped at all, so it costs nothing.
+    """
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+    def record(self, kind, name, duration, outcome='ok'):
+        with self.lock:
+            self.records.append((kind, name, duration, outcome))
+
+    @contextlib.contextmanager
+    def span(self, kind, name):
+        start = time.time()
+        outcome = 'ok'
+        try:
+            yield
+        except Exception, e:
+            outcome = e.__class__.__name__
+            raise
+        finally:
+            self.record(kind, name, time.time() - start, outcome)
+
+    def trace_pages(self, pages, name):
+        """
+        Record each page of a list that's fetched lazily, one request
+        per page, as it's iterated over (like neutronclient's list_*
+        calls with retrieve_all=False).
+        """
+        while True:
+            start = time.time()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            except Exception, e:
+                self.record('api', name, time.time() - start, e.__class__.__name__)
+                raise
+            self.record('api', name, time.time() - start)
+            yield page
+
+    def wrap(self, client, service):
+        """
+        Wrap an API client so every call made through it is recorded.
+        """
+        return TracedObject(client, self, service)
+
+    def report(self):
+        with self.lock:
+            records = list(self.records)
+
+        lines = []
+        steps = [(name, duration, outcome) for kind, name, duration, outcome in records
+                 if kind == 'step']
+        if steps:
+            lines.append('Steps:')
+            for name, duration, outcome in steps:
+                lines.append('  %-30s %9.1fs%s' % (name, duration,
+                                                   '' if outcome == 'ok' else '  (%s)' % (outcome,)))
+            lines.append('')
+
+        calls = collections.OrderedDict()
+        errors = collections.defaultdict(int)
+        for kind, name, duration, outcome in records:
+            if kind == 'api':
+                calls.setdefault(name, []).append(duration)
+                if outcome != 'ok':
+                    errors[name] += 1
+        if calls:
+            lines.append('API calls:')
+            lines.append('  %-40s %6s %6s %8s %8s %9s' % ('operation', 'calls', 'errors',
+                                                         'p50', 'p95', 'total'))
+            for name in sorted(calls):
+                durations = calls[name]
+                lines.append('  %-40s %6d %6d %7.3fs %7.3fs %8.1fs' %
+                             (name, len(durations), errors[name],
+                              percentile(durations, 50), percentile(durations, 95),
+                              sum(durations)))
+            lines.append('')
+
+        slept = sum(duration for kind, name, duration, outcome in records if kind == 'sleep')
+        lines.append('Sleeping in poll loops: %.1fs' % (slept,))
+        return '\n'.join(lines) + '\n'
+
+class TracedObject(object):
+    """
+    Stands in for an API client (or one of its managers, like
+    nova.servers) and records every method call made through it, as
+    e.g. "nova servers.create". Calls that return a generator of pages
+    are recorded once per page.
+    """
+    def __init__(self, target, tracer, service, prefix=''):
+        self._target = target
+        self._tracer = tracer
+        self._service = service
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if isinstance(value, PLAIN_TYPES) or name.startswith('_'):
+            return value
+
+        operation = '%s%s' % (self._prefix, name)
+        if callable(value):
+            tracer = self._tracer
+            label = '%s %s' % (self._service, operation)
+            def traced(*args, **kwargs):
+                start = time.time()
+                try:
+                    result = value(*args, **kwargs)
+                except Exception, e:
+                    tracer.record('api', label, time.time() - start, e.__class__.__name__)
+                    raise
+                if isinstance(result, types.GeneratorType):
+                    # Nothing has been fetched yet
+                    return tracer.trace_pages(result, label)
+                tracer.record('api', label, time.time() - start)
+                return result
+            return traced
+
+        return TracedObject(value, self._tracer, self._service, operation + '.')
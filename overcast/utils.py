@@ -12,7 +12,12 @@
 #   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
+import Queue
 import re
+import sys
+import threading
+
+from novaclient.exceptions import BadRequest as NovaBadRequest
 
 from overcast import exceptions
 
@@ -33,3 +38,119 @@ def parse_time(time_string):
         raise exceptions.InvalidTimeException()
     return count * multiplier
 
+
+# Number of resources to fetch per list request
+PAGE_SIZE = 500
+
+def paginate_neutron(list_func, collection, page_size=PAGE_SIZE, **filters):
+    """
+    Iterate over the results of a neutronclient list_* call (e.g.
+    list_ports), fetching them one page at a time. Memory use stays
+    bounded and processing can start as soon as the first page is in.
+    """
+    pages = list_func(retrieve_all=False, limit=page_size, **filters)
+    if isinstance(pages, dict):
+        # Everything came back in one response
+        pages = [pages]
+    for page in pages:
+        for item in page[collection]:
+            yield item
+
+def paginate_nova(list_func, page_size=PAGE_SIZE, **kwargs):
+    """
+    Like paginate_neutron, but for novaclient list calls (e.g.
+    servers.list), which take a limit and a marker.
+
+    Nova may return fewer than page_size items per page (it caps them
+    at osapi_max_limit), so a short page doesn't mean we're done. We
+    keep going until a page comes back empty.
+
+    The marker is the last item of the previous page. If it has been
+    deleted (and purged) since, Nova rejects it, so we fall back to the
+    item before it. If none of the previous page is left, we start
+    over from the beginning. Either way, items we've already returned
+    are skipped.
+    """
+    marker = None
+    fallbacks = []
+    returned = set()
+    while True:
+        try:
+            page = list_func(limit=page_size, marker=marker, **kwargs)
+        except NovaBadRequest:
+            if marker is None:
+                raise
+            marker = fallbacks.pop() if fallbacks else None
+            continue
+        if not page:
+            return
+        for item in page:
+            if item.id not in returned:
+                returned.add(item.id)
+                yield item
+        fallbacks = [item.id for item in page[:-1]]
+        marker = page[-1].id
+
+def chunks(items, size):
+    """
+    Split items into lists of at most size elements.
+    """
+    items = list(items)
+    for idx in range(0, len(items), size):
+        yield items[idx:idx+size]
+
+# Per-thread state, e.g. the step being run. Threads started by
+# run_in_parallel() inherit it from the thread that started them.
+context = threading.local()
+
+def run_in_parallel(func, items, concurrency=None, fail_fast=True):
+    """
+    Call func(item) for every item, using up to `concurrency` worker
+    threads, and return the results in the same order as `items`.
+
+    If any of the calls raise, the first exception is re-raised once
+    all workers are done. With fail_fast, items that haven't been
+    started yet are skipped after the first failure.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if not items:
+        return results
+
+    if not concurrency or concurrency > len(items):
+        concurrency = len(items)
+
+    work = Queue.Queue()
+    for idx, item in enumerate(items):
+        work.put((idx, item))
+
+    errors = []
+    parent_context = dict(context.__dict__)
+    def worker():
+        context.__dict__.update(parent_context)
+        while not (fail_fast and errors):
+            try:
+                idx, item = work.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[idx] = func(item)
+            except Exception:
+                errors.append(sys.exc_info())
+
+    if concurrency == 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # join() without a timeout can't be interrupted by Ctrl-C
+            while thread.is_alive():
+                thread.join(1)
+
+    if errors:
+        exc_type, exc_value, exc_tb = errors[0]
+        raise exc_type, exc_value, exc_tb
+    return results